@@ -0,0 +1,347 @@
+"""
+压缩包模块
+将 zip/tar 压缩包作为虚拟文件夹参与比较，无需解压到磁盘
+"""
+
+import os
+import time
+import stat
+import hashlib
+import logging
+import tarfile
+import zipfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Set, Tuple
+
+# 支持的压缩包扩展名（按从长到短的顺序匹配）
+ARCHIVE_EXTENSIONS = ('.tar.gz', '.tar.xz', '.tgz', '.txz', '.tar', '.zip')
+
+# 压缩包路径与包内子目录的分隔符，例如: release.zip!pkg-1.0
+ARCHIVE_INNER_SEP = '!'
+
+# 读取成员数据时的块大小
+CHUNK_SIZE = 1024 * 1024
+
+
+class ArchiveMember(NamedTuple):
+    """压缩包内的一个成员（仅来自中央目录或文件头，不含数据）"""
+    name: str             # 相对于压缩包根（或包内子目录）的路径，使用 / 分隔
+    size: int             # 解压后的大小
+    crc: Optional[int]    # CRC32（仅 zip 提供，tar 为 None）
+    is_dir: bool
+    mtime_ns: int = 0     # 修改时间（zip 精度为 2 秒）
+    mode: int = 0         # 权限位（zip 仅在由 Unix 系统创建时提供）
+
+
+# 最多缓存的成员列表数（整个压缩包和包内子目录各算一个），超出后淘汰最久未使用的
+MAX_CACHED_LISTINGS = 16
+
+# 成员列表缓存（LRU）: (压缩包路径, mtime_ns, 文件大小, 包内子目录) -> 成员字典
+_listing_cache: "OrderedDict[Tuple[str, int, int, str], Dict[str, ArchiveMember]]" = OrderedDict()
+_listing_lock = threading.Lock()
+
+
+def _cache_get(key: Tuple[str, int, int, str]) -> Optional[Dict[str, ArchiveMember]]:
+    """读取成员列表缓存并标记为最近使用"""
+    with _listing_lock:
+        members = _listing_cache.get(key)
+        if members is not None:
+            _listing_cache.move_to_end(key)
+        return members
+
+
+def _cache_put(key: Tuple[str, int, int, str], members: Dict[str, ArchiveMember]) -> None:
+    """保存成员列表，同时删除同一压缩包旧版本的条目和超出数量上限的条目"""
+    with _listing_lock:
+        for old_key in [k for k in _listing_cache if k[0] == key[0] and k[1:3] != key[1:3]]:
+            del _listing_cache[old_key]
+        _listing_cache[key] = members
+        _listing_cache.move_to_end(key)
+        while len(_listing_cache) > MAX_CACHED_LISTINGS:
+            _listing_cache.popitem(last=False)
+
+
+def has_archive_extension(path: str) -> bool:
+    """判断路径是否以支持的压缩包扩展名结尾"""
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def split_archive_path(path: str) -> Tuple[str, str]:
+    """
+    拆分压缩包路径与包内子目录
+
+    整个路径就是一个文件时不拆分（文件名或目录名本身可能包含 "!"）；
+    否则从最后一个分隔符开始向前尝试，只在前半部分是实际存在的压缩包文件时拆分。
+
+    Args:
+        path (str): 形如 "release.zip" 或 "release.zip!pkg-1.0" 的路径
+
+    Returns:
+        Tuple[str, str]: (压缩包文件路径, 包内子目录)，不是压缩包时返回 ("", "")
+    """
+    if os.path.isfile(path):
+        return (path, "") if has_archive_extension(path) else ("", "")
+
+    archive_path = path
+    while True:
+        archive_path, sep, _ = archive_path.rpartition(ARCHIVE_INNER_SEP)
+        if not sep:
+            return "", ""
+        if has_archive_extension(archive_path) and os.path.isfile(archive_path):
+            break
+    inner = path[len(archive_path) + 1:].replace('\\', '/').strip('/')
+    if inner in ('', '.'):
+        inner = ""
+    return archive_path, inner
+
+
+def is_archive_path(path: str) -> bool:
+    """判断路径是否指向一个可作为虚拟文件夹使用的压缩包"""
+    return bool(split_archive_path(path)[0])
+
+
+def _normalize_member_name(name: str) -> str:
+    """统一成员名称: 使用 / 分隔，去掉开头的 ./ 和 /"""
+    name = name.replace('\\', '/')
+    while name.startswith('./'):
+        name = name[2:]
+    if name == '.':
+        return ''
+    return name.lstrip('/')
+
+
+def _read_zip_members(archive_path: str) -> Dict[str, ArchiveMember]:
+    """从 zip 的中央目录读取成员列表（不解压任何数据）"""
+    members: Dict[str, ArchiveMember] = {}
+    with zipfile.ZipFile(archive_path) as zf:
+        for info in zf.infolist():
+            name = _normalize_member_name(info.filename).rstrip('/')
+            if not name:
+                continue
+            try:
+                mtime_ns = int(time.mktime(info.date_time + (0, 0, -1))) * 1000000000
+            except (OverflowError, ValueError):
+                mtime_ns = 0
+            mode = stat.S_IMODE(info.external_attr >> 16)
+            members[name] = ArchiveMember(name, info.file_size, info.CRC, info.is_dir(), mtime_ns, mode)
+    return members
+
+
+def _read_tar_members(archive_path: str) -> Dict[str, ArchiveMember]:
+    """
+    从 tar 文件头读取成员列表
+
+    未压缩的 .tar 只读取头部并跳过数据块；.tar.gz/.tar.xz 没有独立的目录，
+    必须顺序解压数据流才能定位各个头部，但数据内容不会被保留或写入磁盘。
+    """
+    members: Dict[str, ArchiveMember] = {}
+    with tarfile.open(archive_path, mode='r:*') as tf:
+        for info in tf:
+            name = _normalize_member_name(info.name).rstrip('/')
+            if not name:
+                continue
+            members[name] = ArchiveMember(name, info.size, None, info.isdir(),
+                                          int(info.mtime) * 1000000000, stat.S_IMODE(info.mode))
+    return members
+
+
+def _cache_key(archive_path: str, inner: str = "") -> Tuple[str, int, int, str]:
+    """生成缓存键，压缩包被修改后自动失效"""
+    st = os.stat(archive_path)
+    return os.path.abspath(archive_path), st.st_mtime_ns, st.st_size, inner
+
+
+def read_archive_members(archive_path: str) -> Dict[str, ArchiveMember]:
+    """
+    读取压缩包的全部成员，并补全没有显式目录条目的父目录
+
+    Args:
+        archive_path (str): 压缩包文件路径
+
+    Returns:
+        Dict[str, ArchiveMember]: 成员路径到成员信息的映射
+    """
+    cache_key = _cache_key(archive_path)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    if archive_path.lower().endswith('.zip'):
+        members = _read_zip_members(archive_path)
+    else:
+        members = _read_tar_members(archive_path)
+
+    # 部分压缩包不包含目录条目，根据文件路径补全
+    for name in list(members):
+        parent = name.rpartition('/')[0]
+        while parent and parent not in members:
+            members[parent] = ArchiveMember(parent, 0, None, True)
+            parent = parent.rpartition('/')[0]
+
+    _cache_put(cache_key, members)
+    return members
+
+
+def list_archive_entries(path: str) -> Dict[str, ArchiveMember]:
+    """
+    列出压缩包（或包内子目录）下的全部成员，路径相对于该子目录
+
+    Args:
+        path (str): 压缩包路径，可带 "!子目录" 后缀
+
+    Returns:
+        Dict[str, ArchiveMember]: 相对路径到成员信息的映射
+    """
+    archive_path, inner = split_archive_path(path)
+    if not archive_path:
+        raise FileNotFoundError(f"不是有效的压缩包: {path}")
+
+    members = read_archive_members(archive_path)
+    if not inner:
+        return members
+
+    cache_key = _cache_key(archive_path, inner)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    inner_member = members.get(inner)
+    if inner_member is None or not inner_member.is_dir:
+        raise NotADirectoryError(f"压缩包内不存在该目录: {path}")
+
+    prefix = inner + '/'
+    entries: Dict[str, ArchiveMember] = {}
+    for name, member in members.items():
+        if name.startswith(prefix):
+            rel = name[len(prefix):]
+            entries[rel] = member._replace(name=rel)
+
+    _cache_put(cache_key, entries)
+    return entries
+
+
+def list_archive_names(path: str) -> Set[str]:
+    """
+    列出压缩包（或包内子目录）顶层的名称，相当于对文件夹执行 os.listdir
+
+    Args:
+        path (str): 压缩包路径，可带 "!子目录" 后缀
+
+    Returns:
+        Set[str]: 顶层文件和目录名称集合
+    """
+    return {name.partition('/')[0] for name in list_archive_entries(path)}
+
+
+def get_archive_member(path: str, name: str) -> Optional[ArchiveMember]:
+    """获取压缩包内指定相对路径的成员信息，不存在时返回 None"""
+    return list_archive_entries(path).get(name)
+
+
+def iter_member_chunks(path: str, name: str) -> Iterator[bytes]:
+    """
+    按块读取压缩包成员的数据（仅在需要逐字节比较时调用，会解压数据）
+
+    Args:
+        path (str): 压缩包路径，可带 "!子目录" 后缀
+        name (str): 相对于包内子目录的成员路径
+
+    Yields:
+        bytes: 解压后的数据块
+    """
+    archive_path, inner = split_archive_path(path)
+    full_name = f"{inner}/{name}" if inner else name
+
+    if archive_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as zf:
+            # 成员名可能带有 ./ 前缀，按规范化后的名称查找
+            for info in zf.infolist():
+                if _normalize_member_name(info.filename).rstrip('/') == full_name:
+                    with zf.open(info) as fp:
+                        while True:
+                            chunk = fp.read(CHUNK_SIZE)
+                            if not chunk:
+                                return
+                            yield chunk
+        return
+
+    with tarfile.open(archive_path, mode='r:*') as tf:
+        for info in tf:
+            if _normalize_member_name(info.name).rstrip('/') == full_name:
+                fp = tf.extractfile(info)
+                if fp is None:
+                    return
+                with fp:
+                    while True:
+                        chunk = fp.read(CHUNK_SIZE)
+                        if not chunk:
+                            return
+                        yield chunk
+    logging.warning(f"压缩包中未找到成员: {path} -> {name}")
+
+
+def hash_member(path: str, name: str) -> str:
+    """计算压缩包成员数据的 SHA-256（会解压数据）"""
+    digest = hashlib.sha256()
+    for chunk in iter_member_chunks(path, name):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_stream(fp) -> str:
+    digest = hashlib.sha256()
+    while True:
+        chunk = fp.read(CHUNK_SIZE)
+        if not chunk:
+            return digest.hexdigest()
+        digest.update(chunk)
+
+
+def iter_member_hashes(path: str, names: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    计算多个成员数据的 SHA-256，按成员在压缩包中的顺序逐个产生
+
+    tar（尤其是 .tar.gz/.tar.xz）不能随机访问，逐个调用 hash_member 每次都要从头解压，
+    这里只顺序读取一遍；zip 只打开一次，按中央目录直接定位。
+    调用方可以随时停止迭代，剩余的成员不会被读取。
+
+    Args:
+        path (str): 压缩包路径，可带 "!子目录" 后缀
+        names: 相对于包内子目录的成员路径
+
+    Yields:
+        Tuple[str, str]: (成员路径, SHA-256)
+    """
+    archive_path, inner = split_archive_path(path)
+    prefix = inner + '/' if inner else ''
+    wanted = {prefix + name: name for name in names}
+    if not wanted:
+        return
+
+    if archive_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                name = wanted.pop(_normalize_member_name(info.filename).rstrip('/'), None)
+                if name is None:
+                    continue
+                with zf.open(info) as fp:
+                    yield name, _hash_stream(fp)
+                if not wanted:
+                    return
+    else:
+        with tarfile.open(archive_path, mode='r:*') as tf:
+            for info in tf:
+                name = wanted.get(_normalize_member_name(info.name).rstrip('/'))
+                if name is None:
+                    continue
+                fp = tf.extractfile(info)
+                if fp is None:
+                    continue
+                del wanted[prefix + name]
+                with fp:
+                    yield name, _hash_stream(fp)
+                if not wanted:
+                    return
+    for name in wanted.values():
+        logging.warning(f"压缩包中未找到成员: {path} -> {name}")
@@ -0,0 +1,303 @@
+"""
+批量比较模块
+从任务文件读取多组文件夹，在进程池中并发比较，并输出汇总报告
+
+任务文件为 JSON 格式，例如:
+{
+    "defaults": {"recursive": true, "metadata": false, "mtime_tolerance": 2, "link_policy": "leaf"},
+    "jobs": [
+        {"name": "站点A", "folders": ["D:/reference", "E:/deploy/site-a"]},
+        {"name": "站点B", "folders": ["D:/reference", "E:/deploy/site-b"], "metadata": true}
+    ]
+}
+link_policy 为递归扫描时符号链接的处理方式: leaf（不进入）、follow（跟随，每个目录只扫描一次）或 skip（忽略）
+
+用法: python batch.py jobs.json --workers 8 --output summary.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Tuple, Any, Optional
+
+from scanner import LINK_LEAF, LINK_POLICIES
+from core import (sanitize_path, is_comparable_path, list_folder_names, collect_folder_metadata,
+                  build_presence_matrix, find_metadata_differences, describe_pattern)
+
+# 任务选项及其默认值
+DEFAULT_OPTIONS = {
+    'recursive': False,
+    'metadata': False,
+    'mtime_tolerance': 2.0,
+    'link_policy': LINK_LEAF,
+}
+
+# 扫描键: (规范化的文件夹路径, 是否递归, 是否收集元数据, 符号链接处理方式)
+ScanKey = Tuple[str, bool, bool, str]
+
+
+class BatchJob:
+    """一个比较任务"""
+
+    def __init__(self, name: str, folders: List[str], options: Dict[str, Any]):
+        self.name = name
+        self.folders = folders
+        self.recursive = bool(options['recursive'])
+        self.metadata = bool(options['metadata'])
+        self.mtime_tolerance = float(options['mtime_tolerance'])
+        self.link_policy = options['link_policy'] if options['link_policy'] in LINK_POLICIES else LINK_LEAF
+
+    def scan_keys(self) -> List[ScanKey]:
+        # 同一文件夹的不同写法（相对路径、大小写）共用一次扫描
+        return [(os.path.normcase(os.path.abspath(folder)), self.recursive, self.metadata, self.link_policy)
+                for folder in self.folders]
+
+
+def load_jobs(job_file: str) -> List[BatchJob]:
+    """
+    读取任务文件
+
+    Args:
+        job_file (str): JSON 任务文件路径
+
+    Returns:
+        List[BatchJob]: 任务列表
+    """
+    with open(job_file, 'r', encoding='utf-8') as fp:
+        data = json.load(fp)
+
+    defaults = dict(DEFAULT_OPTIONS)
+    defaults.update({key: value for key, value in data.get('defaults', {}).items() if key in DEFAULT_OPTIONS})
+
+    jobs: List[BatchJob] = []
+    for i, entry in enumerate(data.get('jobs', [])):
+        options = dict(defaults)
+        options.update({key: value for key, value in entry.items() if key in DEFAULT_OPTIONS})
+        folders = [sanitize_path(folder) for folder in entry.get('folders', [])]
+        jobs.append(BatchJob(entry.get('name') or f"任务{i+1}", folders, options))
+    return jobs
+
+
+def _scan_task(key: ScanKey, folder: str) -> Tuple[ScanKey, Any, float, Optional[str]]:
+    """
+    在工作进程中扫描一个文件夹
+
+    Args:
+        key: 扫描键
+        folder: 任务文件中的文件夹写法（压缩包内的子目录需要保持原样）
+
+    Returns:
+        Tuple: (扫描键, 名称集合或元数据, 耗时秒数, 错误信息)
+    """
+    _, recursive, metadata, link_policy = key
+    start = time.perf_counter()
+    try:
+        if not is_comparable_path(folder):
+            raise FileNotFoundError(f"文件夹不存在或不是文件夹/压缩包: {folder}")
+        if metadata:
+            result: Any = collect_folder_metadata(folder, recursive, link_policy)
+        else:
+            result = list_folder_names(folder, recursive, link_policy=link_policy)
+        return key, result, time.perf_counter() - start, None
+    except Exception as e:
+        return key, None, time.perf_counter() - start, str(e)
+
+
+def _summarize_job(job: BatchJob, scans: Dict[ScanKey, Tuple[Any, float, Optional[str]]]) -> Dict[str, Any]:
+    """根据共享的扫描结果计算单个任务的比较结果摘要"""
+    start = time.perf_counter()
+    summary: Dict[str, Any] = {
+        'name': job.name,
+        'folders': job.folders,
+        'recursive': job.recursive,
+        'metadata': job.metadata,
+        'link_policy': job.link_policy,
+        'scan_seconds': {folder: round(scans[key][1], 3) for folder, key in zip(job.folders, job.scan_keys())},
+    }
+
+    errors = {folder: scans[key][2] for folder, key in zip(job.folders, job.scan_keys()) if scans[key][2]}
+    if errors or len(job.folders) < 2:
+        summary['status'] = 'error'
+        summary['errors'] = errors or {'': "每个任务至少需要两个文件夹"}
+        summary['compare_seconds'] = 0.0
+        return summary
+
+    folder_files = {}
+    metadata = {}
+    for folder, key in zip(job.folders, job.scan_keys()):
+        result = scans[key][0]
+        if job.metadata:
+            metadata[folder] = result
+            folder_files[folder] = set(result.names)
+        else:
+            folder_files[folder] = result
+
+    common_files, pattern_files = build_presence_matrix(folder_files, job.folders)
+    differing = sum(len(files) for files in pattern_files.values())
+
+    summary['status'] = 'identical' if not pattern_files else 'different'
+    summary['common_count'] = len(common_files)
+    summary['differing_count'] = differing
+    summary['patterns'] = [
+        {'pattern': describe_pattern(pattern), 'count': len(files), 'examples': files[:20]}
+        for pattern, files in sorted(pattern_files.items(), key=lambda item: -len(item[1]))
+    ]
+    if job.metadata:
+        metadata_diff = find_metadata_differences(metadata, job.folders, job.mtime_tolerance)
+        summary['metadata_differences'] = {kind: {'count': len(names), 'examples': names[:20]}
+                                           for kind, names in metadata_diff.items()}
+        if metadata_diff and summary['status'] == 'identical':
+            summary['status'] = 'metadata_different'
+
+    summary['compare_seconds'] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def _summary_task(job: BatchJob, scans: Dict[ScanKey, Tuple[Any, float, Optional[str]]]) -> Dict[str, Any]:
+    """在工作进程中计算单个任务的比较结果摘要，失败时返回错误摘要"""
+    try:
+        return _summarize_job(job, scans)
+    except Exception as e:
+        return {'name': job.name, 'folders': job.folders, 'status': 'error',
+                'errors': {'': str(e)}, 'compare_seconds': 0.0}
+
+
+def run_batch(jobs: List[BatchJob], workers: Optional[int] = None,
+              progress=None) -> Dict[str, Any]:
+    """
+    并发执行批量比较
+
+    多个任务共用的文件夹（例如同一个参考目录）只扫描一次，扫描结果在各任务之间复用。
+    任务用到的文件夹都扫描完成后，立即把该任务的比较（分布矩阵和元数据差异）也提交到进程池。
+
+    Args:
+        jobs (List[BatchJob]): 任务列表
+        workers (Optional[int]): 工作进程数，默认为 CPU 核数
+        progress: 进度回调函数 (已完成扫描数, 总扫描数)（可选）
+
+    Returns:
+        Dict[str, Any]: 汇总报告
+    """
+    wall_start = time.perf_counter()
+
+    # 去重后的扫描任务: 扫描键 -> 第一次出现时的文件夹写法
+    unique_keys: Dict[ScanKey, str] = {}
+    total_references = 0
+    for job in jobs:
+        for folder, key in zip(job.folders, job.scan_keys()):
+            total_references += 1
+            unique_keys.setdefault(key, folder)
+
+    scans: Dict[ScanKey, Tuple[Any, float, Optional[str]]] = {}
+    # 每个任务尚未完成的扫描，以及每个扫描键被哪些任务等待
+    remaining = [set(job.scan_keys()) for job in jobs]
+    waiting: Dict[ScanKey, List[int]] = {}
+    for index, keys in enumerate(remaining):
+        for key in keys:
+            waiting.setdefault(key, []).append(index)
+    summary_futures = {}
+
+    def submit_summary(index: int) -> None:
+        job = jobs[index]
+        summary_futures[index] = executor.submit(_summary_task, job, {key: scans[key] for key in job.scan_keys()})
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for index, keys in enumerate(remaining):
+            if not keys:
+                submit_summary(index)
+        futures = [executor.submit(_scan_task, key, folder) for key, folder in unique_keys.items()]
+        for done, future in enumerate(as_completed(futures), 1):
+            key, result, seconds, error = future.result()
+            scans[key] = (result, seconds, error)
+            for index in waiting.get(key, []):
+                remaining[index].discard(key)
+                if not remaining[index]:
+                    submit_summary(index)
+            if progress:
+                progress(done, len(unique_keys))
+        scan_wall = time.perf_counter() - wall_start
+        job_summaries = [summary_futures[index].result() for index in range(len(jobs))]
+
+    statuses: Dict[str, int] = {}
+    for summary in job_summaries:
+        statuses[summary['status']] = statuses.get(summary['status'], 0) + 1
+
+    return {
+        'jobs': job_summaries,
+        'totals': {
+            'job_count': len(jobs),
+            'statuses': statuses,
+            'folder_references': total_references,
+            'unique_scans': len(unique_keys),
+            'scans_saved_by_sharing': total_references - len(unique_keys),
+            'scan_wall_seconds': round(scan_wall, 3),
+            'wall_seconds': round(time.perf_counter() - wall_start, 3),
+            'workers': workers or os.cpu_count(),
+        },
+    }
+
+
+def format_summary(report: Dict[str, Any]) -> str:
+    """生成便于阅读的文本汇总"""
+    lines = []
+    for summary in report['jobs']:
+        scan_time = sum(summary.get('scan_seconds', {}).values())
+        line = f"[{summary['status']}] {summary['name']}  扫描 {scan_time:.2f}s  比较 {summary['compare_seconds']:.2f}s"
+        if 'differing_count' in summary:
+            line += f"  共有 {summary['common_count']}  差异 {summary['differing_count']}"
+        if summary.get('errors'):
+            line += f"  错误: {'; '.join(summary['errors'].values())}"
+        lines.append(line)
+
+    totals = report['totals']
+    lines.append("")
+    lines.append(f"任务 {totals['job_count']} 个，状态统计 {totals['statuses']}")
+    lines.append(f"扫描 {totals['unique_scans']} 个文件夹（共引用 {totals['folder_references']} 次，"
+                 f"复用节省 {totals['scans_saved_by_sharing']} 次扫描），"
+                 f"总耗时 {totals['wall_seconds']:.2f}s，进程数 {totals['workers']}")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量比较多组文件夹")
+    parser.add_argument('job_file', help="JSON 任务文件")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="工作进程数（默认为 CPU 核数）")
+    parser.add_argument('-o', '--output', default=None, help="汇总报告输出路径（默认为任务文件旁的 *.summary.json）")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = load_jobs(args.job_file)
+    except Exception as e:
+        print(f"读取任务文件失败: {str(e)}")
+        return 2
+
+    if not jobs:
+        print("任务文件中没有任务")
+        return 2
+
+    def progress(done, total):
+        print(f"\r扫描进度: {done}/{total}", end='', flush=True)
+
+    try:
+        report = run_batch(jobs, args.workers, progress)
+    except Exception:
+        print(f"\n批量比较失败: {traceback.format_exc()}")
+        return 1
+    print()
+
+    output = args.output or os.path.splitext(args.job_file)[0] + '.summary.json'
+    with open(output, 'w', encoding='utf-8') as fp:
+        json.dump(report, fp, ensure_ascii=False, indent=2)
+
+    print(format_summary(report))
+    print(f"汇总报告已写入: {output}")
+    return 1 if report['totals']['statuses'].get('error') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,22 @@
 """
 
 import os
+import bisect
+import hashlib
 import logging
+import threading
 import traceback
-from typing import List, Dict, Tuple, Set
+from typing import List, Dict, Tuple, Set, Iterator, NamedTuple, Callable, Union, Optional
+
+from archive import (is_archive_path, list_archive_names, list_archive_entries, hash_member, iter_member_hashes,
+                     ArchiveMember, CHUNK_SIZE)
+from scanner import (ScanCache, ScanReport, ScanBudget, PartialScan, FolderMetadata, scan_tree, scan_metadata,
+                     LINK_LEAF)
+
+# 元数据差异的分组名称
+METADATA_SIZE = "大小不同"
+METADATA_MTIME = "修改时间不同"
+METADATA_MODE = "权限不同"
 
 # 配置日志
 logging.basicConfig(
@@ -28,12 +41,677 @@ def sanitize_path(path: str) -> str:
     return os.path.normpath(path.strip().strip('"').strip("'"))
 
 
-def compare_multiple_folders(folders: List[str]) -> Tuple[List[str], Dict[Tuple[bool, ...], List[str]], List[str]]:
+def is_comparable_path(path: str) -> bool:
+    """
+    判断路径能否参与比较（文件夹或受支持的压缩包）
+
+    Args:
+        path (str): 文件夹或压缩包路径
+
+    Returns:
+        bool: 是否可以参与比较
+    """
+    return bool(path) and (os.path.isdir(path) or is_archive_path(path))
+
+
+def list_folder_names(folder: str, recursive: bool = False,
+                      scan_cache: Optional[ScanCache] = None, link_policy: str = LINK_LEAF,
+                      budget: Optional[ScanBudget] = None, partial: Optional[PartialScan] = None) -> Set[str]:
+    """
+    列出文件夹或压缩包中的名称
+
+    Args:
+        folder (str): 文件夹路径或压缩包路径
+        recursive (bool): 是否递归列出子目录，递归时返回以 / 分隔的相对路径
+        scan_cache (Optional[ScanCache]): 递归扫描使用的目录状态缓存
+        link_policy (str): 递归扫描时符号链接的处理方式（见 scanner 模块）
+        budget (Optional[ScanBudget]): 扫描预算（可选），只有递归扫描文件夹时可以中途停止
+        partial (Optional[PartialScan]): 扫描进度（可选），见 scanner.scan_tree
+
+    Returns:
+        Set[str]: 名称集合
+    """
+    if recursive and not is_archive_path(folder):
+        return scan_tree(folder, scan_cache if scan_cache is not None else ScanCache(), link_policy,
+                         budget, partial)
+
+    # 压缩包目录和单层文件夹一次读完
+    if is_archive_path(folder):
+        names = set(list_archive_entries(folder)) if recursive else list_archive_names(folder)
+    else:
+        names = set(os.listdir(folder))
+    if budget is not None:
+        budget.charge(entries=len(names))
+    if partial is not None:
+        partial.complete = True
+    return names
+
+
+def collect_folder_metadata(folder: str, recursive: bool = False, link_policy: str = LINK_LEAF,
+                            report: Optional[ScanReport] = None, budget: Optional[ScanBudget] = None,
+                            partial: Optional[PartialScan] = None) -> FolderMetadata:
+    """
+    在枚举文件夹或压缩包的同时收集元数据
+
+    Args:
+        folder (str): 文件夹路径或压缩包路径
+        recursive (bool): 是否包含子目录
+        link_policy (str): 符号链接的处理方式（见 scanner 模块）
+        report (Optional[ScanReport]): 累计符号链接和重复目录计数的统计信息（可选）
+        budget (Optional[ScanBudget]): 扫描预算（可选），压缩包目录一次读完
+        partial (Optional[PartialScan]): 扫描进度（可选），见 scanner.scan_metadata
+
+    Returns:
+        FolderMetadata: 元数据数组
+    """
+    if not is_archive_path(folder):
+        return scan_metadata(folder, recursive, link_policy, report, budget, partial)
+
+    records = [
+        (name, member.size, member.mtime_ns, member.mode, member.is_dir, not member.is_dir, 0, 0)
+        for name, member in list_archive_entries(folder).items()
+        if recursive or '/' not in name
+    ]
+    if budget is not None:
+        budget.charge(entries=len(records))
+    if partial is not None:
+        partial.complete = True
+    return FolderMetadata(records)
+
+
+def find_metadata_differences(metadata: Dict[str, FolderMetadata], folders: List[str],
+                              mtime_tolerance: float = 2.0) -> Dict[str, List[str]]:
     """
-    比较多个文件夹的内容，返回详细的文件分布矩阵
+    找出同名文件中大小、修改时间或权限位不同的文件，不读取任何文件内容
+
+    只比较存在该文件的文件夹，目录不参与比较。
+
+    Args:
+        metadata (Dict[str, FolderMetadata]): 各文件夹在枚举时收集的元数据
+        folders (List[str]): 文件夹列表
+        mtime_tolerance (float): 允许的修改时间误差（秒），用于忽略不同文件系统的时间精度差异
+
+    Returns:
+        Dict[str, List[str]]: 差异类型（大小不同/修改时间不同/权限不同）到文件名称列表的映射
+    """
+    tolerance_ns = int(mtime_tolerance * 1000000000)
+    tables = [metadata[folder] for folder in folders if folder in metadata]
+
+    all_names: Set[str] = set()
+    for table in tables:
+        all_names.update(table.names)
+
+    differences: Dict[str, List[str]] = {METADATA_SIZE: [], METADATA_MTIME: [], METADATA_MODE: []}
+    for name in sorted(all_names):
+        sizes = set()
+        modes = set()
+        mtimes = []
+        for table in tables:
+            position = table.index(name)
+            if position < 0 or table.is_dir[position]:
+                continue
+            sizes.add(table.sizes[position])
+            modes.add(table.modes[position])
+            mtimes.append(table.mtimes_ns[position])
+
+        if len(mtimes) < 2:
+            continue
+        if len(sizes) > 1:
+            differences[METADATA_SIZE].append(name)
+        if max(mtimes) - min(mtimes) > tolerance_ns:
+            differences[METADATA_MTIME].append(name)
+        # 压缩包未记录权限时为 0，不参与比较
+        modes.discard(0)
+        if len(modes) > 1:
+            differences[METADATA_MODE].append(name)
+
+    return {kind: names for kind, names in differences.items() if names}
+
+
+def _entry_signature(folder: str, name: str,
+                     listing: Optional[Dict[str, ArchiveMember]] = None) -> Optional[Tuple[int, Optional[int]]]:
+    """
+    获取条目的 (大小, CRC32) 签名，目录或不存在时返回 None
+    文件夹中的文件不提供 CRC，只使用大小；压缩包传入已读取的成员列表 listing 时直接查表
+    """
+    if listing is None and is_archive_path(folder):
+        listing = list_archive_entries(folder)
+    if listing is not None:
+        member = listing.get(name)
+        if member is None or member.is_dir:
+            return None
+        return member.size, member.crc
+
+    path = os.path.join(folder, name)
+    if not os.path.isfile(path):
+        return None
+    return os.path.getsize(path), None
+
+
+def hash_entry(folder: str, name: str) -> str:
+    """计算条目数据的 SHA-256（压缩包成员会被解压；同一压缩包的多个成员请用 archive.iter_member_hashes 一次读完）"""
+    if is_archive_path(folder):
+        return hash_member(folder, name)
+
+    digest = hashlib.sha256()
+    with open(os.path.join(folder, name), 'rb') as fp:
+        while True:
+            chunk = fp.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_entry_once(folder: str, name: str, digests: Dict[Tuple[int, int], str],
+                     report: Optional[ScanReport]) -> str:
+    """计算条目的 SHA-256，同一 inode 的硬链接只读取一次"""
+    if is_archive_path(folder):
+        return hash_member(folder, name)
+
+    st = os.stat(os.path.join(folder, name))
+    key = (st.st_dev, st.st_ino)
+    if st.st_ino and key in digests:
+        if report is not None:
+            report.hashes_avoided += 1
+        return digests[key]
+    digest = hash_entry(folder, name)
+    if st.st_ino:
+        digests[key] = digest
+    return digest
+
+
+def find_content_differences(common_files: List[str], folders: List[str],
+                             byte_level: bool = False, report: Optional[ScanReport] = None,
+                             budget: Optional[ScanBudget] = None) -> List[str]:
+    """
+    找出各文件夹中同名但内容不同的文件
+
+    默认只使用大小和压缩包提供的 CRC32 判断，不读取或解压任何数据；
+    byte_level 为 True 时对大小和 CRC 都一致的文件再逐字节（哈希）比较，硬链接到同一 inode 的文件只计算一次。
+
+    Args:
+        common_files (List[str]): 所有文件夹共有的名称
+        folders (List[str]): 文件夹或压缩包路径列表
+        byte_level (bool): 是否进行逐字节比较
+        report (Optional[ScanReport]): 用于统计因硬链接而省去的哈希计算和未检查的文件（可选）
+        budget (Optional[ScanBudget]): 读取预算（可选），用尽后剩余文件不再检查，数量记入 report.unchecked_files
+
+    Returns:
+        List[str]: 内容不同的文件名称（已排序）
+    """
+    different: List[str] = []
+    unchecked = 0
+
+    # 每个文件夹只解析一次压缩包路径和成员列表，之后逐个名称直接查表
+    listings = [list_archive_entries(folder) if is_archive_path(folder) else None for folder in folders]
+
+    # 第一步: 只用大小和 CRC 判断，记录需要逐字节比较的名称及其大小
+    to_hash: Dict[str, int] = {}
+    for name in common_files:
+        try:
+            signatures = [_entry_signature(folder, name, listing) for folder, listing in zip(folders, listings)]
+            if any(sig is None for sig in signatures):
+                # 目录或类型不一致的条目不参与内容比较
+                continue
+
+            if len({size for size, _ in signatures}) > 1:
+                different.append(name)
+                continue
+
+            crcs = {crc for _, crc in signatures if crc is not None}
+            if len(crcs) > 1:
+                different.append(name)
+                continue
+
+            if byte_level:
+                to_hash[name] = signatures[0][0]
+        except Exception as e:
+            logging.error(f"比较文件内容失败 {name}: {str(e)}")
+            print(f"比较文件内容失败 {name}: {str(e)}")
+
+    # 第二步: 压缩包成员在一次顺序读取中全部计算哈希（tar 不能随机访问），文件夹中的文件逐个计算
+    archive_digests: List[Optional[Dict[str, str]]] = [None] * len(folders)
+    for index, (folder, listing) in enumerate(zip(folders, listings)):
+        if listing is None or not to_hash:
+            continue
+        archive_digests[index] = {}
+        if budget is not None and budget.exhausted:
+            continue
+        try:
+            for name, digest in iter_member_hashes(folder, to_hash):
+                archive_digests[index][name] = digest
+                if budget is not None:
+                    budget.charge(bytes_read=to_hash[name])
+                    if budget.exhausted:
+                        break
+        except Exception as e:
+            logging.error(f"读取压缩包数据失败 {folder}: {str(e)}")
+            print(f"读取压缩包数据失败 {folder}: {str(e)}")
+
+    digests: Dict[Tuple[int, int], str] = {}
+    for name, size in to_hash.items():
+        if any(found is not None and name not in found for found in archive_digests) or \
+                (budget is not None and budget.exhausted):
+            unchecked += 1
+            continue
+        try:
+            values = set()
+            for folder, found in zip(folders, archive_digests):
+                if found is not None:
+                    values.add(found[name])
+                else:
+                    values.add(_hash_entry_once(folder, name, digests, report))
+                    if budget is not None:
+                        budget.charge(bytes_read=size)
+            if len(values) > 1:
+                different.append(name)
+        except Exception as e:
+            logging.error(f"比较文件内容失败 {name}: {str(e)}")
+            print(f"比较文件内容失败 {name}: {str(e)}")
+
+    if unchecked and report is not None:
+        report.unchecked_files += unchecked
+    return sorted(different)
+
+
+def describe_pattern(pattern: Tuple[bool, ...]) -> str:
+    """
+    生成存在模式的文字描述
+
+    Args:
+        pattern (Tuple[bool, ...]): 存在模式元组
+
+    Returns:
+        str: 例如 "仅在 文件夹1 中存在" 或 "存在于 文件夹1 和 文件夹3 中"
+    """
+    pattern_desc = [f"文件夹{i+1}" for i, exists in enumerate(pattern) if exists]
+    if len(pattern_desc) == len(pattern):
+        return "所有文件夹共有"
+    if len(pattern_desc) == 1:
+        return f"仅在 {pattern_desc[0]} 中存在"
+    return f"存在于 {' 和 '.join(pattern_desc)} 中"
+
+
+def _iter_presence(folder_files: Dict[str, Set[str]],
+                   valid_folders: List[str]) -> Iterator[Tuple[str, Tuple[bool, ...]]]:
+    """逐个生成所有名称及其存在模式 (名称, 存在模式)"""
+    all_files: Set[str] = set()
+    for files in folder_files.values():
+        all_files.update(files)
+
+    for file in all_files:
+        # 创建存在模式元组 (True/False 表示文件是否在对应文件夹中存在)
+        yield file, tuple(file in folder_files[folder] for folder in valid_folders)
+
+
+def build_presence_matrix(folder_files: Dict[str, Set[str]],
+                          valid_folders: List[str]) -> Tuple[List[str], Dict[Tuple[bool, ...], List[str]]]:
+    """
+    根据各文件夹的名称集合构建文件分布矩阵
+
+    Args:
+        folder_files (Dict[str, Set[str]]): 文件夹路径到名称集合的映射
+        valid_folders (List[str]): 参与比较的文件夹顺序
+
+    Returns:
+        Tuple[List[str], Dict[Tuple[bool, ...], List[str]]]: (共有文件列表, 文件分布模式字典)
+    """
+    # 分析每个文件在哪些文件夹中存在（矩阵形式）
+    file_matrix: Dict[Tuple[bool, ...], List[str]] = {}
+    for file, presence_pattern in _iter_presence(folder_files, valid_folders):
+        if presence_pattern not in file_matrix:
+            file_matrix[presence_pattern] = []
+        file_matrix[presence_pattern].append(file)
+
+    # 如果没有文件，返回空结果
+    if not file_matrix:
+        return [], {}
+
+    # 对结果进行分类
+    # 所有文件夹都存在的文件
+    all_true_pattern = tuple([True] * len(valid_folders))
+    common_files = sorted(file_matrix.get(all_true_pattern, []))
+
+    # 按存在模式分类文件（排除所有文件夹都存在的文件）
+    pattern_files: Dict[Tuple[bool, ...], List[str]] = {}
+    for pattern, files in file_matrix.items():
+        if pattern != all_true_pattern:
+            pattern_files[pattern] = sorted(files)
+
+    return common_files, pattern_files
+
+
+class CancelToken:
+    """比较的取消标记，可在其他线程中调用 cancel()"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+class FolderStarted(NamedTuple):
+    """开始读取一个文件夹"""
+    index: int
+    folder: str
+
+
+class FolderFinished(NamedTuple):
+    """一个文件夹读取完成，names 为其名称集合（元数据模式下同时提供元数据）"""
+    index: int
+    folder: str
+    names: Set[str]
+    metadata: Optional[FolderMetadata]
+
+
+class ScanError(NamedTuple):
+    """文件夹不存在、不是文件夹或读取失败，该文件夹不参与比较"""
+    index: int
+    folder: str
+    message: str
+
+
+class NameObserved(NamedTuple):
+    """所有文件夹读取完成后，逐个给出名称及其存在模式（按参与比较的文件夹顺序）"""
+    name: str
+    pattern: Tuple[bool, ...]
+
+
+class GroupFinalized(NamedTuple):
+    """一个存在模式分组已排序完成，common 为 True 表示所有文件夹共有"""
+    pattern: Tuple[bool, ...]
+    files: List[str]
+    common: bool
+
+
+class GroupPending(NamedTuple):
+    """
+    扫描预算用尽时无法确定分布的名称: 名称在某个未完成的文件夹中缺失，而它所在的目录在该文件夹中尚未枚举，
+    这些名称不归入任何存在模式分组（否则会被误报为"只在某些文件夹中存在"）
+    """
+    files: List[str]
+
+
+class FolderIncomplete(NamedTuple):
+    """
+    扫描预算用尽时一个文件夹只读取了一部分（或尚未开始），names/metadata 为已读取的部分，
+    pending 为尚未枚举的子目录（以 / 分隔的相对路径，"." 表示整个文件夹）
+    """
+    index: int
+    folder: str
+    names: Set[str]
+    metadata: Optional[FolderMetadata]
+    pending: List[str]
+
+
+class CompareFinished(NamedTuple):
+    """
+    比较结束，folders 为实际参与比较的文件夹，cancelled 表示是否被取消；
+    扫描预算用尽时 resume 为续扫状态（此时分组结果不完整），否则为 None
+    """
+    folders: List[str]
+    cancelled: bool
+    resume: Optional["CompareResume"] = None
+
+
+class CompareResume:
+    """预算用尽时的比较进度，传回 iter_compare 即可从停止处继续，已完成的文件夹不再扫描"""
+
+    def __init__(self, folders: List[str], recursive: bool, with_metadata: bool, link_policy: str):
+        self.folders = list(folders)
+        self.recursive = recursive
+        self.with_metadata = with_metadata
+        self.link_policy = link_policy
+        self.scans: Dict[int, PartialScan] = {}
+        self.reason = ""
+
+    def matches(self, folders: List[str], recursive: bool, with_metadata: bool, link_policy: str) -> bool:
+        """是否可以用于以这些参数进行的比较"""
+        return (self.folders == list(folders) and self.recursive == recursive
+                and self.with_metadata == with_metadata and self.link_policy == link_policy)
+
+    def incomplete(self) -> Dict[str, List[str]]:
+        """未完成的文件夹及其尚未枚举的子目录"""
+        return {self.folders[index]: scan.pending_dirs()
+                for index, scan in sorted(self.scans.items()) if not scan.complete}
+
+
+CompareEvent = Union[FolderStarted, FolderFinished, FolderIncomplete, ScanError, NameObserved, GroupFinalized,
+                     GroupPending, CompareFinished]
+
+# 分类名称时每隔多少个名称检查一次取消标记
+_CANCEL_CHECK_INTERVAL = 4096
+
+
+def _presence_unknown(name: str, pattern: Tuple[bool, ...], unresolved: Dict[int, Set[str]]) -> bool:
+    """名称在未完成的文件夹中缺失且所在目录（或其上级目录）尚未枚举时，无法确定它在该文件夹中是否存在"""
+    for position, pending in unresolved.items():
+        if pattern[position]:
+            continue
+        if '.' in pending:
+            return True
+        parent = name
+        while '/' in parent:
+            parent = parent.rpartition('/')[0]
+            if parent in pending:
+                return True
+    return False
+
+
+def iter_compare(folders: List[str], recursive: bool = False,
+                 scan_cache: Optional[ScanCache] = None, with_metadata: bool = False,
+                 cancel: Optional[CancelToken] = None,
+                 progress: Optional[Callable[[str, int, int], None]] = None,
+                 emit_names: bool = True, link_policy: str = LINK_LEAF,
+                 budget: Optional[ScanBudget] = None, resume: Optional[CompareResume] = None
+                 ) -> Iterator[CompareEvent]:
+    """
+    以事件流的形式比较多个文件夹，调用方可以边扫描边显示结果，或在看到足够信息后取消
+
+    事件顺序: 每个文件夹依次产生 FolderStarted 和 FolderFinished（或 ScanError）；
+    全部读取完成后产生每个名称的 NameObserved，再产生每个分组的 GroupFinalized；最后总是产生 CompareFinished。
+    取消标记在每个文件夹之间以及分类名称的过程中检查，取消后直接产生 CompareFinished(cancelled=True)。
+
+    传入扫描预算时按轮扫描: 每轮把剩余预算平均分给尚未完成的文件夹（ScanBudget.share），
+    提前完成的文件夹剩下的预算留给下一轮，因此一个很大的文件夹不会让其余文件夹一个名称都读不到；
+    一个文件夹在每轮开始读取时都会产生 FolderStarted。预算用尽后停止枚举：读取了一部分的文件夹和尚未开始的文件夹
+    在所有轮次结束后产生 FolderIncomplete，CompareFinished.resume 保存续扫状态；把它作为 resume 参数再次调用即可从停止处继续。
+    此时已读取的名称仍参与分组，但在未完成的文件夹中缺失、且所在目录尚未枚举的名称无法确定分布，
+    不归入任何分组，而是在 GroupFinalized 之后通过 GroupPending 给出。
+
+    Args:
+        folders (List[str]): 要比较的文件夹或压缩包路径列表
+        recursive (bool): 是否递归比较子目录（名称为以 / 分隔的相对路径）
+        scan_cache (Optional[ScanCache]): 递归扫描的目录状态缓存
+        with_metadata (bool): 是否在枚举的同时收集元数据（通过 FolderFinished.metadata 提供）
+        cancel (Optional[CancelToken]): 取消标记（可选）
+        progress: 进度回调函数 (阶段名称, 已完成数, 总数)（可选）
+        emit_names (bool): 是否产生逐个名称的 NameObserved 事件，只需要分组结果时可以关闭
+        link_policy (str): 递归扫描时符号链接的处理方式（见 scanner 模块）
+        budget (Optional[ScanBudget]): 扫描预算（可选），每次调用重新计时
+        resume (Optional[CompareResume]): 上次预算用尽时的续扫状态（可选），文件夹和选项必须一致
+
+    Yields:
+        CompareEvent: 比较事件
+    """
+    if resume is not None and not resume.matches(folders, recursive, with_metadata, link_policy):
+        raise ValueError("续扫状态与本次比较的文件夹或选项不一致")
+    if budget is not None:
+        budget.start()
+        if resume is None:
+            resume = CompareResume(folders, recursive, with_metadata, link_policy)
+
+    def cancelled() -> bool:
+        return cancel is not None and cancel.cancelled
+
+    # 先检查路径，只扫描存在的文件夹和压缩包
+    targets: List[Tuple[int, str]] = []
+    for index, folder in enumerate(folders):
+        # 压缩包作为虚拟文件夹处理
+        archive = is_archive_path(folder)
+        if not archive and not os.path.exists(folder):
+            logging.warning(f"文件夹不存在: {folder}")
+            yield ScanError(index, folder, f"文件夹不存在: {folder}")
+            continue
+        if not archive and not os.path.isdir(folder):
+            logging.warning(f"路径不是文件夹: {folder}")
+            yield ScanError(index, folder, f"路径不是文件夹: {folder}")
+            continue
+        targets.append((index, folder))
+
+    # 序号 -> (名称集合, 元数据)，未完成的文件夹保存已读取的部分
+    results: Dict[int, Tuple[Set[str], Optional[FolderMetadata]]] = {}
+    finished = 0
+    remaining = targets
+    unfinished: List[Tuple[int, str]] = []
+    while remaining:
+        unfinished = []
+        for position, (index, folder) in enumerate(remaining):
+            if cancelled():
+                yield CompareFinished([folder for i, folder in targets if i in results], True)
+                return
+            if progress:
+                progress("扫描", finished, len(targets))
+
+            partial = None
+            if resume is not None:
+                partial = resume.scans.setdefault(index, PartialScan(folder))
+                if partial.complete:
+                    # 上次已经完成的文件夹直接使用保存的结果
+                    results[index] = partial.result
+                    finished += 1
+                    yield FolderFinished(index, folder, *partial.result)
+                    continue
+
+            # 本轮剩余的预算由本轮尚未读取的文件夹平分
+            folder_budget = budget.share(len(remaining) - position) if budget is not None else None
+            yield FolderStarted(index, folder)
+            try:
+                folder_metadata = None
+                if partial is not None and partial.stack is None and budget is not None and budget.exhausted:
+                    # 预算已用尽，尚未开始的文件夹不再读取
+                    if with_metadata:
+                        folder_metadata = FolderMetadata([])
+                    files = set()
+                elif with_metadata:
+                    folder_metadata = collect_folder_metadata(folder, recursive, link_policy,
+                                                              scan_cache.report if scan_cache is not None else None,
+                                                              folder_budget, partial)
+                    files = set(folder_metadata.names)
+                else:
+                    files = list_folder_names(folder, recursive, scan_cache, link_policy, folder_budget, partial)
+            except PermissionError:
+                logging.error(f"无权限访问文件夹: {folder}")
+                if resume is not None:
+                    resume.scans.pop(index, None)
+                results.pop(index, None)
+                yield ScanError(index, folder, f"无权限访问文件夹: {folder}")
+                continue
+            except Exception as e:
+                logging.error(f"读取文件夹失败 {folder}: {str(e)}")
+                if resume is not None:
+                    resume.scans.pop(index, None)
+                results.pop(index, None)
+                yield ScanError(index, folder, f"读取文件夹失败 {folder}: {str(e)}")
+                continue
+
+            results[index] = (files, folder_metadata)
+            if partial is not None and not partial.complete:
+                unfinished.append((index, folder))
+                continue
+            if partial is not None:
+                partial.result = (files, folder_metadata)
+            finished += 1
+            yield FolderFinished(index, folder, files, folder_metadata)
+
+        if budget is None or budget.exhausted:
+            break
+        remaining = unfinished
+
+    for index, folder in unfinished:
+        # 续扫时会继续修改 partial 中的集合，这里交出副本
+        files, folder_metadata = results[index]
+        files = set(files)
+        results[index] = (files, folder_metadata)
+        yield FolderIncomplete(index, folder, files, folder_metadata, resume.scans[index].pending_dirs())
+
+    valid_folders = [folder for index, folder in targets if index in results]
+    folder_files: Dict[str, Set[str]] = {folder: results[index][0] for index, folder in targets if index in results}
+
+    # 未完成的文件夹（按参与比较的位置）中尚未枚举的目录
+    unresolved: Dict[int, Set[str]] = {}
+    if resume is not None and resume.incomplete():
+        resume.reason = budget.describe() if budget is not None else ""
+        position = 0
+        for index, folder in targets:
+            if index not in results:
+                continue
+            scan = resume.scans.get(index)
+            if scan is not None and not scan.complete:
+                unresolved[position] = set(scan.pending_dirs())
+            position += 1
+    else:
+        resume = None
+
+    if progress:
+        progress("扫描", len(folders), len(folders))
+
+    # 分析每个文件在哪些文件夹中存在（矩阵形式）
+    file_matrix: Dict[Tuple[bool, ...], List[str]] = {}
+    pending_files: List[str] = []
+    for count, (file, presence_pattern) in enumerate(_iter_presence(folder_files, valid_folders), 1):
+        if count % _CANCEL_CHECK_INTERVAL == 0 and cancelled():
+            yield CompareFinished(valid_folders, True)
+            return
+        if unresolved and _presence_unknown(file, presence_pattern, unresolved):
+            pending_files.append(file)
+            continue
+        if presence_pattern not in file_matrix:
+            file_matrix[presence_pattern] = []
+        file_matrix[presence_pattern].append(file)
+        if emit_names:
+            yield NameObserved(file, presence_pattern)
+
+    all_true_pattern = tuple([True] * len(valid_folders))
+    for done, (pattern, files) in enumerate(file_matrix.items(), 1):
+        if cancelled():
+            yield CompareFinished(valid_folders, True)
+            return
+        files.sort()
+        yield GroupFinalized(pattern, files, pattern == all_true_pattern)
+        if progress:
+            progress("分组", done, len(file_matrix))
+
+    if pending_files:
+        pending_files.sort()
+        yield GroupPending(pending_files)
+
+    yield CompareFinished(valid_folders, False, resume)
+
+
+def compare_multiple_folders(folders: List[str], recursive: bool = False,
+                             scan_cache: Optional[ScanCache] = None,
+                             metadata: Optional[Dict[str, FolderMetadata]] = None,
+                             cancel: Optional[CancelToken] = None, link_policy: str = LINK_LEAF
+                             ) -> Tuple[List[str], Dict[Tuple[bool, ...], List[str]], List[str]]:
+    """
+    比较多个文件夹的内容，返回详细的文件分布矩阵（收集 iter_compare 的全部事件）
+    zip/tar 压缩包可以直接作为文件夹参与比较，只读取其目录信息
     
     Args:
-        folders (List[str]): 要比较的文件夹路径列表
+        folders (List[str]): 要比较的文件夹或压缩包路径列表
+        recursive (bool): 是否递归比较子目录（名称为以 / 分隔的相对路径）
+        scan_cache (Optional[ScanCache]): 递归扫描的目录状态缓存，传入上次使用的缓存可跳过未修改的目录
+        metadata (Optional[Dict[str, FolderMetadata]]): 传入字典时启用元数据模式，
+            枚举的同时把各文件夹的元数据写入该字典，供 find_metadata_differences 使用
+        cancel (Optional[CancelToken]): 取消标记，取消时返回已经完成的部分分组
+        link_policy (str): 递归扫描时符号链接的处理方式（见 scanner 模块）
         
     Returns:
         Tuple[List[str], Dict[Tuple[bool, ...], List[str]], List[str]]: 
@@ -47,67 +725,24 @@ def compare_multiple_folders(folders: List[str]) -> Tuple[List[str], Dict[Tuple[
         return [], {}, folders
 
     try:
-        # 验证所有文件夹是否存在且可访问
-        folder_files: Dict[str, Set[str]] = {}
-        valid_folders: List[str] = []
-        
-        for folder in folders:
-            # 检查路径是否存在
-            if not os.path.exists(folder):
-                logging.warning(f"文件夹不存在: {folder}")
-                print(f"文件夹不存在: {folder}")
-                continue
-            
-            # 检查是否为文件夹
-            if not os.path.isdir(folder):
-                logging.warning(f"路径不是文件夹: {folder}")
-                print(f"路径不是文件夹: {folder}")
-                continue
-            
-            try:
-                # 尝试读取文件夹内容
-                files = set(os.listdir(folder))
-                folder_files[folder] = files
-                valid_folders.append(folder)
-            except PermissionError:
-                logging.error(f"无权限访问文件夹: {folder}")
-                print(f"无权限访问文件夹: {folder}")
-            except Exception as e:
-                logging.error(f"读取文件夹失败 {folder}: {str(e)}")
-                print(f"读取文件夹失败 {folder}: {str(e)}")
-
-        # 如果没有有效的文件夹，返回空结果
-        if not folder_files:
-            return [], {}, valid_folders
-
-        # 获取所有文件的并集
-        all_files: Set[str] = set()
-        for files in folder_files.values():
-            all_files.update(files)
-
-        # 如果没有文件，返回空结果
-        if not all_files:
-            return [], {}, valid_folders
-
-        # 分析每个文件在哪些文件夹中存在（矩阵形式）
-        file_matrix: Dict[Tuple[bool, ...], List[str]] = {}
-        for file in all_files:
-            # 创建存在模式元组 (True/False 表示文件是否在对应文件夹中存在)
-            presence_pattern = tuple(file in folder_files[folder] for folder in valid_folders)
-            if presence_pattern not in file_matrix:
-                file_matrix[presence_pattern] = []
-            file_matrix[presence_pattern].append(file)
-
-        # 对结果进行分类
-        # 所有文件夹都存在的文件
-        all_true_pattern = tuple([True] * len(valid_folders))
-        common_files = sorted(file_matrix.get(all_true_pattern, []))
-
-        # 按存在模式分类文件（排除所有文件夹都存在的文件）
+        common_files: List[str] = []
         pattern_files: Dict[Tuple[bool, ...], List[str]] = {}
-        for pattern, files in file_matrix.items():
-            if pattern != all_true_pattern:
-                pattern_files[pattern] = sorted(files)
+        valid_folders: List[str] = []
+
+        for event in iter_compare(folders, recursive, scan_cache, metadata is not None, cancel,
+                                  emit_names=False, link_policy=link_policy):
+            if isinstance(event, (FolderFinished, FolderIncomplete)):
+                if metadata is not None:
+                    metadata[event.folder] = event.metadata
+            elif isinstance(event, ScanError):
+                print(event.message)
+            elif isinstance(event, GroupFinalized):
+                if event.common:
+                    common_files = event.files
+                else:
+                    pattern_files[event.pattern] = event.files
+            elif isinstance(event, CompareFinished):
+                valid_folders = event.folders
 
         return common_files, pattern_files, valid_folders
     except Exception as e:
@@ -115,3 +750,103 @@ def compare_multiple_folders(folders: List[str]) -> Tuple[List[str], Dict[Tuple[
         logging.error(f"Error in compare_multiple_folders: {traceback.format_exc()}")
         print(f"Error in compare_multiple_folders: {traceback.format_exc()}")
         return [], {}, folders
+
+
+class PresenceModel:
+    """
+    可增量更新的文件分布矩阵
+    保存按存在模式分组的有序名称列表，单个文件夹变化时只更新受影响的名称
+
+    显示、复制和历史记录只需要分组；增量更新所需的名称索引（每个名称的模式、每个文件夹的名称集合）
+    占用的内存与名称总数成正比，在第一次调用 update_folder 时（即开启监视并收到变化后）才建立。
+    """
+
+    def __init__(self, folders: List[str], common_files: List[str],
+                 pattern_files: Dict[Tuple[bool, ...], List[str]]):
+        """
+        Args:
+            folders: 文件夹列表（与模式元组顺序一致）
+            common_files: 共有文件列表
+            pattern_files: 文件分布模式字典
+
+        分组直接使用传入的列表而不复制，增量更新时会就地修改这些列表
+        """
+        self.folders = list(folders)
+        self.all_true_pattern = tuple([True] * len(self.folders))
+
+        self.groups: Dict[Tuple[bool, ...], List[str]] = {
+            pattern: files for pattern, files in pattern_files.items() if files
+        }
+        if common_files:
+            self.groups[self.all_true_pattern] = common_files
+
+        self.name_patterns: Optional[Dict[str, Tuple[bool, ...]]] = None
+        self.folder_files: Optional[Dict[str, Set[str]]] = None
+
+    def _build_index(self) -> None:
+        """建立增量更新所需的名称索引"""
+        self.name_patterns = {}
+        self.folder_files = {folder: set() for folder in self.folders}
+        for pattern, files in self.groups.items():
+            for name in files:
+                self.name_patterns[name] = pattern
+            for folder, exists in zip(self.folders, pattern):
+                if exists:
+                    self.folder_files[folder].update(files)
+
+    @property
+    def common_files(self) -> List[str]:
+        return self.groups.get(self.all_true_pattern, [])
+
+    @property
+    def pattern_files(self) -> Dict[Tuple[bool, ...], List[str]]:
+        return {pattern: files for pattern, files in self.groups.items() if pattern != self.all_true_pattern}
+
+    def update_folder(self, folder: str, names: Set[str]) -> List[Tuple[str, Tuple[bool, ...], int, str]]:
+        """
+        用文件夹的最新名称集合更新矩阵
+
+        Args:
+            folder (str): 发生变化的文件夹
+            names (Set[str]): 该文件夹当前的名称集合
+
+        Returns:
+            List[Tuple[str, Tuple[bool, ...], int, str]]: 按顺序应用的行变化
+            ("remove" 或 "insert", 存在模式, 在该模式分组中的位置, 名称)
+        """
+        if folder not in self.folders:
+            return []
+        if self.folder_files is None:
+            self._build_index()
+
+        index = self.folders.index(folder)
+        old_names = self.folder_files[folder]
+        changed = old_names.symmetric_difference(names)
+        self.folder_files[folder] = set(names)
+
+        events: List[Tuple[str, Tuple[bool, ...], int, str]] = []
+        for name in sorted(changed):
+            old_pattern = self.name_patterns.get(name)
+            if old_pattern is None:
+                new_pattern = tuple(i == index for i in range(len(self.folders)))
+            else:
+                new_pattern = old_pattern[:index] + (name in names,) + old_pattern[index + 1:]
+
+            if old_pattern is not None:
+                group = self.groups[old_pattern]
+                position = bisect.bisect_left(group, name)
+                del group[position]
+                if not group:
+                    del self.groups[old_pattern]
+                events.append(("remove", old_pattern, position, name))
+
+            if any(new_pattern):
+                group = self.groups.setdefault(new_pattern, [])
+                position = bisect.bisect_left(group, name)
+                group.insert(position, name)
+                self.name_patterns[name] = new_pattern
+                events.append(("insert", new_pattern, position, name))
+            else:
+                self.name_patterns.pop(name, None)
+
+        return events
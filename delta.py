@@ -0,0 +1,366 @@
+"""
+块级差异模块
+对内容不同的同名大文件（虚拟机镜像、数据库转储等）计算 rsync 式的块差异：
+为基准文件的每个块计算弱校验（Adler-32，可滚动）和强哈希，然后在目标文件的任意偏移处查找相同的块，
+报告可以复用的字节数和需要传输的字面字节数。
+
+逐字节滚动查找是纯 Python 循环（约 2~3 MB/s），只在每段字面数据开头的 max_search 字节内进行，
+这是插入或删除导致块错位后重新对齐的位置；更长的字面数据只检查块边界（zlib 计算，可达数百 MB/s），
+因此大段新数据不会拖慢比较，代价是字面数据段中间错位的相同块不会被发现。
+
+基准文件的块签名保存在比较结果缓存目录下（按路径、大小、修改时间和块大小区分），重复检查时直接复用。
+
+用法: python delta.py 基准文件 目标文件 [--block-size 65536] [--max-search 262144] [--no-cache]
+"""
+
+import os
+import sys
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import argparse
+from array import array
+from typing import List, Dict, Tuple, NamedTuple, Callable, Optional
+
+from core import CancelToken
+from result_cache import CACHE_DIR
+
+# 默认块大小
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+# 每段字面数据默认最多逐字节滚动查找的块数
+DEFAULT_SEARCH_BLOCKS = 4
+
+# 每处理多少个块报告一次进度并检查取消标记
+_CHECK_INTERVAL = 64
+
+# 块签名缓存目录和最多保留的签名文件数
+SIGNATURE_DIR = os.path.join(CACHE_DIR, 'signatures')
+MAX_SIGNATURE_FILES = 200
+
+# 强哈希长度（字节）
+STRONG_SIZE = 16
+
+# Adler-32 的模数
+_ADLER_MOD = 65521
+
+_MAGIC = b'FCBS'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBIQI')
+
+
+def _strong_hash(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=STRONG_SIZE).digest()
+
+
+class BlockSignature:
+    """一个文件的块签名（最后一块可能不足 block_size）"""
+
+    def __init__(self, block_size: int, file_size: int, weak: array, strong: bytes):
+        self.block_size = block_size
+        self.file_size = file_size
+        self.weak = weak
+        self.strong = strong
+
+    @classmethod
+    def build(cls, path: str, block_size: int = DEFAULT_BLOCK_SIZE,
+              cancel: Optional[CancelToken] = None) -> Optional["BlockSignature"]:
+        """读取文件计算每个块的弱校验和强哈希，取消时返回 None"""
+        weak = array('I')
+        strong = bytearray()
+        file_size = 0
+        with open(path, 'rb') as fp:
+            while True:
+                if cancel is not None and len(weak) % _CHECK_INTERVAL == 0 and cancel.cancelled:
+                    return None
+                block = fp.read(block_size)
+                if not block:
+                    break
+                file_size += len(block)
+                weak.append(zlib.adler32(block))
+                strong += _strong_hash(block)
+        return cls(block_size, file_size, weak, bytes(strong))
+
+    def strong_at(self, index: int) -> bytes:
+        return self.strong[index * STRONG_SIZE:(index + 1) * STRONG_SIZE]
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_MAGIC, _VERSION, self.block_size, self.file_size, len(self.weak)) + \
+            self.weak.tobytes() + self.strong
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BlockSignature":
+        magic, version, block_size, file_size, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("不是有效的块签名文件")
+        weak = array('I')
+        offset = _HEADER.size
+        weak.frombytes(data[offset:offset + count * weak.itemsize])
+        offset += count * weak.itemsize
+        strong = data[offset:offset + count * STRONG_SIZE]
+        if len(weak) != count or len(strong) != count * STRONG_SIZE:
+            raise ValueError("块签名文件不完整")
+        return cls(block_size, file_size, weak, strong)
+
+
+def signature_cache_path(path: str, block_size: int) -> Optional[str]:
+    """返回文件签名的缓存路径，文件无法访问时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    identity = f"{os.path.normcase(os.path.abspath(path))}|{st.st_size}|{st.st_mtime_ns}|{block_size}"
+    return os.path.join(SIGNATURE_DIR, hashlib.sha1(identity.encode('utf-8')).hexdigest() + '.fcsig')
+
+
+def _prune_signatures() -> None:
+    """删除最久未使用的签名文件，只保留 MAX_SIGNATURE_FILES 个"""
+    try:
+        entries = [os.path.join(SIGNATURE_DIR, name) for name in os.listdir(SIGNATURE_DIR) if name.endswith('.fcsig')]
+        if len(entries) <= MAX_SIGNATURE_FILES:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - MAX_SIGNATURE_FILES]:
+            os.remove(path)
+    except OSError as e:
+        logging.warning(f"清理块签名缓存失败: {str(e)}")
+
+
+def load_or_build_signature(path: str, block_size: int = DEFAULT_BLOCK_SIZE, use_cache: bool = True,
+                            cancel: Optional[CancelToken] = None) -> Tuple[Optional[BlockSignature], bool]:
+    """
+    读取缓存的块签名，文件变化或没有缓存时重新计算并保存
+
+    Returns:
+        Tuple[Optional[BlockSignature], bool]: (块签名, 是否复用了缓存)，计算期间被取消时块签名为 None
+    """
+    cache_path = signature_cache_path(path, block_size) if use_cache else None
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as fp:
+                signature = BlockSignature.from_bytes(fp.read())
+            os.utime(cache_path)
+            return signature, True
+        except (OSError, ValueError) as e:
+            logging.warning(f"读取块签名缓存失败 {cache_path}: {str(e)}")
+
+    signature = BlockSignature.build(path, block_size, cancel)
+    if signature is None:
+        return None, False
+    if cache_path is not None:
+        try:
+            os.makedirs(SIGNATURE_DIR, exist_ok=True)
+            tmp_path = cache_path + '.tmp'
+            with open(tmp_path, 'wb') as fp:
+                fp.write(signature.to_bytes())
+            os.replace(tmp_path, cache_path)
+            _prune_signatures()
+        except OSError as e:
+            logging.warning(f"保存块签名缓存失败 {cache_path}: {str(e)}")
+    return signature, False
+
+
+class DeltaReport(NamedTuple):
+    """目标文件相对于基准文件的块差异"""
+    basis: str
+    target: str
+    block_size: int
+    target_size: int
+    matched_bytes: int                       # 可从基准文件复用的字节数
+    literal_bytes: int                       # 需要传输的字节数
+    matched_blocks: int
+    literal_ranges: List[Tuple[int, int]]    # 目标文件中需要传输的 (偏移, 长度)
+    reused_signature: bool
+    seconds: float
+
+    @property
+    def matched_ratio(self) -> float:
+        return self.matched_bytes / self.target_size if self.target_size else 1.0
+
+
+def compute_delta(basis: str, target: str, block_size: int = DEFAULT_BLOCK_SIZE, use_cache: bool = True,
+                  progress: Optional[Callable[[str, int, int], None]] = None,
+                  max_search: Optional[int] = None, cancel: Optional[CancelToken] = None) -> Optional[DeltaReport]:
+    """
+    计算目标文件相对于基准文件的块差异
+
+    在目标文件中逐个偏移滚动计算弱校验，命中后再用强哈希确认，确认后直接跳过整个块。
+    块在原位置被修改时（镜像文件的常见情况）先尝试下一个块对齐的位置，避免逐字节滚动整个块。
+    一段字面数据逐字节滚动了 max_search 字节仍未找到匹配时，该段剩余部分只检查块边界。
+
+    Args:
+        basis (str): 基准文件路径（计算块签名的一方）
+        target (str): 目标文件路径（在其中查找相同块的一方）
+        block_size (int): 块大小（字节）
+        use_cache (bool): 是否读取和保存基准文件的块签名缓存
+        progress: 进度回调函数 (阶段名称, 已处理字节数, 总字节数)（可选）
+        max_search (Optional[int]): 每段字面数据最多逐字节滚动查找的字节数，None 表示 DEFAULT_SEARCH_BLOCKS 个块，
+            0 表示只检查块边界
+        cancel (Optional[CancelToken]): 取消标记（可选），每处理一批块检查一次
+
+    Returns:
+        Optional[DeltaReport]: 块差异报告，被取消时返回 None
+    """
+    start = time.perf_counter()
+    if max_search is None:
+        max_search = DEFAULT_SEARCH_BLOCKS * block_size
+    signature, reused = load_or_build_signature(basis, block_size, use_cache, cancel)
+    if signature is None:
+        return None
+
+    # 弱校验到块序号的映射，只包含完整大小的块；不足一块的末尾块只在目标文件末尾比较
+    full_blocks = signature.file_size // block_size
+    table: Dict[int, List[int]] = {}
+    for index in range(full_blocks):
+        table.setdefault(signature.weak[index], []).append(index)
+
+    literal_ranges: List[Tuple[int, int]] = []
+    matched_bytes = matched_blocks = 0
+
+    def add_literal(offset: int, length: int) -> None:
+        if length <= 0:
+            return
+        if literal_ranges and literal_ranges[-1][0] + literal_ranges[-1][1] == offset:
+            literal_ranges[-1] = (literal_ranges[-1][0], literal_ranges[-1][1] + length)
+        else:
+            literal_ranges.append((offset, length))
+
+    with open(target, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        try:
+            def find_block(offset: int, weak: int) -> bool:
+                candidates = table.get(weak)
+                if not candidates:
+                    return False
+                strong = _strong_hash(data[offset:offset + block_size])
+                return any(signature.strong_at(index) == strong for index in candidates)
+
+            position = literal_start = 0
+            last_check = 0
+            searched = 0    # 当前字面数据段中已逐字节滚动查找的字节数
+            while position + block_size <= size:
+                if position - last_check >= _CHECK_INTERVAL * block_size:
+                    last_check = position
+                    if cancel is not None and cancel.cancelled:
+                        return None
+                    if progress:
+                        progress("比较", position, size)
+
+                weak = zlib.adler32(data[position:position + block_size])
+                if find_block(position, weak):
+                    add_literal(literal_start, position - literal_start)
+                    matched_bytes += block_size
+                    matched_blocks += 1
+                    position += block_size
+                    literal_start = position
+                    searched = 0
+                    continue
+
+                # 原位修改: 下一个对齐位置的块能匹配时，把当前块整体作为字面数据
+                probe = position + block_size
+                if probe + block_size <= size and find_block(probe, zlib.adler32(data[probe:probe + block_size])):
+                    position = probe
+                elif searched >= max_search:
+                    # 字面数据段已经很长，不再逐字节滚动，只检查下一个块边界
+                    position = probe
+                    continue
+                else:
+                    # 逐字节滚动查找，最多滚动一个块（且不超过剩余的查找字节数），之后从新位置重新计算
+                    limit = min(position + block_size, size - block_size, position + max_search - searched)
+                    window = data[position:limit + block_size]
+                    a, b = weak & 0xffff, weak >> 16
+                    found = False
+                    for old, new in zip(window, window[block_size:]):
+                        a = (a - old + new) % _ADLER_MOD
+                        b = (b - block_size * old + a - 1) % _ADLER_MOD
+                        position += 1
+                        weak = b << 16 | a
+                        if weak in table and find_block(position, weak):
+                            found = True
+                            break
+                    searched += len(window) - block_size
+                    if not found:
+                        if position >= size - block_size:
+                            break
+                        continue
+
+                add_literal(literal_start, position - literal_start)
+                matched_bytes += block_size
+                matched_blocks += 1
+                position += block_size
+                literal_start = position
+                searched = 0
+
+            # 末尾不足一块的数据与基准文件的末尾块比较
+            tail_length = size - position
+            basis_tail = signature.file_size - full_blocks * block_size
+            if tail_length and tail_length == basis_tail and \
+                    _strong_hash(data[position:size]) == signature.strong_at(full_blocks):
+                add_literal(literal_start, position - literal_start)
+                matched_bytes += tail_length
+                matched_blocks += 1
+            else:
+                add_literal(literal_start, size - literal_start)
+        finally:
+            if size:
+                data.close()
+
+    if progress:
+        progress("比较", size, size)
+    return DeltaReport(basis, target, block_size, size, matched_bytes, size - matched_bytes, matched_blocks,
+                       literal_ranges, reused, time.perf_counter() - start)
+
+
+def format_delta(report: DeltaReport, max_ranges: int = 20) -> str:
+    """生成文本格式的块差异报告"""
+    from duplicates import format_bytes
+
+    lines = [
+        f"基准: {report.basis}",
+        f"目标: {report.target}",
+        f"块大小 {format_bytes(report.block_size)}，目标大小 {format_bytes(report.target_size)}，"
+        f"{'复用已缓存的块签名' if report.reused_signature else '已计算并缓存块签名'}，耗时 {report.seconds:.2f}s",
+        f"可复用 {format_bytes(report.matched_bytes)}（{report.matched_ratio:.1%}，{report.matched_blocks} 块），"
+        f"需传输 {format_bytes(report.literal_bytes)}，共 {len(report.literal_ranges)} 段",
+    ]
+    for offset, length in report.literal_ranges[:max_ranges]:
+        lines.append(f"    偏移 {offset:>14,}  长度 {length:>12,}")
+    if len(report.literal_ranges) > max_ranges:
+        lines.append(f"    ... 另有 {len(report.literal_ranges) - max_ranges} 段")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="计算两个文件之间的块级差异")
+    parser.add_argument('basis', help="基准文件")
+    parser.add_argument('target', help="目标文件")
+    parser.add_argument('-b', '--block-size', type=int, default=DEFAULT_BLOCK_SIZE, help="块大小（字节）")
+    parser.add_argument('--max-search', type=int, default=None,
+                        help=f"每段字面数据最多逐字节查找的字节数（默认 {DEFAULT_SEARCH_BLOCKS} 个块，0 表示只检查块边界）")
+    parser.add_argument('--no-cache', action='store_true', help="不读取也不保存块签名缓存")
+    args = parser.parse_args(argv)
+
+    if args.block_size <= 0:
+        print("块大小必须大于 0")
+        return 2
+    if args.max_search is not None and args.max_search < 0:
+        print("查找字节数不能为负数")
+        return 2
+
+    try:
+        report = compute_delta(args.basis, args.target, args.block_size, not args.no_cache,
+                               max_search=args.max_search)
+    except OSError as e:
+        print(f"计算块差异失败: {str(e)}")
+        return 1
+    print(format_delta(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""
+重复文件查找模块
+在参与比较的文件夹内部和文件夹之间查找内容相同的文件，并统计删除多余副本可回收的空间
+
+查找分为几步，每一步只处理上一步留下的候选文件:
+1. 复用 core 的元数据扫描，按大小分组，丢弃大小唯一的文件
+2. 同一 inode 的硬链接只算一个文件，不重复读取也不计入可回收空间
+3. 读取文件开头和结尾的数据块计算指纹，丢弃指纹唯一的文件
+4. 对剩余的候选文件在线程池中并发计算完整的 SHA-256
+
+用法: python duplicates.py 文件夹1 文件夹2 ... [--min-size 1024] [--top-level]
+"""
+
+import os
+import sys
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, NamedTuple, Callable, Optional
+
+from core import collect_folder_metadata, is_comparable_path, hash_entry
+from archive import is_archive_path, iter_member_hashes
+
+# 指纹读取的开头和结尾数据块大小
+FINGERPRINT_BLOCK = 64 * 1024
+
+
+class FileRef(NamedTuple):
+    """文件夹（或压缩包）中的一个文件"""
+    folder: str
+    name: str
+
+    def display(self) -> str:
+        return os.path.join(self.folder, self.name)
+
+
+class DuplicateCluster(NamedTuple):
+    """一组内容相同的文件，copies 中每一项为指向同一 inode 的所有路径"""
+    size: int
+    digest: str
+    copies: List[List[FileRef]]
+
+    @property
+    def reclaimable_bytes(self) -> int:
+        """只保留一份时可以回收的字节数（硬链接不占额外空间）"""
+        return self.size * (len(self.copies) - 1)
+
+
+class DuplicateReport:
+    """重复文件查找结果和各阶段统计"""
+
+    def __init__(self):
+        self.clusters: List[DuplicateCluster] = []
+        self.scanned_files = 0
+        self.hardlinked_paths = 0
+        self.size_candidates = 0
+        self.fingerprint_candidates = 0
+        self.hashed_files = 0
+        self.errors: Dict[str, str] = {}
+
+    @property
+    def reclaimable_bytes(self) -> int:
+        return sum(cluster.reclaimable_bytes for cluster in self.clusters)
+
+    def summary(self) -> str:
+        return (f"扫描文件 {self.scanned_files} 个（硬链接重复路径 {self.hardlinked_paths} 个），"
+                f"大小相同 {self.size_candidates} 个，指纹相同 {self.fingerprint_candidates} 个，"
+                f"完整哈希 {self.hashed_files} 个；重复组 {len(self.clusters)} 个，"
+                f"可回收 {format_bytes(self.reclaimable_bytes)}")
+
+
+def format_bytes(size: int) -> str:
+    """把字节数格式化为便于阅读的文字"""
+    value = float(size)
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if value < 1024 or unit == 'TB':
+            return f"{value:.0f} {unit}" if unit == 'B' else f"{value:.2f} {unit}"
+        value /= 1024
+    return f"{size} B"
+
+
+def _fingerprint(ref: FileRef, size: int) -> Tuple[str, bool]:
+    """
+    计算文件开头和结尾数据块的指纹
+
+    Returns:
+        Tuple[str, bool]: (指纹, 指纹是否已覆盖全部内容)
+    """
+    digest = hashlib.sha256()
+    with open(os.path.join(ref.folder, ref.name), 'rb') as fp:
+        if size <= 2 * FINGERPRINT_BLOCK:
+            digest.update(fp.read())
+            return digest.hexdigest(), True
+        digest.update(fp.read(FINGERPRINT_BLOCK))
+        fp.seek(-FINGERPRINT_BLOCK, os.SEEK_END)
+        digest.update(fp.read(FINGERPRINT_BLOCK))
+    return "ht:" + digest.hexdigest(), False
+
+
+def _file_identity(ref: FileRef, device: int, inode: int) -> Tuple:
+    """返回用于识别硬链接的标识，同一 inode 的路径标识相同"""
+    if is_archive_path(ref.folder):
+        return ('archive', ref.folder, ref.name)
+    if not inode:
+        # Windows 的目录枚举不提供设备号，只对候选文件补充一次 stat
+        try:
+            st = os.stat(ref.display())
+            device, inode = st.st_dev, st.st_ino
+        except OSError:
+            return ('path', ref.folder, ref.name)
+        if not inode:
+            return ('path', ref.folder, ref.name)
+    return ('inode', device, inode)
+
+
+def find_duplicates(folders: List[str], recursive: bool = True, min_size: int = 1,
+                    workers: Optional[int] = None,
+                    progress: Optional[Callable[[str, int, int], None]] = None) -> DuplicateReport:
+    """
+    查找文件夹内部和文件夹之间的重复文件
+
+    Args:
+        folders (List[str]): 文件夹或压缩包路径列表
+        recursive (bool): 是否包含子目录
+        min_size (int): 参与查找的最小文件大小（字节），空文件默认不计
+        workers (Optional[int]): 计算完整哈希的线程数，默认为 min(32, CPU 核数 + 4)
+        progress: 进度回调函数 (阶段名称, 已完成数, 总数)（可选）
+
+    Returns:
+        DuplicateReport: 查找结果，重复组按可回收空间从大到小排序
+    """
+    report = DuplicateReport()
+
+    # 第一步: 复用元数据扫描，按大小分组；同一 inode 的路径合并为一个文件
+    by_size: Dict[int, Dict[Tuple, List[FileRef]]] = {}
+    for folder in folders:
+        try:
+            if not is_comparable_path(folder):
+                raise FileNotFoundError(f"文件夹不存在或不是文件夹/压缩包: {folder}")
+            metadata = collect_folder_metadata(folder, recursive)
+        except Exception as e:
+            logging.error(f"扫描文件夹失败 {folder}: {str(e)}")
+            report.errors[folder] = str(e)
+            continue
+        for i, name in enumerate(metadata.names):
+            if not metadata.is_file[i] or metadata.sizes[i] < min_size:
+                continue
+            report.scanned_files += 1
+            by_size.setdefault(metadata.sizes[i], {}).setdefault(
+                (metadata.devices[i], metadata.inodes[i], folder, name), []).append(FileRef(folder, name))
+
+    # 大小唯一的文件不可能重复；只对剩下的文件确定硬链接标识
+    candidates: Dict[int, Dict[Tuple, List[FileRef]]] = {}
+    for size, entries in by_size.items():
+        if len(entries) < 2:
+            continue
+        physical: Dict[Tuple, List[FileRef]] = {}
+        for (device, inode, _, _), refs in entries.items():
+            physical.setdefault(_file_identity(refs[0], device, inode), []).extend(refs)
+        report.hardlinked_paths += sum(len(refs) - 1 for refs in physical.values())
+        if len(physical) > 1:
+            candidates[size] = physical
+            report.size_candidates += len(physical)
+    del by_size
+
+    # 第二步: 开头和结尾数据块指纹
+    # 压缩包成员无法廉价地读取结尾数据，跳过指纹直接计算完整哈希，同样大小的其他文件也一并计算
+    by_fingerprint: Dict[Tuple[int, str], List[List[FileRef]]] = {}
+    complete: Dict[Tuple[int, str], bool] = {}
+    archived: Dict[int, List[List[FileRef]]] = {}
+    done = 0
+    for size, physical in candidates.items():
+        for refs in physical.values():
+            if is_archive_path(refs[0].folder):
+                archived.setdefault(size, []).append(refs)
+                done += 1
+                continue
+            try:
+                fingerprint, is_complete = _fingerprint(refs[0], size)
+            except OSError as e:
+                report.errors[refs[0].display()] = str(e)
+                continue
+            by_fingerprint.setdefault((size, fingerprint), []).append(refs)
+            complete[(size, fingerprint)] = is_complete
+            done += 1
+            if progress:
+                progress("指纹", done, report.size_candidates)
+
+    # 第三步: 指纹已覆盖全部内容的小文件直接成组，其余在线程池中计算完整哈希（hashlib 计算时会释放 GIL）
+    to_hash: List[Tuple[int, List[FileRef]]] = []
+    for (size, fingerprint), copies in by_fingerprint.items():
+        if size in archived:
+            to_hash.extend((size, refs) for refs in copies)
+        elif len(copies) < 2:
+            continue
+        elif complete[(size, fingerprint)]:
+            report.clusters.append(DuplicateCluster(size, fingerprint, copies))
+            report.fingerprint_candidates += len(copies)
+        else:
+            to_hash.extend((size, refs) for refs in copies)
+    for size, copies in archived.items():
+        to_hash.extend((size, refs) for refs in copies)
+    report.fingerprint_candidates += len(to_hash)
+
+    # 普通文件每个一个任务；压缩包成员按压缩包合成一个任务，顺序读取一遍（tar 不能随机访问，逐个读取是平方复杂度）
+    tasks: List[List[Tuple[int, List[FileRef]]]] = []
+    by_archive: Dict[str, List[Tuple[int, List[FileRef]]]] = {}
+    for size, refs in to_hash:
+        if is_archive_path(refs[0].folder):
+            by_archive.setdefault(refs[0].folder, []).append((size, refs))
+        else:
+            tasks.append([(size, refs)])
+    tasks.extend(by_archive.values())
+
+    def hash_task(items: List[Tuple[int, List[FileRef]]]) -> List[Tuple[int, List[FileRef], Optional[str], Optional[str]]]:
+        folder = items[0][1][0].folder
+        if not is_archive_path(folder):
+            size, refs = items[0]
+            try:
+                return [(size, refs, hash_entry(folder, refs[0].name), None)]
+            except Exception as e:
+                return [(size, refs, None, str(e))]
+
+        pending = {refs[0].name: (size, refs) for size, refs in items}
+        results = []
+        error = "压缩包中未找到该成员"
+        try:
+            for name, digest in iter_member_hashes(folder, list(pending)):
+                size, refs = pending.pop(name)
+                results.append((size, refs, digest, None))
+        except Exception as e:
+            error = str(e)
+        results.extend((size, refs, None, error) for size, refs in pending.values())
+        return results
+
+    by_digest: Dict[Tuple[int, str], List[List[FileRef]]] = {}
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(hash_task, tasks):
+            for size, refs, digest, error in results:
+                done += 1
+                if digest is None:
+                    report.errors[refs[0].display()] = error or "未知错误"
+                else:
+                    report.hashed_files += 1
+                    by_digest.setdefault((size, digest), []).append(refs)
+            if progress:
+                progress("哈希", done, len(to_hash))
+
+    report.clusters.extend(DuplicateCluster(size, digest, copies)
+                           for (size, digest), copies in by_digest.items() if len(copies) > 1)
+    report.clusters.sort(key=lambda cluster: (-cluster.reclaimable_bytes, cluster.digest))
+    return report
+
+
+def format_report(report: DuplicateReport, limit: int = 1000) -> str:
+    """生成文本格式的重复文件报告，最多列出 limit 个重复组"""
+    lines = [report.summary()]
+    for path, error in report.errors.items():
+        lines.append(f"无法读取 {path}: {error}")
+    for cluster in report.clusters[:limit]:
+        lines.append("")
+        lines.append(f"[{format_bytes(cluster.size)} × {len(cluster.copies)}，可回收 {format_bytes(cluster.reclaimable_bytes)}]")
+        for refs in cluster.copies:
+            lines.append("    " + refs[0].display())
+            for link in refs[1:]:
+                lines.append("      (硬链接) " + link.display())
+    if len(report.clusters) > limit:
+        lines.append("")
+        lines.append(f"... 另有 {len(report.clusters) - limit} 个重复组未列出")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="查找文件夹内部和文件夹之间的重复文件")
+    parser.add_argument('folders', nargs='+', help="要查找的文件夹或压缩包")
+    parser.add_argument('--top-level', action='store_true', help="只查找顶层文件，不包含子目录")
+    parser.add_argument('--min-size', type=int, default=1, help="最小文件大小（字节）")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="计算哈希的线程数")
+    args = parser.parse_args(argv)
+
+    def progress(stage, done, total):
+        print(f"\r{stage}: {done}/{total}", end='', flush=True)
+
+    report = find_duplicates(args.folders, not args.top_level, args.min_size, args.workers, progress)
+    print()
+    print(format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
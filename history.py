@@ -0,0 +1,247 @@
+"""
+比较历史模块
+把每次比较的文件分布记录到本地 SQLite 数据库，并计算两次比较之间的变化
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+from typing import List, Dict, Tuple, Iterator, NamedTuple, Optional
+
+from result_cache import cache_key, normalize_folder_set
+
+# 历史数据库路径
+HISTORY_DB = os.path.join(os.path.expanduser('~'), '.folder_compare', 'history.sqlite3')
+
+# 变化类型
+DELTA_NEW = "新出现的差异"
+DELTA_RESOLVED = "已解决的差异"
+DELTA_CHANGED = "分布发生变化"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS folder_sets (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    folders TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    folder_set_id INTEGER NOT NULL REFERENCES folder_sets(id),
+    created_at REAL NOT NULL,
+    recursive INTEGER NOT NULL,
+    folders TEXT NOT NULL,
+    common_count INTEGER NOT NULL,
+    differing_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_set ON runs(folder_set_id, created_at);
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+-- 只记录不是所有文件夹都存在的名称；pattern 为按规范化文件夹顺序排列的位掩码
+CREATE TABLE IF NOT EXISTS presence (
+    run_id INTEGER NOT NULL,
+    name_id INTEGER NOT NULL,
+    pattern INTEGER NOT NULL,
+    PRIMARY KEY (run_id, name_id)
+) WITHOUT ROWID;
+"""
+
+
+class RunInfo(NamedTuple):
+    """一次已记录的比较"""
+    id: int
+    created_at: float
+    recursive: bool
+    folders: List[str]
+    common_count: int
+    differing_count: int
+
+    def label(self) -> str:
+        """用于历史列表显示的文字"""
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.created_at))
+        mode = "递归" if self.recursive else "顶层"
+        return f"{stamp}  {mode}  差异 {self.differing_count}"
+
+
+def _canonical_order(folders: List[str]) -> List[int]:
+    """返回每个文件夹在规范化顺序中的位置"""
+    normalized = [os.path.normcase(os.path.abspath(folder)) for folder in folders]
+    canonical = normalize_folder_set(folders)
+    return [canonical.index(path) for path in normalized]
+
+
+def pattern_to_mask(pattern: Tuple[bool, ...], order: List[int]) -> int:
+    """把显示顺序的存在模式转换为规范化顺序的位掩码"""
+    mask = 0
+    for exists, position in zip(pattern, order):
+        if exists:
+            mask |= 1 << position
+    return mask
+
+
+def mask_to_pattern(mask: int, order: List[int]) -> Tuple[bool, ...]:
+    """把规范化顺序的位掩码转换为显示顺序的存在模式"""
+    return tuple(bool(mask & (1 << position)) for position in order)
+
+
+class HistoryStore:
+    """比较历史数据库"""
+
+    def __init__(self, path: str = HISTORY_DB):
+        """
+        Args:
+            path: 数据库文件路径
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _folder_set_id(self, folders: List[str], create: bool) -> Optional[int]:
+        key = cache_key(folders)
+        row = self._conn.execute("SELECT id FROM folder_sets WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            return row[0]
+        if not create:
+            return None
+        cursor = self._conn.execute("INSERT INTO folder_sets (key, folders) VALUES (?, ?)",
+                                    (key, json.dumps(normalize_folder_set(folders), ensure_ascii=False)))
+        return cursor.lastrowid
+
+    def record_run(self, folders: List[str], common_files: List[str],
+                   pattern_files: Dict[Tuple[bool, ...], List[str]], recursive: bool = False) -> int:
+        """
+        记录一次比较结果
+
+        Args:
+            folders: 文件夹列表（与模式元组顺序一致）
+            common_files: 共有文件列表
+            pattern_files: 文件分布模式字典
+            recursive: 是否为递归比较
+
+        Returns:
+            int: 记录编号
+        """
+        order = _canonical_order(folders)
+        rows = [(name, pattern_to_mask(pattern, order))
+                for pattern, files in pattern_files.items() for name in files]
+
+        with self._conn:
+            folder_set_id = self._folder_set_id(folders, create=True)
+            cursor = self._conn.execute(
+                "INSERT INTO runs (folder_set_id, created_at, recursive, folders, common_count, differing_count)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (folder_set_id, time.time(), int(recursive), json.dumps(folders, ensure_ascii=False),
+                 len(common_files), len(rows)))
+            run_id = cursor.lastrowid
+
+            # 通过临时表批量写入，名称只在 names 表中保存一次
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (name TEXT, pattern INTEGER)")
+            self._conn.execute("DELETE FROM incoming")
+            self._conn.executemany("INSERT INTO incoming VALUES (?, ?)", rows)
+            self._conn.execute("INSERT OR IGNORE INTO names (name) SELECT name FROM incoming")
+            self._conn.execute(
+                "INSERT INTO presence (run_id, name_id, pattern)"
+                " SELECT ?, names.id, incoming.pattern FROM incoming JOIN names ON names.name = incoming.name",
+                (run_id,))
+            self._conn.execute("DELETE FROM incoming")
+        return run_id
+
+    def list_runs(self, folders: List[str], recursive: Optional[bool] = None) -> List[RunInfo]:
+        """
+        列出同一组文件夹的历史记录（最新的在前）
+
+        Args:
+            folders: 文件夹列表（顺序可以与记录时不同）
+            recursive: 只列出递归（True）或顶层（False）比较的记录，None 时列出全部；
+                       两种模式的名称不同，不能相互对比
+
+        Returns:
+            List[RunInfo]: 历史记录列表
+        """
+        folder_set_id = self._folder_set_id(folders, create=False)
+        if folder_set_id is None:
+            return []
+        query = ("SELECT id, created_at, recursive, folders, common_count, differing_count FROM runs"
+                 " WHERE folder_set_id = ?")
+        params: Tuple = (folder_set_id,)
+        if recursive is not None:
+            query += " AND recursive = ?"
+            params += (int(recursive),)
+        rows = self._conn.execute(query + " ORDER BY created_at DESC", params)
+        return [RunInfo(row[0], row[1], bool(row[2]), json.loads(row[3]), row[4], row[5]) for row in rows]
+
+    def delta_counts(self, old_run: int, new_run: int) -> Dict[str, int]:
+        """统计两次比较之间各类变化的数量（只使用索引查询，不加载记录）"""
+        new_count = self._conn.execute(
+            "SELECT COUNT(*) FROM presence b WHERE b.run_id = ?"
+            " AND NOT EXISTS (SELECT 1 FROM presence a WHERE a.run_id = ? AND a.name_id = b.name_id)",
+            (new_run, old_run)).fetchone()[0]
+        resolved_count = self._conn.execute(
+            "SELECT COUNT(*) FROM presence a WHERE a.run_id = ?"
+            " AND NOT EXISTS (SELECT 1 FROM presence b WHERE b.run_id = ? AND b.name_id = a.name_id)",
+            (old_run, new_run)).fetchone()[0]
+        changed_count = self._conn.execute(
+            "SELECT COUNT(*) FROM presence a JOIN presence b ON b.run_id = ? AND b.name_id = a.name_id"
+            " WHERE a.run_id = ? AND a.pattern != b.pattern",
+            (new_run, old_run)).fetchone()[0]
+        return {DELTA_NEW: new_count, DELTA_RESOLVED: resolved_count, DELTA_CHANGED: changed_count}
+
+    def iter_delta(self, old_run: int, new_run: int, folders: List[str]
+                   ) -> Iterator[Tuple[str, str, Optional[Tuple[bool, ...]], Optional[Tuple[bool, ...]]]]:
+        """
+        逐条生成两次比较之间的变化
+
+        Args:
+            old_run: 较早的记录编号
+            new_run: 较新的记录编号
+            folders: 用于还原存在模式的文件夹显示顺序
+
+        Yields:
+            (变化类型, 名称, 旧存在模式, 新存在模式)，不存在的一侧为 None
+        """
+        order = _canonical_order(folders)
+
+        rows = self._conn.execute(
+            "SELECT n.name, b.pattern FROM presence b JOIN names n ON n.id = b.name_id WHERE b.run_id = ?"
+            " AND NOT EXISTS (SELECT 1 FROM presence a WHERE a.run_id = ? AND a.name_id = b.name_id)"
+            " ORDER BY n.name", (new_run, old_run))
+        for name, mask in rows:
+            yield DELTA_NEW, name, None, mask_to_pattern(mask, order)
+
+        rows = self._conn.execute(
+            "SELECT n.name, a.pattern FROM presence a JOIN names n ON n.id = a.name_id WHERE a.run_id = ?"
+            " AND NOT EXISTS (SELECT 1 FROM presence b WHERE b.run_id = ? AND b.name_id = a.name_id)"
+            " ORDER BY n.name", (old_run, new_run))
+        for name, mask in rows:
+            yield DELTA_RESOLVED, name, mask_to_pattern(mask, order), None
+
+        rows = self._conn.execute(
+            "SELECT n.name, a.pattern, b.pattern FROM presence a"
+            " JOIN presence b ON b.run_id = ? AND b.name_id = a.name_id"
+            " JOIN names n ON n.id = a.name_id WHERE a.run_id = ? AND a.pattern != b.pattern"
+            " ORDER BY n.name", (new_run, old_run))
+        for name, old_mask, new_mask in rows:
+            yield DELTA_CHANGED, name, mask_to_pattern(old_mask, order), mask_to_pattern(new_mask, order)
+
+    def delete_run(self, run_id: int) -> None:
+        """删除一条历史记录"""
+        with self._conn:
+            self._conn.execute("DELETE FROM presence WHERE run_id = ?", (run_id,))
+            self._conn.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+
+
+def open_history_store(path: str = HISTORY_DB) -> Optional[HistoryStore]:
+    """打开历史数据库，失败时返回 None"""
+    try:
+        return HistoryStore(path)
+    except Exception as e:
+        logging.error(f"打开比较历史数据库失败: {str(e)}")
+        print(f"打开比较历史数据库失败: {str(e)}")
+        return None
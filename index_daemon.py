@@ -0,0 +1,458 @@
+"""
+索引服务模块
+可选的后台服务，在内存中为登记过的文件夹保持增量更新的名称索引，
+界面和命令行通过本地 Unix 套接字查询比较结果，避免每次比较都从头扫描大型参考目录。
+服务未运行（或系统不支持 Unix 套接字）或在 timeout 秒内没有响应时，compare_with_index 直接在当前进程中比较。
+
+索引按 (文件夹, 是否递归, 符号链接处理方式) 区分。查询时若索引超过 max_age 秒未刷新，
+会借助目录状态缓存重新验证（只重新读取修改时间变化的目录）；后台线程也会定期刷新登记的索引。
+估算内存超过上限时，最久未使用的索引会被释放，下次查询时重新建立。
+
+用法:
+    python index_daemon.py serve [--memory-limit 512] [--refresh 30]
+    python index_daemon.py register 文件夹1 文件夹2 ... [--recursive]
+    python index_daemon.py compare 文件夹1 文件夹2 ... [--recursive]
+    python index_daemon.py status
+    python index_daemon.py stop
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import socket
+import struct
+import logging
+import argparse
+import threading
+import socketserver
+from typing import List, Dict, Tuple, Set, Any, Optional
+
+from core import compare_multiple_folders, build_presence_matrix, is_comparable_path, list_folder_names
+from scanner import ScanCache, LINK_LEAF, LINK_POLICIES
+from result_cache import CACHE_DIR, folder_signature
+
+# 套接字路径
+SOCKET_PATH = os.path.join(os.path.dirname(CACHE_DIR), 'indexd.sock')
+
+# 默认内存上限（字节）和后台刷新间隔（秒）
+DEFAULT_MEMORY_LIMIT = 512 * 1024 * 1024
+DEFAULT_REFRESH_INTERVAL = 30.0
+
+# 比较请求等待服务响应的默认时间（秒），服务首次为很大的文件夹建立索引时可能超时，此时改为直接比较
+DEFAULT_REQUEST_TIMEOUT = 30.0
+
+# 每个名称在集合和目录缓存中的大致开销（字节），用于估算索引占用的内存
+_PER_NAME_OVERHEAD = 160
+
+# 消息格式: 4 字节长度 + zlib 压缩的 JSON
+_LENGTH = struct.Struct('!I')
+
+# 索引键: (文件夹, 是否递归, 符号链接处理方式)
+IndexKey = Tuple[str, bool, str]
+
+
+def _send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    data = zlib.compress(json.dumps(message, ensure_ascii=False).encode('utf-8'), 1)
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("连接已关闭")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_message(sock: socket.socket) -> Dict[str, Any]:
+    length, = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return json.loads(zlib.decompress(_recv_exact(sock, length)).decode('utf-8'))
+
+
+class FolderIndex:
+    """一个文件夹的内存索引"""
+
+    def __init__(self, key: IndexKey, pinned: bool = False):
+        self.key = key
+        self.pinned = pinned          # 是否为登记的文件夹（后台定期刷新）
+        self.scan_cache = ScanCache()
+        self.names: Optional[Set[str]] = None
+        self.signature = -1
+        self.refreshed_at = 0.0
+        self.last_used = 0.0
+        self.hits = 0
+        self.estimated_bytes = 0
+        self.lock = threading.Lock()
+
+    def refresh(self) -> Set[str]:
+        """重新验证索引，只重新读取发生变化的部分"""
+        folder, recursive, link_policy = self.key
+        if recursive:
+            self.scan_cache.reset_report()
+            self.names = list_folder_names(folder, True, self.scan_cache, link_policy)
+        else:
+            # 顶层比较只需检查文件夹本身的修改时间
+            signature = folder_signature(folder)
+            if self.names is None or signature == -1 or signature != self.signature:
+                self.names = list_folder_names(folder)
+            self.signature = signature
+        self.refreshed_at = time.monotonic()
+        self.estimated_bytes = sum(len(name) for name in self.names) + _PER_NAME_OVERHEAD * len(self.names)
+        return self.names
+
+    def release(self) -> None:
+        """释放内存中的索引数据"""
+        self.names = None
+        self.scan_cache = ScanCache()
+        self.signature = -1
+        self.estimated_bytes = 0
+
+
+class IndexService:
+    """管理所有索引，处理查询、刷新和淘汰"""
+
+    def __init__(self, memory_limit: int = DEFAULT_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.indexes: Dict[IndexKey, FolderIndex] = {}
+        self._lock = threading.Lock()
+
+    def _get_index(self, key: IndexKey, pin: bool = False) -> FolderIndex:
+        with self._lock:
+            index = self.indexes.get(key)
+            if index is None:
+                index = self.indexes[key] = FolderIndex(key, pin)
+            index.pinned = index.pinned or pin
+            index.last_used = time.monotonic()
+            return index
+
+    def get_names(self, key: IndexKey, max_age: float) -> Set[str]:
+        """返回文件夹的名称集合，索引过旧时先重新验证"""
+        index = self._get_index(key)
+        with index.lock:
+            index.hits += 1
+            if index.names is None or time.monotonic() - index.refreshed_at > max_age:
+                names = index.refresh()
+            else:
+                names = index.names
+        return names
+
+    def register(self, key: IndexKey) -> None:
+        """登记文件夹并立即建立索引"""
+        index = self._get_index(key, pin=True)
+        with index.lock:
+            index.refresh()
+        self.evict()
+
+    def unregister(self, key: IndexKey) -> None:
+        with self._lock:
+            self.indexes.pop(key, None)
+
+    def compare(self, folders: List[str], recursive: bool, link_policy: str,
+                max_age: float) -> Tuple[List[str], Dict[Tuple[bool, ...], List[str]], List[str]]:
+        """使用索引比较多个文件夹，返回值与 compare_multiple_folders 相同"""
+        folder_files: Dict[str, Set[str]] = {}
+        valid_folders: List[str] = []
+        for folder in folders:
+            if not is_comparable_path(folder):
+                logging.warning(f"文件夹不存在或不是文件夹/压缩包: {folder}")
+                continue
+            try:
+                folder_files[folder] = self.get_names((folder, recursive, link_policy), max_age)
+                valid_folders.append(folder)
+            except Exception as e:
+                logging.error(f"读取文件夹失败 {folder}: {str(e)}")
+        # 本次比较用到的名称集合已被引用，淘汰只影响之后的查询
+        self.evict()
+        if not folder_files:
+            return [], {}, valid_folders
+        common_files, pattern_files = build_presence_matrix(folder_files, valid_folders)
+        return common_files, pattern_files, valid_folders
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(index.estimated_bytes for index in self.indexes.values())
+
+    def evict(self) -> None:
+        """估算内存超过上限时，按最近使用时间从旧到新释放索引"""
+        # 在锁内取索引和总量的快照，之后按释放的字节数递减，不在锁外遍历 self.indexes
+        with self._lock:
+            total = sum(index.estimated_bytes for index in self.indexes.values())
+            if total <= self.memory_limit:
+                return
+            loaded = sorted((index for index in self.indexes.values() if index.names is not None),
+                            key=lambda index: index.last_used)
+        for index in loaded[:-1]:
+            if total <= self.memory_limit:
+                break
+            # 正在刷新或查询的索引跳过
+            if not index.lock.acquire(blocking=False):
+                continue
+            try:
+                logging.info(f"内存超过上限，释放索引: {index.key[0]}")
+                total -= index.estimated_bytes
+                index.release()
+            finally:
+                index.lock.release()
+            # 登记过的文件夹保留登记信息，下次查询时重新建立
+            if not index.pinned:
+                with self._lock:
+                    self.indexes.pop(index.key, None)
+
+    def refresh_pinned(self) -> None:
+        """后台刷新登记过且仍在内存中的索引"""
+        with self._lock:
+            pinned = [index for index in self.indexes.values() if index.pinned and index.names is not None]
+        for index in pinned:
+            if index.lock.acquire(blocking=False):
+                try:
+                    index.refresh()
+                except Exception as e:
+                    logging.error(f"刷新索引失败 {index.key[0]}: {str(e)}")
+                finally:
+                    index.lock.release()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            indexes = [{
+                'folder': index.key[0],
+                'recursive': index.key[1],
+                'link_policy': index.key[2],
+                'pinned': index.pinned,
+                'loaded': index.names is not None,
+                'names': len(index.names) if index.names is not None else 0,
+                'estimated_bytes': index.estimated_bytes,
+                'hits': index.hits,
+                'age_seconds': round(time.monotonic() - index.refreshed_at, 1) if index.refreshed_at else None,
+            } for index in self.indexes.values()]
+        return {'memory_limit': self.memory_limit, 'estimated_bytes': sum(index['estimated_bytes'] for index in indexes),
+                'indexes': indexes}
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """处理一个连接上的请求"""
+
+    def handle(self) -> None:
+        service: IndexService = self.server.service
+        try:
+            request = _recv_message(self.request)
+        except Exception as e:
+            logging.warning(f"读取请求失败: {str(e)}")
+            return
+
+        op = None
+        try:
+            op = request.get('op')
+            recursive = bool(request.get('recursive', False))
+            link_policy = request.get('link_policy', LINK_LEAF)
+            if link_policy not in LINK_POLICIES:
+                link_policy = LINK_LEAF
+
+            if op == 'compare':
+                common_files, pattern_files, valid_folders = service.compare(
+                    request['folders'], recursive, link_policy, float(request.get('max_age', 0.0)))
+                response: Dict[str, Any] = {
+                    'ok': True,
+                    'folders': valid_folders,
+                    'common': common_files,
+                    'patterns': [[[int(exists) for exists in pattern], files]
+                                 for pattern, files in pattern_files.items()],
+                }
+            elif op == 'register':
+                for folder in request['folders']:
+                    service.register((folder, recursive, link_policy))
+                response = {'ok': True}
+            elif op == 'unregister':
+                for folder in request['folders']:
+                    service.unregister((folder, recursive, link_policy))
+                response = {'ok': True}
+            elif op == 'status':
+                response = {'ok': True, 'status': service.status()}
+            elif op == 'stop':
+                response = {'ok': True}
+            else:
+                response = {'ok': False, 'error': f"未知的请求: {op}"}
+        except Exception as e:
+            logging.error(f"处理请求失败: {str(e)}")
+            response = {'ok': False, 'error': str(e)}
+
+        try:
+            _send_message(self.request, response)
+        except OSError as e:
+            logging.warning(f"发送响应失败: {str(e)}")
+
+        # 先回复再停止服务，否则进程可能在响应发出前退出
+        if op == 'stop' and response.get('ok'):
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+
+def serve(socket_path: str = SOCKET_PATH, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+          refresh_interval: float = DEFAULT_REFRESH_INTERVAL) -> None:
+    """
+    运行索引服务，直到收到 stop 请求
+
+    Args:
+        socket_path (str): Unix 套接字路径
+        memory_limit (int): 索引估算内存上限（字节）
+        refresh_interval (float): 登记文件夹的后台刷新间隔（秒）
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError("当前系统不支持 Unix 套接字")
+
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+    if os.path.exists(socket_path):
+        if daemon_available(socket_path):
+            raise OSError(f"索引服务已在运行: {socket_path}")
+        # 上次异常退出留下的套接字文件
+        os.unlink(socket_path)
+
+    server = socketserver.ThreadingUnixStreamServer(socket_path, _RequestHandler)
+    server.daemon_threads = True
+    server.service = IndexService(memory_limit)
+    os.chmod(socket_path, 0o600)
+
+    stop_event = threading.Event()
+
+    def refresher():
+        while not stop_event.wait(refresh_interval):
+            server.service.refresh_pinned()
+
+    threading.Thread(target=refresher, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        stop_event.set()
+        server.server_close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+
+
+def request_daemon(message: Dict[str, Any], socket_path: str = SOCKET_PATH,
+                   timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    向索引服务发送请求
+
+    Returns:
+        Optional[Dict[str, Any]]: 响应，服务未运行或无法连接时返回 None
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            _send_message(sock, message)
+            return _recv_message(sock)
+    except (OSError, ValueError, zlib.error) as e:
+        logging.warning(f"连接索引服务失败: {str(e)}")
+        return None
+
+
+def daemon_available(socket_path: str = SOCKET_PATH) -> bool:
+    """检查索引服务是否正在运行"""
+    response = request_daemon({'op': 'status'}, socket_path, timeout=1.0)
+    return bool(response and response.get('ok'))
+
+
+def compare_with_index(folders: List[str], recursive: bool = False, link_policy: str = LINK_LEAF,
+                       max_age: float = 2.0, socket_path: str = SOCKET_PATH,
+                       timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT, fallback: bool = True
+                       ) -> Optional[Tuple[List[str], Dict[Tuple[bool, ...], List[str]], List[str], bool]]:
+    """
+    优先通过索引服务比较多个文件夹，服务不可用时在当前进程中直接比较
+
+    Args:
+        folders (List[str]): 要比较的文件夹或压缩包路径列表
+        recursive (bool): 是否递归比较子目录
+        link_policy (str): 递归扫描时符号链接的处理方式
+        max_age (float): 索引在多少秒内刷新过即可直接使用
+        socket_path (str): Unix 套接字路径
+        timeout (Optional[float]): 等待服务响应的秒数，超时视为服务不可用；None 表示一直等待
+        fallback (bool): 服务不可用时是否直接比较，为 False 时返回 None，
+            由调用方自行比较（例如需要取消、进度或扫描预算时）
+
+    Returns:
+        Optional[Tuple]: (共有文件列表, 文件分布模式字典, 参与比较的文件夹, 是否使用了索引服务)
+    """
+    # 服务进程的工作目录不同，发送绝对路径，返回时换回调用方的路径
+    absolute = {os.path.abspath(folder): folder for folder in folders}
+    response = request_daemon({'op': 'compare', 'folders': list(absolute), 'recursive': recursive,
+                               'link_policy': link_policy, 'max_age': max_age}, socket_path, timeout)
+    if response and response.get('ok'):
+        pattern_files = {tuple(bool(bit) for bit in pattern): files for pattern, files in response['patterns']}
+        valid_folders = [absolute.get(folder, folder) for folder in response['folders']]
+        return response['common'], pattern_files, valid_folders, True
+    if response is not None:
+        logging.error(f"索引服务比较失败: {response.get('error')}")
+    if not fallback:
+        return None
+
+    common_files, pattern_files, valid_folders = compare_multiple_folders(
+        folders, recursive, link_policy=link_policy)
+    return common_files, pattern_files, valid_folders, False
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="文件夹索引服务")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="运行索引服务")
+    serve_parser.add_argument('--memory-limit', type=int, default=DEFAULT_MEMORY_LIMIT // (1024 * 1024),
+                              help="索引内存上限（MB）")
+    serve_parser.add_argument('--refresh', type=float, default=DEFAULT_REFRESH_INTERVAL,
+                              help="登记文件夹的后台刷新间隔（秒）")
+
+    for command, help_text in (('register', "登记文件夹并建立索引"), ('unregister', "取消登记文件夹"),
+                               ('compare', "比较文件夹（服务未运行时直接比较）")):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument('folders', nargs='+')
+        sub.add_argument('-r', '--recursive', action='store_true', help="包含子目录")
+        sub.add_argument('--link-policy', choices=LINK_POLICIES, default=LINK_LEAF, help="符号链接处理方式")
+
+    subparsers.add_parser('status', help="显示服务状态")
+    subparsers.add_parser('stop', help="停止服务")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        logging.getLogger().setLevel(logging.INFO)
+        try:
+            serve(memory_limit=args.memory_limit * 1024 * 1024, refresh_interval=args.refresh)
+        except OSError as e:
+            print(f"启动索引服务失败: {str(e)}")
+            return 1
+        return 0
+
+    if args.command == 'compare':
+        start = time.perf_counter()
+        common_files, pattern_files, valid_folders, used = compare_with_index(
+            args.folders, args.recursive, args.link_policy)
+        print(f"{'通过索引服务' if used else '直接'}比较 {len(valid_folders)} 个文件夹，"
+              f"耗时 {time.perf_counter() - start:.2f}s")
+        print(f"共有 {len(common_files)} 个，差异 {sum(len(files) for files in pattern_files.values())} 个")
+        return 0
+
+    message: Dict[str, Any] = {'op': args.command}
+    if args.command in ('register', 'unregister'):
+        message.update(folders=[os.path.abspath(folder) for folder in args.folders],
+                       recursive=args.recursive, link_policy=args.link_policy)
+    response = request_daemon(message)
+    if response is None:
+        print("索引服务未运行")
+        return 1
+    if not response.get('ok'):
+        print(f"请求失败: {response.get('error')}")
+        return 1
+    if args.command == 'status':
+        print(json.dumps(response['status'], ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
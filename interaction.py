@@ -3,15 +3,26 @@
 实现右键菜单和用户交互功能
 """
 
+import tempfile
 import tkinter as tk
 from tkinter import messagebox
+from typing import Iterator
 import pyperclip  # 用于剪贴板操作
 
+from core import describe_pattern
+
+# 结果区域中文本组件共用的绑定标签，右键菜单只在该标签上绑定一次
+RESULT_WIDGET_TAG = "FolderCompareResult"
+
+# 复制到剪贴板的最大行数，超出时改为写入临时文件
+CLIPBOARD_LINE_LIMIT = 100000
+
 
 class InteractionManager:
     """管理用户交互功能的类"""
     
-    def __init__(self, root_window, path_entry, results_frame, compare_function):
+    def __init__(self, root_window, path_entry, results_frame, compare_function, scan_report_function=None,
+                 model_function=None):
         """
         初始化交互管理器
         
@@ -19,12 +30,19 @@ class InteractionManager:
             root_window: 主窗口对象
             path_entry: 路径输入框
             results_frame: 结果显示框架
-            compare_function: 执行比较的函数
+            compare_function: 执行比较的函数（递归模式下会增量扫描，只重新读取修改过的目录）
+            scan_report_function: 返回上次扫描目录复用统计的函数（可选）
+            model_function: 返回当前比较结果模型（PresenceModel）的函数，用于批量复制（可选）
         """
         self.root_window = root_window
         self.path_entry = path_entry
         self.results_frame = results_frame
         self.compare_function = compare_function
+        self.scan_report_function = scan_report_function
+        self.model_function = model_function
+
+        # 结果组件路径到其对应分布模式的映射
+        self._widget_groups = {}
         
         # 绑定右键菜单事件
         self._bind_right_click_menus()
@@ -37,27 +55,25 @@ class InteractionManager:
         # 为结果框架绑定右键菜单
         self.results_frame.bind("<Button-3>", self._show_results_menu)
         
-        # 为结果框架内的所有文本组件绑定右键菜单
-        self.results_frame.bind("<Button-3>", self._show_text_copy_menu, add="+")
-        
-        # 绑定子组件的右键事件
-        self.results_frame.bind("<Button-3>", self._bind_child_events, add="+")
-    
-    def _bind_child_events(self, event):
-        """绑定子组件的事件"""
-        # 为新创建的文本组件绑定右键菜单
-        for child in self.results_frame.winfo_children():
-            self._bind_widget_events(child)
-    
-    def _bind_widget_events(self, widget):
-        """递归绑定组件事件"""
-        # 为Text和Listbox组件绑定右键菜单
-        if isinstance(widget, (tk.Text, tk.Listbox)):
-            widget.bind("<Button-3>", self._show_text_copy_menu_for_widget, add="+")
+        # 结果区域的文本组件通过共用的绑定标签分派事件，无论结果多少，每次点击的开销都是常数
+        self.root_window.bind_class(RESULT_WIDGET_TAG, "<Button-3>", self._show_result_widget_menu)
+        self.root_window.bind_class(RESULT_WIDGET_TAG, "<Destroy>", self._forget_result_widget)
+    
+    def register_result_widget(self, widget, pattern=None):
+        """
+        登记结果区域中新建的文本组件，使其使用共用的右键菜单
         
-        # 递归处理子组件
-        for child in widget.winfo_children():
-            self._bind_widget_events(child)
+        Args:
+            widget: Text 或 Listbox 组件
+            pattern: 该组件显示的文件分布模式（可选），用于"复制整个分组"
+        """
+        widget.bindtags((RESULT_WIDGET_TAG,) + widget.bindtags())
+        if pattern is not None:
+            self._widget_groups[str(widget)] = pattern
+    
+    def _forget_result_widget(self, event):
+        """组件销毁时移除其分组记录"""
+        self._widget_groups.pop(str(event.widget), None)
     
     def _show_path_entry_menu(self, event):
         """
@@ -93,26 +109,14 @@ class InteractionManager:
     
     def _show_results_menu(self, event):
         """
-        显示比较结果区域的右键菜单（未选中文本时）
+        显示比较结果区域的右键菜单
         
         Args:
             event: 鼠标事件
         """
-        # 检查是否点击在文本组件上
-        widget = event.widget
-        if isinstance(widget, (tk.Text, tk.Listbox)):
-            # 如果是文本组件且有选中文本，则显示复制菜单
-            try:
-                if widget.selection_get():
-                    self._show_text_copy_menu(event)
-                    return
-            except tk.TclError:
-                # 没有选中文本，继续显示刷新菜单
-                pass
-        
-        # 创建右键菜单
         menu = tk.Menu(self.root_window, tearoff=0)
-        menu.add_command(label="刷新比较结果", command=self.compare_function)
+        self._add_bulk_commands(menu)
+        self._add_refresh_commands(menu)
         
         # 显示菜单
         try:
@@ -120,61 +124,120 @@ class InteractionManager:
         finally:
             menu.grab_release()
     
-    def _show_text_copy_menu(self, event):
+    def _show_result_widget_menu(self, event):
         """
-        显示文本复制的右键菜单
+        显示结果文本组件的右键菜单：复制选中内容、复制整个分组、复制全部差异和刷新
         
         Args:
             event: 鼠标事件
         """
         widget = event.widget
-        
-        # 检查是否有选中文本
+        menu = tk.Menu(self.root_window, tearoff=0)
+
+        selected_text = self._get_widget_selection(widget)
+        if selected_text:
+            menu.add_command(label="复制", command=lambda: self._copy_text(selected_text))
+
+        pattern = self._widget_groups.get(str(widget))
+        if pattern is not None:
+            menu.add_command(label="复制整个分组", command=lambda: self._copy_lines(self._iter_group_lines([pattern])))
+
+        if selected_text or pattern is not None:
+            menu.add_separator()
+        self._add_bulk_commands(menu)
+        self._add_refresh_commands(menu)
+
         try:
-            selected_text = widget.selection_get()
-            if selected_text:
-                # 创建右键菜单
-                menu = tk.Menu(self.root_window, tearoff=0)
-                menu.add_command(label="复制", command=lambda: self._copy_text(selected_text))
-                
-                # 显示菜单
-                try:
-                    menu.tk_popup(event.x_root, event.y_root)
-                finally:
-                    menu.grab_release()
+            menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            menu.grab_release()
+        return "break"
+    
+    def _add_bulk_commands(self, menu):
+        """添加批量复制和导出命令"""
+        if self.model_function is None or self.model_function() is None:
+            return
+        menu.add_command(label="复制全部差异", command=lambda: self._copy_lines(self._iter_difference_lines()))
+        menu.add_command(label="导出全部差异到临时文件", command=lambda: self._export_lines(self._iter_difference_lines()))
+        menu.add_separator()
+    
+    def _add_refresh_commands(self, menu):
+        """添加刷新命令和上次增量扫描的目录复用统计"""
+        menu.add_command(label="刷新比较结果", command=self._refresh_results)
+
+        report = self.scan_report_function() if self.scan_report_function else ""
+        if report:
+            menu.add_command(label=f"上次扫描: {report}", state='disabled')
+    
+    def _get_widget_selection(self, widget):
+        """获取组件自身选中的文本（不使用全局 PRIMARY 选区）"""
+        try:
+            if isinstance(widget, tk.Listbox):
+                return '\n'.join(widget.get(index) for index in widget.curselection())
+            if isinstance(widget, tk.Text) and widget.tag_ranges('sel'):
+                return widget.get('sel.first', 'sel.last')
         except tk.TclError:
-            # 没有选中文本，显示刷新菜单
-            self._show_results_menu(event)
+            pass
+        return ""
+    
+    def _iter_group_lines(self, patterns) -> Iterator[str]:
+        """按分组逐行生成名称，直接读取比较结果数据而不是组件内容"""
+        model = self.model_function() if self.model_function else None
+        if model is None:
+            return
+        for pattern in patterns:
+            files = model.groups.get(pattern, [])
+            if len(patterns) > 1:
+                yield f"[{describe_pattern(pattern)}] ({len(files)} 个)"
+            yield from files
+    
+    def _iter_difference_lines(self) -> Iterator[str]:
+        """逐行生成所有不是全部文件夹共有的名称"""
+        model = self.model_function() if self.model_function else None
+        if model is None:
+            return
+        patterns = [pattern for pattern in model.groups if pattern != model.all_true_pattern]
+        yield from self._iter_group_lines(sorted(patterns, reverse=True))
     
-    def _show_text_copy_menu_for_widget(self, event):
+    def _copy_lines(self, lines: Iterator[str]):
         """
-        为特定组件显示文本复制的右键菜单
+        复制多行文本到剪贴板，行数过多时改为写入临时文件
         
         Args:
-            event: 鼠标事件
+            lines: 逐行生成的文本
         """
-        widget = event.widget
+        buffered = []
+        for line in lines:
+            buffered.append(line)
+            if len(buffered) > CLIPBOARD_LINE_LIMIT:
+                self._export_lines(iter(buffered), lines)
+                return
+        self._copy_text('\n'.join(buffered))
+    
+    def _export_lines(self, *line_sources: Iterator[str]):
+        """
+        逐行写入临时文件，并把文件路径复制到剪贴板
         
-        # 检查是否有选中文本
+        Args:
+            line_sources: 依次写入的行迭代器
+        """
         try:
-            selected_text = widget.selection_get()
-            if selected_text:
-                # 创建右键菜单
-                menu = tk.Menu(self.root_window, tearoff=0)
-                menu.add_command(label="复制", command=lambda: self._copy_text(selected_text))
-                
-                # 显示菜单
-                try:
-                    menu.tk_popup(event.x_root, event.y_root)
-                finally:
-                    menu.grab_release()
-            else:
-                # 没有选中文本，显示刷新菜单
-                self._show_results_menu(event)
-        except tk.TclError:
-            # 没有选中文本，显示刷新菜单
-            self._show_results_menu(event)
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.txt',
+                                             prefix='folder_compare_', delete=False) as fp:
+                for lines in line_sources:
+                    for line in lines:
+                        fp.write(line)
+                        fp.write('\n')
+                path = fp.name
+            pyperclip.copy(path)
+            messagebox.showinfo("导出完成", f"已写入临时文件（路径已复制到剪贴板）:\n{path}")
+        except Exception as e:
+            messagebox.showerror("错误", f"导出失败: {str(e)}")
     
+    def _refresh_results(self):
+        """刷新比较结果（目录复用统计由比较函数显示在状态栏，菜单项中也会显示）"""
+        self.compare_function()
+
     def _copy_text(self, text):
         """
         复制文本到剪贴板
@@ -188,7 +251,8 @@ class InteractionManager:
             messagebox.showerror("错误", f"复制文本失败: {str(e)}")
 
 
-def setup_context_menus(window, path_entry, results_frame, compare_function):
+def setup_context_menus(window, path_entry, results_frame, compare_function, scan_report_function=None,
+                        model_function=None):
     """
     设置上下文菜单
     
@@ -197,6 +261,8 @@ def setup_context_menus(window, path_entry, results_frame, compare_function):
         path_entry: 路径输入框组件
         results_frame: 结果显示框架
         compare_function: 刷新比较结果的函数
+        scan_report_function: 返回上次扫描目录复用统计的函数（可选）
+        model_function: 返回当前比较结果模型的函数（可选）
     """
     try:
         # 创建交互管理器实例
@@ -204,7 +270,9 @@ def setup_context_menus(window, path_entry, results_frame, compare_function):
             window, 
             path_entry, 
             results_frame, 
-            compare_function
+            compare_function,
+            scan_report_function,
+            model_function
         )
         return interaction_manager
     except Exception as e:
@@ -0,0 +1,109 @@
+"""
+重叠矩阵模块
+根据文件分布结果计算 N 个文件夹两两之间的共有数量、各自独有数量和 Jaccard 相似度
+"""
+
+import heapq
+from typing import List, Dict, Tuple, Iterator
+
+# 位计数: Python 3.10 起整数自带 bit_count
+if hasattr(int, 'bit_count'):
+    def _popcount(value: int) -> int:
+        return value.bit_count()
+else:
+    def _popcount(value: int) -> int:
+        return bin(value).count('1')
+
+
+class OverlapReport:
+    """N×N 重叠统计"""
+
+    def __init__(self, folders: List[str], counts: List[int], shared: List[List[int]]):
+        """
+        Args:
+            folders: 文件夹列表
+            counts: 每个文件夹中的名称数量
+            shared: shared[i][j] 为文件夹 i 和 j 共有的名称数量
+        """
+        self.folders = folders
+        self.counts = counts
+        self.shared = shared
+
+    def unique(self, i: int, j: int) -> int:
+        """文件夹 i 中存在而文件夹 j 中不存在的名称数量"""
+        return self.counts[i] - self.shared[i][j]
+
+    def jaccard(self, i: int, j: int) -> float:
+        """文件夹 i 和 j 的 Jaccard 相似度"""
+        union = self.counts[i] + self.counts[j] - self.shared[i][j]
+        return self.shared[i][j] / union if union else 1.0
+
+
+def presence_bitsets(groups: Dict[Tuple[bool, ...], List[str]], folder_count: int) -> List[int]:
+    """
+    为每个文件夹构建按位压缩的存在列
+
+    所有名称按分组依次编号，同一分组的名称占据连续的位，
+    因此每个文件夹的位集只需对每个分组做一次移位或运算，而不是逐个名称设置。
+
+    Args:
+        groups: 存在模式到名称列表的映射（包括所有文件夹共有的分组）
+        folder_count: 文件夹数量
+
+    Returns:
+        List[int]: 每个文件夹的位集（Python 大整数）
+    """
+    bitsets = [0] * folder_count
+    offset = 0
+    for pattern, files in groups.items():
+        if not files:
+            continue
+        block = ((1 << len(files)) - 1) << offset
+        for i, exists in enumerate(pattern):
+            if exists:
+                bitsets[i] |= block
+        offset += len(files)
+    return bitsets
+
+
+def compute_overlap(groups: Dict[Tuple[bool, ...], List[str]], folders: List[str]) -> OverlapReport:
+    """
+    计算重叠矩阵: 对位集两两做与运算并计数
+
+    Args:
+        groups: 存在模式到名称列表的映射（包括所有文件夹共有的分组）
+        folders: 文件夹列表（与模式元组顺序一致）
+
+    Returns:
+        OverlapReport: 重叠统计
+    """
+    bitsets = presence_bitsets(groups, len(folders))
+    counts = [_popcount(bits) for bits in bitsets]
+    shared = [[0] * len(folders) for _ in folders]
+    for i in range(len(folders)):
+        shared[i][i] = counts[i]
+        for j in range(i + 1, len(folders)):
+            shared[i][j] = shared[j][i] = _popcount(bitsets[i] & bitsets[j])
+    return OverlapReport(folders, counts, shared)
+
+
+def iter_cell_names(groups: Dict[Tuple[bool, ...], List[str]], i: int, j: int, kind: str) -> Iterator[str]:
+    """
+    列出矩阵单元格对应的名称（按名称排序）
+
+    Args:
+        groups: 存在模式到名称列表的映射
+        i, j: 文件夹序号
+        kind: "shared" 两者共有，"only_i" 仅 i 有，"only_j" 仅 j 有
+
+    Yields:
+        str: 名称
+    """
+    selected = []
+    for pattern, files in groups.items():
+        in_i, in_j = pattern[i], pattern[j]
+        if (kind == "shared" and in_i and in_j) or (kind == "only_i" and in_i and not in_j) \
+                or (kind == "only_j" and in_j and not in_i):
+            selected.append(files)
+    # 各分组内部已排序，合并后整体有序
+    yield from heapq.merge(*selected)
@@ -0,0 +1,355 @@
+"""
+结果缓存模块
+跨会话持久化每组文件夹的最近一次比较结果，支持"先显示旧结果、后台重新验证"
+"""
+
+import os
+import json
+import zlib
+import time
+import base64
+import hashlib
+import logging
+from typing import List, Dict, Tuple, Set, Optional
+
+from core import is_comparable_path, list_folder_names
+from archive import split_archive_path, is_archive_path
+from scanner import ScanCache, DirState, LINK_LEAF
+
+# 缓存目录
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.folder_compare', 'cache')
+
+# 记录上次会话文件夹列表的文件
+LAST_SESSION_FILE = os.path.join(os.path.dirname(CACHE_DIR), 'last_session.json')
+
+# 最多保留的缓存条目数，超出后删除最久未使用的条目
+MAX_CACHE_ENTRIES = 50
+
+# 缓存格式版本，格式变化时旧缓存自动失效
+CACHE_VERSION = 2
+
+
+class CachedComparison:
+    """一次已缓存的比较结果（按文件夹保存名称集合，便于只重新扫描变化的文件夹）"""
+
+    def __init__(self, folders: List[str], folder_files: Dict[str, Set[str]],
+                 signatures: Dict[str, int], saved_at: float, recursive: bool = False,
+                 link_policy: str = LINK_LEAF, dir_states: Optional[Dict[str, DirState]] = None):
+        """
+        Args:
+            folders: 参与比较的文件夹列表
+            folder_files: 文件夹路径到名称集合的映射
+            signatures: 文件夹路径到扫描时修改时间签名的映射
+            saved_at: 保存时间戳
+            recursive: 是否为递归比较的结果
+            link_policy: 递归比较时符号链接的处理方式
+            dir_states: 递归比较时各目录的状态（同 ScanCache.dirs），用于重新验证时跳过未变化的目录
+        """
+        self.folders = folders
+        self.folder_files = folder_files
+        self.signatures = signatures
+        self.saved_at = saved_at
+        self.recursive = recursive
+        self.link_policy = link_policy
+        self.dir_states = dir_states if dir_states is not None else {}
+
+
+def normalize_folder_set(folders: List[str]) -> List[str]:
+    """
+    规范化文件夹列表用于生成缓存键（与顺序无关、忽略大小写差异）
+
+    Args:
+        folders (List[str]): 文件夹路径列表
+
+    Returns:
+        List[str]: 排序后的规范化路径列表
+    """
+    return sorted(os.path.normcase(os.path.abspath(folder)) for folder in folders)
+
+
+def cache_key(folders: List[str], recursive: bool = False, link_policy: str = LINK_LEAF) -> str:
+    """根据规范化的文件夹列表生成缓存键，递归比较的结果按符号链接处理方式分别缓存"""
+    joined = '\n'.join(normalize_folder_set(folders))
+    if recursive:
+        joined += f"\n\nrecursive:{link_policy}"
+    return hashlib.sha1(joined.encode('utf-8')).hexdigest()
+
+
+def folder_signature(folder: str) -> int:
+    """
+    获取文件夹的修改时间签名
+
+    目录的 mtime 会在其直接子项被添加、删除或重命名时改变，正好覆盖名称比较所需的信息；
+    压缩包使用文件本身的 mtime 和大小。
+
+    Args:
+        folder (str): 文件夹或压缩包路径
+
+    Returns:
+        int: 签名值，无法访问时返回 -1
+    """
+    try:
+        archive_path = split_archive_path(folder)[0]
+        if archive_path:
+            st = os.stat(archive_path)
+            return st.st_mtime_ns ^ st.st_size
+        return os.stat(folder).st_mtime_ns
+    except OSError:
+        return -1
+
+
+def folder_signatures(folders: List[str]) -> Dict[str, int]:
+    """获取多个文件夹的修改时间签名"""
+    return {folder: folder_signature(folder) for folder in folders}
+
+
+def presence_to_folder_files(common_files: List[str],
+                             pattern_files: Dict[Tuple[bool, ...], List[str]],
+                             folders: List[str]) -> Dict[str, Set[str]]:
+    """
+    由比较结果还原各文件夹的名称集合
+
+    Args:
+        common_files: 共有文件列表
+        pattern_files: 文件分布模式字典
+        folders: 文件夹列表（与模式元组顺序一致）
+
+    Returns:
+        Dict[str, Set[str]]: 文件夹路径到名称集合的映射
+    """
+    folder_files: Dict[str, Set[str]] = {folder: set(common_files) for folder in folders}
+    for pattern, files in pattern_files.items():
+        for folder, exists in zip(folders, pattern):
+            if exists:
+                folder_files[folder].update(files)
+    return folder_files
+
+
+def _encode_bitmap(names: List[str], present: Set[str]) -> str:
+    """将名称存在情况编码为位图（base64）"""
+    bits = bytearray((len(names) + 7) // 8)
+    for i, name in enumerate(names):
+        if name in present:
+            bits[i >> 3] |= 1 << (i & 7)
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+
+def _decode_bitmap(names: List[str], encoded: str) -> Set[str]:
+    """从位图还原名称集合"""
+    bits = base64.b64decode(encoded)
+    return {name for i, name in enumerate(names) if bits[i >> 3] & (1 << (i & 7))}
+
+
+def _cache_path(folders: List[str], recursive: bool = False, link_policy: str = LINK_LEAF) -> str:
+    return os.path.join(CACHE_DIR, f"{cache_key(folders, recursive, link_policy)}.cache")
+
+
+def _encode_dir_states(folder: str, dir_states: Dict[str, DirState]) -> Dict[str, list]:
+    """把文件夹之下的目录状态编码为 {相对路径: [mtime_ns, inode, [[名称, 标志], ...]]}，标志位 1 为目录、2 为符号链接"""
+    prefix = os.path.join(folder, '')
+    encoded: Dict[str, list] = {}
+    for path, state in dir_states.items():
+        if path == folder:
+            rel = ''
+        elif path.startswith(prefix):
+            rel = path[len(prefix):]
+        else:
+            continue
+        entries = [[name, int(is_dir) | (int(is_link) << 1)] for name, is_dir, is_link in state.entries]
+        encoded[rel] = [state.mtime_ns, state.inode, entries]
+    return encoded
+
+
+def _decode_dir_states(folder: str, encoded: Dict[str, list]) -> Dict[str, DirState]:
+    """还原 _encode_dir_states 编码的目录状态，路径使用当前的文件夹写法"""
+    dir_states: Dict[str, DirState] = {}
+    for rel, (mtime_ns, inode, entries) in encoded.items():
+        path = os.path.join(folder, rel) if rel else folder
+        dir_states[path] = DirState(mtime_ns, inode,
+                                    tuple((name, bool(flags & 1), bool(flags & 2)) for name, flags in entries))
+    return dir_states
+
+
+def _prune_cache() -> None:
+    """删除超出数量上限的最旧缓存文件"""
+    try:
+        entries = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR) if name.endswith('.cache')]
+        if len(entries) <= MAX_CACHE_ENTRIES:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - MAX_CACHE_ENTRIES]:
+            os.remove(path)
+    except OSError as e:
+        logging.warning(f"清理缓存失败: {str(e)}")
+
+
+def save_comparison(folders: List[str], folder_files: Dict[str, Set[str]],
+                    signatures: Dict[str, int], recursive: bool = False, link_policy: str = LINK_LEAF,
+                    dir_states: Optional[Dict[str, DirState]] = None) -> None:
+    """
+    保存比较结果到磁盘
+
+    所有名称只保存一次，各文件夹的存在情况以位图形式保存，整体经 zlib 压缩。
+    递归比较的结果同时保存各目录的状态，下次重新验证时只重新枚举发生变化的目录。
+
+    Args:
+        folders: 文件夹列表
+        folder_files: 文件夹路径到名称集合的映射
+        signatures: 扫描前获取的文件夹签名（扫描期间发生的修改会在下次验证时被发现）
+        recursive: 是否为递归比较的结果
+        link_policy: 递归比较时符号链接的处理方式
+        dir_states: 递归扫描后的目录状态（ScanCache.dirs，可选）
+    """
+    try:
+        names: Set[str] = set()
+        for files in folder_files.values():
+            names.update(files)
+        name_table = sorted(names)
+
+        payload = {
+            'version': CACHE_VERSION,
+            'saved_at': time.time(),
+            'folders': folders,
+            'signatures': [signatures.get(folder, -1) for folder in folders],
+            'names': name_table,
+            'presence': [_encode_bitmap(name_table, folder_files.get(folder, set())) for folder in folders],
+            'recursive': recursive,
+            'link_policy': link_policy,
+            'dirs': [_encode_dir_states(folder, dir_states or {}) for folder in folders] if recursive else [],
+        }
+        data = zlib.compress(json.dumps(payload, ensure_ascii=False).encode('utf-8'), 6)
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = _cache_path(folders, recursive, link_policy)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp_path, path)
+        _prune_cache()
+    except Exception as e:
+        logging.error(f"保存比较缓存失败: {str(e)}")
+        print(f"保存比较缓存失败: {str(e)}")
+
+
+def load_cached_comparison(folders: List[str], recursive: bool = False,
+                           link_policy: str = LINK_LEAF) -> Optional[CachedComparison]:
+    """
+    读取文件夹组的缓存结果
+
+    Args:
+        folders (List[str]): 文件夹列表（顺序可以与保存时不同）
+        recursive (bool): 是否读取递归比较的结果
+        link_policy (str): 递归比较时符号链接的处理方式
+
+    Returns:
+        Optional[CachedComparison]: 缓存结果，不存在或已损坏时返回 None
+    """
+    path = _cache_path(folders, recursive, link_policy)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as fp:
+            payload = json.loads(zlib.decompress(fp.read()).decode('utf-8'))
+        if payload.get('version') != CACHE_VERSION:
+            return None
+
+        # 按规范化路径对应到当前的文件夹写法
+        current = {os.path.normcase(os.path.abspath(folder)): folder for folder in folders}
+        names = payload['names']
+        folder_files: Dict[str, Set[str]] = {}
+        signatures: Dict[str, int] = {}
+        dir_states: Dict[str, DirState] = {}
+        stored_dirs = payload.get('dirs') or [{}] * len(payload['folders'])
+        for stored, signature, encoded, dirs in zip(payload['folders'], payload['signatures'],
+                                                    payload['presence'], stored_dirs):
+            folder = current.get(os.path.normcase(os.path.abspath(stored)))
+            if folder is None:
+                return None
+            folder_files[folder] = _decode_bitmap(names, encoded)
+            signatures[folder] = signature
+            dir_states.update(_decode_dir_states(folder, dirs))
+
+        # 标记为最近使用
+        os.utime(path, None)
+        return CachedComparison(list(folders), folder_files, signatures, payload.get('saved_at', 0.0),
+                                recursive, link_policy, dir_states)
+    except Exception as e:
+        logging.warning(f"读取比较缓存失败 {path}: {str(e)}")
+        return None
+
+
+def revalidate_comparison(cached: CachedComparison, scan_cache: Optional[ScanCache] = None
+                          ) -> Tuple[Dict[str, Set[str]], Dict[str, int], List[str]]:
+    """
+    重新验证缓存结果，只重新扫描签名发生变化的文件夹
+
+    递归比较的结果无法只用顶层目录的签名判断（深层的修改不改变上层目录的修改时间），
+    文件夹改为用缓存的目录状态重新扫描：修改时间和 inode 未变的目录复用保存的子项列表，只需逐个 stat。
+
+    Args:
+        cached (CachedComparison): 缓存结果
+        scan_cache (Optional[ScanCache]): 递归重新扫描使用的目录状态缓存（可选），缓存的目录状态会先载入其中，
+            扫描后保存最新的目录状态
+
+    Returns:
+        Tuple[Dict[str, Set[str]], Dict[str, int], List[str]]:
+        (最新的名称集合映射, 最新签名, 发生变化的文件夹列表)
+    """
+    folder_files: Dict[str, Set[str]] = {}
+    signatures: Dict[str, int] = {}
+    changed: List[str] = []
+    if scan_cache is None:
+        scan_cache = ScanCache()
+    for path, state in cached.dir_states.items():
+        scan_cache.dirs.setdefault(path, state)
+
+    for folder in cached.folders:
+        signature = folder_signature(folder)
+        signatures[folder] = signature
+        if cached.recursive and is_comparable_path(folder) and not is_archive_path(folder):
+            try:
+                folder_files[folder] = list_folder_names(folder, True, scan_cache, cached.link_policy)
+            except Exception as e:
+                logging.error(f"重新扫描文件夹失败 {folder}: {str(e)}")
+                print(f"重新扫描文件夹失败 {folder}: {str(e)}")
+                folder_files[folder] = set()
+            if folder_files[folder] != cached.folder_files.get(folder):
+                changed.append(folder)
+            continue
+        if signature != -1 and signature == cached.signatures.get(folder) and folder in cached.folder_files:
+            folder_files[folder] = cached.folder_files[folder]
+            continue
+
+        changed.append(folder)
+        if not is_comparable_path(folder):
+            folder_files[folder] = set()
+            continue
+        try:
+            folder_files[folder] = list_folder_names(folder, cached.recursive, scan_cache, cached.link_policy)
+        except Exception as e:
+            logging.error(f"重新扫描文件夹失败 {folder}: {str(e)}")
+            print(f"重新扫描文件夹失败 {folder}: {str(e)}")
+            folder_files[folder] = set()
+
+    return folder_files, signatures, changed
+
+
+def save_last_session(folders: List[str]) -> None:
+    """保存当前文件夹列表，供下次启动时恢复"""
+    try:
+        os.makedirs(os.path.dirname(LAST_SESSION_FILE), exist_ok=True)
+        with open(LAST_SESSION_FILE, 'w', encoding='utf-8') as fp:
+            json.dump({'folders': folders}, fp, ensure_ascii=False)
+    except Exception as e:
+        logging.warning(f"保存会话失败: {str(e)}")
+
+
+def load_last_session() -> List[str]:
+    """读取上次会话的文件夹列表，只返回仍然可以比较的路径"""
+    try:
+        with open(LAST_SESSION_FILE, 'r', encoding='utf-8') as fp:
+            folders = json.load(fp).get('folders', [])
+        return [folder for folder in folders if isinstance(folder, str) and is_comparable_path(folder)]
+    except (OSError, ValueError):
+        return []
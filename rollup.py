@@ -0,0 +1,210 @@
+"""
+目录折叠模块
+递归比较时，把内容全部具有相同存在模式的子目录折叠为一个条目（附带文件数和字节数），
+例如某个文件夹中整体缺失的 build/ 只显示一行，展开时再逐层列出子项。
+
+折叠视图建立在比较结果模型（core.PresenceModel）的有序分组之上，只为目录保存各存在模式的条目数，
+不复制逐个名称的数据；子项和文件数在展开或显示时用二分查找从分组中读取。
+监视到文件夹变化时用 update() 只更新变化名称的上级目录。
+"""
+
+import bisect
+import posixpath
+from typing import List, Dict, Tuple, Set, NamedTuple, Optional
+
+from core import PresenceModel
+from scanner import FolderMetadata
+
+# 折叠目录在显示时的后缀
+ROLLUP_SUFFIX = '/'
+
+
+class DirSummary(NamedTuple):
+    """一个内容一致的目录的统计"""
+    pattern: Tuple[bool, ...]   # 目录内所有条目共同的存在模式
+    files: int                  # 文件数（不含子目录）
+    entries: int                # 条目总数（含子目录）
+    bytes: Optional[int]        # 字节数，没有元数据时为 None
+
+
+def _prefix_range(files: List[str], prefix: str, start: int = 0) -> Tuple[int, int]:
+    """有序名称列表中以 prefix（以 / 结尾）开头的名称的范围"""
+    # '0' 是 '/' 之后的下一个字符，prefix 开头的名称都小于把末尾的 / 换成 0 的字符串
+    return (bisect.bisect_left(files, prefix, start),
+            bisect.bisect_left(files, prefix[:-1] + '0', start))
+
+
+class PresenceRollup:
+    """按存在模式分组的名称之上的目录折叠视图"""
+
+    def __init__(self, model: PresenceModel, metadata: Optional[Dict[str, FolderMetadata]] = None):
+        """
+        统计每个目录下所有条目（含各级子目录中的条目）的存在模式，只有一种模式的目录可以折叠
+
+        Args:
+            model: 比较结果模型（名称为以 / 分隔的相对路径），直接读取其分组，增量更新后保持一致
+            metadata: 各文件夹的元数据（可选），提供时统计字节数
+        """
+        self.model = model
+        self.metadata = metadata
+        # 目录 -> {存在模式: 目录下具有该模式的条目数}，只包含至少有一个条目的目录
+        self._counts: Dict[str, Dict[Tuple[bool, ...], int]] = {}
+        # 可以折叠的目录 -> 其中条目共同的存在模式
+        self._uniform: Dict[str, Tuple[bool, ...]] = {}
+        # 有条目的目录自身的存在模式
+        self._own: Dict[str, Tuple[bool, ...]] = {}
+        # 可以折叠的目录的 (文件数, 字节数)，显示时才计算
+        self._details: Dict[str, Tuple[int, Optional[int]]] = {}
+
+        # 分组已排序，同一目录的直接子项大多相邻，按连续的父目录合并计数
+        for pattern, files in model.groups.items():
+            run_parent, run_length = "", 0
+            for name in files:
+                parent = name.rpartition('/')[0]
+                if parent != run_parent:
+                    self._add(run_parent, pattern, run_length)
+                    run_parent, run_length = parent, 0
+                run_length += 1
+            self._add(run_parent, pattern, run_length)
+
+        for pattern, files in model.groups.items():
+            for name in files:
+                if name in self._counts:
+                    self._own[name] = pattern
+        for directory, counts in self._counts.items():
+            if len(counts) == 1:
+                self._uniform[directory] = next(iter(counts))
+
+    def _add(self, directory: str, pattern: Tuple[bool, ...], delta: int,
+             touched: Optional[Set[str]] = None) -> None:
+        """把 delta 个具有该模式的条目计入目录及其所有上级目录（delta 为负时移出）"""
+        if not delta:
+            return
+        while directory:
+            counts = self._counts.setdefault(directory, {})
+            count = counts.get(pattern, 0) + delta
+            if count:
+                counts[pattern] = count
+            else:
+                counts.pop(pattern, None)
+                if not counts:
+                    del self._counts[directory]
+            if touched is not None:
+                touched.add(directory)
+            directory = directory.rpartition('/')[0]
+
+    def _pattern_of(self, name: str) -> Optional[Tuple[bool, ...]]:
+        """在模型的分组中查找名称的存在模式"""
+        for pattern, files in self.model.groups.items():
+            position = bisect.bisect_left(files, name)
+            if position < len(files) and files[position] == name:
+                return pattern
+        return None
+
+    def update(self, events: List[Tuple[str, Tuple[bool, ...], int, str]]) -> Set[Tuple[bool, ...]]:
+        """
+        应用模型的行变化（PresenceModel.update_folder 的返回值，模型此时已经更新），只重新统计变化名称的上级目录
+
+        Returns:
+            Set[Tuple[bool, ...]]: 显示的条目可能发生变化的分组
+        """
+        affected: Set[Tuple[bool, ...]] = set()
+        touched: Set[str] = set()
+        for action, pattern, _, name in events:
+            affected.add(pattern)
+            self._add(name.rpartition('/')[0], pattern, 1 if action == "insert" else -1, touched)
+            touched.add(name)
+
+        for directory in touched:
+            self._details.pop(directory, None)
+            for previous in (self._uniform.pop(directory, None), self._own.pop(directory, None)):
+                if previous is not None:
+                    affected.add(previous)
+            counts = self._counts.get(directory)
+            if counts is None:
+                continue
+            own = self._pattern_of(directory)
+            if own is not None:
+                self._own[directory] = own
+                affected.add(own)
+            if len(counts) == 1:
+                self._uniform[directory] = next(iter(counts))
+                affected.add(self._uniform[directory])
+        return affected
+
+    def _entry(self, name: str, pattern: Tuple[bool, ...]) -> Tuple[bool, Optional[int]]:
+        """
+        从第一个包含该条目的文件夹的元数据中取 (是否为目录, 文件大小)
+
+        没有元数据时只能把有子项的名称识别为目录（空目录按文件计），大小为 None
+        """
+        if self.metadata is not None:
+            for folder, exists in zip(self.model.folders, pattern):
+                folder_metadata = self.metadata.get(folder)
+                if exists and folder_metadata is not None:
+                    position = folder_metadata.index(name)
+                    if position >= 0:
+                        return bool(folder_metadata.is_dir[position]), folder_metadata.sizes[position]
+        return name in self._counts, None
+
+    def _measure(self, directory: str, pattern: Tuple[bool, ...]) -> Tuple[int, Optional[int]]:
+        """统计可以折叠的目录中的文件数和字节数（其中的条目都在同一个分组中）"""
+        files = self.model.groups.get(pattern, [])
+        start, end = _prefix_range(files, directory + '/')
+        count = 0
+        total: Optional[int] = 0 if self.metadata is not None else None
+        for name in files[start:end]:
+            is_dir, size = self._entry(name, pattern)
+            if is_dir:
+                continue
+            count += 1
+            if total is not None:
+                total = None if size is None else total + size
+        return count, total
+
+    def _covered(self, name: str, pattern: Tuple[bool, ...]) -> bool:
+        """名称是否已被上级目录的折叠条目覆盖"""
+        parent = posixpath.dirname(name)
+        return bool(parent) and self._uniform.get(parent) == pattern
+
+    def top_entries(self, pattern: Tuple[bool, ...], files: List[str]) -> List[str]:
+        """
+        返回分组折叠后显示的条目（已排序）
+
+        内容一致的目录如果自身也在该分组中，作为可展开的目录条目显示；
+        如果目录自身属于其他分组（例如两边都有 build/ 但其中内容只在一边），在该分组中显示为 "build/"。
+        """
+        entries = [name for name in files if not self._covered(name, pattern)]
+        entries.extend(directory + ROLLUP_SUFFIX for directory, uniform in self._uniform.items()
+                       if uniform == pattern and self._own.get(directory) != pattern
+                       and not self._covered(directory, pattern))
+        entries.sort()
+        return entries
+
+    def summary(self, entry: str, pattern: Tuple[bool, ...]) -> Optional[DirSummary]:
+        """返回分组中可展开条目的目录统计，不可展开时返回 None"""
+        directory = entry[:-len(ROLLUP_SUFFIX)] if entry.endswith(ROLLUP_SUFFIX) else entry
+        if self._uniform.get(directory) != pattern:
+            return None
+        details = self._details.get(directory)
+        if details is None:
+            details = self._details[directory] = self._measure(directory, pattern)
+        return DirSummary(pattern, details[0], self._counts[directory][pattern], details[1])
+
+    def children(self, entry: str) -> List[str]:
+        """返回可展开条目的直接子项（已排序），子目录中的条目用二分查找整体跳过"""
+        directory = entry[:-len(ROLLUP_SUFFIX)] if entry.endswith(ROLLUP_SUFFIX) else entry
+        prefix = directory + '/'
+        result: List[str] = []
+        for files in self.model.groups.values():
+            position, end = _prefix_range(files, prefix)
+            while position < end:
+                name = files[position]
+                slash = name.find('/', len(prefix))
+                if slash < 0:
+                    result.append(name)
+                    position += 1
+                else:
+                    position = _prefix_range(files, name[:slash + 1], position)[1]
+        result.sort()
+        return result
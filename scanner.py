@@ -0,0 +1,434 @@
+"""
+目录扫描模块
+递归扫描文件夹，并根据目录修改时间复用上次扫描的目录列表；元数据模式下在枚举时记录文件的 stat 信息
+
+递归扫描沿途记录祖先目录的 (st_dev, st_ino)，只有再次进入某个祖先目录（真正的循环）时才跳过；
+绑定挂载、符号链接别名等从不同路径到达同一物理目录的情况，会在每个路径下都列出其内容，
+因此两个内容相同的目录树不会因为遍历顺序不同而出现多余的差异。
+符号链接的处理方式:
+- LINK_LEAF: 作为普通条目列出，不进入（默认）
+- LINK_FOLLOW: 进入指向的目录，指向祖先目录的链接只列出名称
+- LINK_SKIP: 完全忽略符号链接
+
+传入 ScanBudget 时，扫描在每个目录之间检查预算，用尽后停止并把未枚举的目录保留在 PartialScan 中，
+下次把同一个 PartialScan 传回扫描函数即可从停止处继续。
+"""
+
+import os
+import stat
+import time
+import bisect
+import logging
+from array import array
+from typing import List, Dict, Tuple, Set, NamedTuple, Optional
+
+# 符号链接处理方式
+LINK_LEAF = 'leaf'
+LINK_FOLLOW = 'follow'
+LINK_SKIP = 'skip'
+LINK_POLICIES = (LINK_LEAF, LINK_FOLLOW, LINK_SKIP)
+
+# 修改时间距扫描时刻小于该值（纳秒）的目录不可信：同一时间粒度内的后续修改不会改变 mtime
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+
+class DirState(NamedTuple):
+    """上次扫描时一个目录的状态"""
+    mtime_ns: int                           # 目录修改时间，-1 表示不可复用
+    inode: int                              # 目录的 inode，用于发现目录被整体替换
+    entries: Tuple[Tuple[str, bool, bool], ...]   # (名称, 是否为目录, 是否为符号链接)
+
+
+class ScanReport:
+    """一次扫描的统计信息"""
+
+    def __init__(self):
+        self.reused_dirs = 0     # 修改时间未变、直接复用缓存列表的目录数
+        self.reread_dirs = 0     # 重新读取的目录数
+        self.revisited_dirs = 0  # 从其他路径再次到达的物理目录（绑定挂载、链接别名），内容在新路径下同样列出
+        self.cycle_dirs = 0      # 指向祖先目录（循环）而未进入的目录数
+        self.followed_links = 0  # 跟随进入的目录符号链接数
+        self.leaf_links = 0      # 作为普通条目列出的符号链接数
+        self.skipped_links = 0   # 被忽略的符号链接数
+        self.hashes_avoided = 0  # 硬链接到已计算过的 inode、省去的哈希计算数
+        self.unchecked_files = 0  # 读取预算用尽、未比较内容的同名文件数
+        self.errors: List[str] = []
+
+    def summary(self) -> str:
+        """返回用于显示的统计文本"""
+        text = f"复用目录 {self.reused_dirs} 个，重新读取 {self.reread_dirs} 个"
+        if self.revisited_dirs:
+            text += f"，重复到达的目录 {self.revisited_dirs} 个"
+        if self.cycle_dirs:
+            text += f"，跳过循环 {self.cycle_dirs} 个"
+        links = [(self.followed_links, "跟随"), (self.leaf_links, "不进入"), (self.skipped_links, "忽略")]
+        if any(count for count, _ in links):
+            text += "，符号链接 " + "/".join(f"{label} {count}" for count, label in links if count)
+        if self.hashes_avoided:
+            text += f"，硬链接省去哈希 {self.hashes_avoided} 次"
+        if self.unchecked_files:
+            text += f"，预算用尽未比较内容 {self.unchecked_files} 个"
+        if self.errors:
+            text += f"，读取失败 {len(self.errors)} 个"
+        return text
+
+
+class ScanBudget:
+    """
+    一次比较的扫描预算：耗时（秒）、枚举的条目数和读取的字节数，未设置的项不限制
+
+    预算只在检查点（目录之间、文件之间）检查，单个很大的目录会一次读完，因此实际用量可能略超出预算。
+    比较多个文件夹时用 share() 把剩余预算分给各个文件夹，避免第一个文件夹用完全部预算。
+    """
+
+    def __init__(self, seconds: Optional[float] = None, entries: Optional[int] = None,
+                 bytes_read: Optional[int] = None):
+        self.seconds = seconds
+        self.entries = entries
+        self.bytes_read = bytes_read
+        self._parent: Optional["ScanBudget"] = None
+        self.start()
+
+    def share(self, parts: int) -> "ScanBudget":
+        """
+        把剩余预算平均分成 parts 份，返回其中一份；份额的用量同时计入本预算，本预算用尽时份额也用尽
+
+        剩余量不足 parts 份时每份至少为 1，保证每个文件夹至少能前进一个目录。
+        """
+        parts = max(1, parts)
+        seconds = entries = bytes_read = None
+        if self._deadline is not None:
+            seconds = max(0.0, self._deadline - time.monotonic()) / parts
+        if self.entries is not None:
+            entries = max(1, (self.entries - self.used_entries) // parts)
+        if self.bytes_read is not None:
+            bytes_read = max(1, (self.bytes_read - self.used_bytes) // parts)
+        portion = ScanBudget(seconds, entries, bytes_read)
+        portion._parent = self
+        return portion
+
+    def start(self) -> None:
+        """开始（或继续）一轮扫描，重新计时并清零用量"""
+        self._deadline = time.monotonic() + self.seconds if self.seconds is not None else None
+        self.used_entries = 0
+        self.used_bytes = 0
+
+    def charge(self, entries: int = 0, bytes_read: int = 0) -> None:
+        """记录用量"""
+        self.used_entries += entries
+        self.used_bytes += bytes_read
+        if self._parent is not None:
+            self._parent.charge(entries, bytes_read)
+
+    @property
+    def exhausted(self) -> bool:
+        if self._parent is not None and self._parent.exhausted:
+            return True
+        return ((self.entries is not None and self.used_entries >= self.entries)
+                or (self.bytes_read is not None and self.used_bytes >= self.bytes_read)
+                or (self._deadline is not None and time.monotonic() >= self._deadline))
+
+    def describe(self) -> str:
+        """返回已用尽的预算项的文字描述"""
+        reasons = []
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            reasons.append(f"耗时 {self.seconds:g} 秒")
+        if self.entries is not None and self.used_entries >= self.entries:
+            reasons.append(f"条目 {self.entries} 个")
+        if self.bytes_read is not None and self.used_bytes >= self.bytes_read:
+            reasons.append(f"读取 {self.bytes_read} 字节")
+        return "、".join(reasons) or "未用尽"
+
+
+class PartialScan:
+    """一个文件夹的扫描进度，预算用尽时保存待枚举的目录，complete 为 True 表示扫描已完成"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.complete = False
+        self.stack: Optional[list] = None       # 待枚举的目录，None 表示尚未开始
+        self.names: Set[str] = set()            # scan_tree 已找到的名称
+        self.records: list = []                 # scan_metadata 已记录的元数据
+        # 物理目录的子项: scan_tree 中为子项列表，scan_metadata 中为 (records 中的起止位置, 当时的相对路径前缀)
+        self.listings: Dict[Tuple[int, int], tuple] = {}
+        self.visited: Set[str] = set()
+        self.result = None                      # 扫描完成后由调用方保存的结果
+
+    def pending_dirs(self) -> List[str]:
+        """尚未枚举的子目录（以 / 分隔的相对路径，"." 表示整个文件夹）"""
+        if self.complete:
+            return []
+        if self.stack is None:
+            return ['.']
+        return sorted(entry[1].rstrip('/') or '.' for entry in self.stack)
+
+
+class ScanCache:
+    """保存每个目录上次扫描的状态，供后续增量扫描使用"""
+
+    def __init__(self):
+        self.dirs: Dict[str, DirState] = {}
+        self.report = ScanReport()
+
+    def reset_report(self) -> ScanReport:
+        """开始新一轮扫描前重置统计信息"""
+        self.report = ScanReport()
+        return self.report
+
+    def clear(self) -> None:
+        """清空所有缓存的目录状态"""
+        self.dirs.clear()
+
+
+def _on_chain(chain: Optional[tuple], key: Tuple[int, int]) -> bool:
+    """祖先链 (目录标识, 上级链) 中是否已包含该目录，即再次进入会形成循环"""
+    while chain is not None:
+        if chain[0] == key:
+            return True
+        chain = chain[1]
+    return False
+
+
+def _read_dir(path: str) -> Tuple[Tuple[str, bool, bool], ...]:
+    """读取目录的直接子项，不跟随符号链接"""
+    with os.scandir(path) as it:
+        return tuple((entry.name, entry.is_dir(follow_symlinks=False), entry.is_symlink()) for entry in it)
+
+
+def scan_tree(root: str, cache: ScanCache, link_policy: str = LINK_LEAF,
+              budget: Optional[ScanBudget] = None, partial: Optional[PartialScan] = None) -> Set[str]:
+    """
+    递归扫描文件夹，返回所有文件和子目录的相对路径（使用 / 分隔）
+
+    对于修改时间和 inode 都与上次相同的目录，直接复用缓存的子项列表而不重新枚举；
+    子目录仍会逐个检查，因为深层的修改不会改变上层目录的修改时间。
+    从其他路径再次到达已枚举过的物理目录 (st_dev, st_ino) 时复用本次扫描得到的子项列表，不重新读取；
+    只有指向祖先目录的路径（循环）不再进入。
+
+    Args:
+        root (str): 要扫描的文件夹
+        cache (ScanCache): 目录状态缓存，扫描后会被更新
+        link_policy (str): 符号链接处理方式 LINK_LEAF / LINK_FOLLOW / LINK_SKIP
+        budget (Optional[ScanBudget]): 扫描预算（可选），用尽时返回已找到的名称
+        partial (Optional[PartialScan]): 扫描进度（可选），传入上次未完成的进度时从停止处继续
+
+    Returns:
+        Set[str]: 相对路径集合（预算用尽时不完整，partial.complete 为 False）
+    """
+    report = cache.report
+    if partial is None:
+        partial = PartialScan(root)
+    if partial.stack is None:
+        partial.stack = [(root, "", False, None)]
+    names = partial.names
+    visited = partial.visited
+    listings = partial.listings
+    # (路径, 相对路径前缀, 是否为跟随的链接, 上级目录的祖先链)
+    stack: List[Tuple[str, str, bool, Optional[tuple]]] = partial.stack
+    now_ns = time.time_ns()
+
+    while stack:
+        if budget is not None and budget.exhausted:
+            return names
+        path, prefix, is_link, ancestors = stack.pop()
+        visited.add(path)
+
+        try:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                if is_link:
+                    # 目标不存在的符号链接只作为普通条目
+                    continue
+                raise
+            if not stat.S_ISDIR(st.st_mode):
+                # 跟随的符号链接指向的是文件
+                continue
+            key = (st.st_dev, st.st_ino)
+            if st.st_ino and _on_chain(ancestors, key):
+                report.cycle_dirs += 1
+                continue
+
+            state = cache.dirs.get(path)
+            if st.st_ino and key in listings:
+                entries = listings[key]
+                report.revisited_dirs += 1
+            elif state is not None and state.mtime_ns == st.st_mtime_ns and state.inode == st.st_ino:
+                entries = state.entries
+                report.reused_dirs += 1
+            else:
+                entries = _read_dir(path)
+                report.reread_dirs += 1
+                # 刚被修改过的目录本次不缓存修改时间，避免漏掉同一时间粒度内的后续修改
+                mtime_ns = st.st_mtime_ns if now_ns - st.st_mtime_ns > RACY_WINDOW_NS else -1
+                cache.dirs[path] = DirState(mtime_ns, st.st_ino, entries)
+            if st.st_ino:
+                listings[key] = entries
+        except OSError as e:
+            cache.dirs.pop(path, None)
+            if path == root:
+                # 文件夹本身无法读取时由调用方处理，不作为空文件夹返回
+                raise
+            logging.error(f"读取目录失败 {path}: {str(e)}")
+            report.errors.append(path)
+            continue
+
+        if budget is not None:
+            budget.charge(entries=len(entries))
+        chain = (key, ancestors)
+        for name, is_dir, is_link in entries:
+            rel = prefix + name
+            if is_link:
+                if link_policy == LINK_SKIP:
+                    report.skipped_links += 1
+                    continue
+                if link_policy == LINK_FOLLOW:
+                    report.followed_links += 1
+                    stack.append((os.path.join(path, name), rel + '/', True, chain))
+                else:
+                    report.leaf_links += 1
+            elif is_dir:
+                stack.append((os.path.join(path, name), rel + '/', False, chain))
+            names.add(rel)
+
+    partial.complete = True
+
+    # 删除已不存在的目录的缓存状态
+    root_prefix = os.path.join(root, '')
+    for path in [p for p in cache.dirs if p.startswith(root_prefix) and p not in visited]:
+        del cache.dirs[path]
+
+    return names
+
+
+class FolderMetadata:
+    """
+    一个文件夹中所有条目的元数据，使用按名称排序的紧凑数组保存，而不是每个文件一个字典
+    """
+
+    __slots__ = ('names', 'sizes', 'mtimes_ns', 'modes', 'is_dir', 'is_file', 'devices', 'inodes')
+
+    def __init__(self, records: List[Tuple[str, int, int, int, bool, bool, int, int]]):
+        """
+        Args:
+            records: (名称, 大小, 修改时间纳秒, 权限位, 是否为目录, 是否为普通文件, 设备号, inode) 列表，
+                     无法获得设备号和 inode 时（压缩包成员、Windows 目录枚举）为 0
+        """
+        records.sort(key=lambda record: record[0])
+        self.names: List[str] = [record[0] for record in records]
+        self.sizes = array('q', (record[1] for record in records))
+        self.mtimes_ns = array('q', (record[2] for record in records))
+        self.modes = array('I', (record[3] for record in records))
+        self.is_dir = bytearray(record[4] for record in records)
+        self.is_file = bytearray(record[5] for record in records)
+        self.devices = array('Q', (record[6] for record in records))
+        self.inodes = array('Q', (record[7] for record in records))
+
+    def index(self, name: str) -> int:
+        """二分查找名称所在的位置，不存在时返回 -1"""
+        position = bisect.bisect_left(self.names, name)
+        if position < len(self.names) and self.names[position] == name:
+            return position
+        return -1
+
+
+def scan_metadata(root: str, recursive: bool = False, link_policy: str = LINK_LEAF,
+                  report: Optional[ScanReport] = None, budget: Optional[ScanBudget] = None,
+                  partial: Optional[PartialScan] = None) -> FolderMetadata:
+    """
+    扫描文件夹并在枚举的同时记录每个条目的大小、修改时间和权限位
+
+    使用 DirEntry.stat() 获取元数据：Windows 上直接来自目录枚举结果，不需要额外的系统调用；
+    其他系统上每个条目只执行一次 lstat，且不会再次 stat。
+    元数据模式下文件内容的变化不会反映在目录修改时间上，因此不复用 ScanCache 中的目录列表；
+    但从其他路径再次到达本次已枚举过的物理目录 (st_dev, st_ino) 时，直接复制已记录的子项元数据，不重新枚举。
+
+    Args:
+        root (str): 要扫描的文件夹
+        recursive (bool): 是否递归扫描子目录（名称为以 / 分隔的相对路径）
+        link_policy (str): 符号链接处理方式，LINK_FOLLOW 时记录链接目标的元数据
+        report (Optional[ScanReport]): 用于累计符号链接和重复目录计数的统计信息（可选）
+        budget (Optional[ScanBudget]): 扫描预算（可选），用尽时返回已记录的元数据
+        partial (Optional[PartialScan]): 扫描进度（可选），传入上次未完成的进度时从停止处继续
+
+    Returns:
+        FolderMetadata: 元数据数组（预算用尽时不完整，partial.complete 为 False）
+    """
+    if report is None:
+        report = ScanReport()
+    if partial is None:
+        partial = PartialScan(root)
+    if partial.stack is None:
+        root_st = os.stat(root)
+        partial.stack = [(root, "", ((root_st.st_dev, root_st.st_ino), None))]
+    records: List[Tuple[str, int, int, int, bool, bool, int, int]] = partial.records
+    listings = partial.listings
+    # (路径, 相对路径前缀, 包含该目录自身的祖先链)
+    stack: List[Tuple[str, str, tuple]] = partial.stack
+    while stack:
+        if budget is not None and budget.exhausted:
+            # FolderMetadata 会就地排序，续扫还要按位置读取 listings 中的子项，因此传入副本
+            return FolderMetadata(list(records))
+        path, prefix, chain = stack.pop()
+        key = chain[0]
+        count = 0
+        listing = listings.get(key) if key[1] else None
+        if listing is not None:
+            # 其他路径已经枚举过的物理目录: 复制其子项的元数据，只替换相对路径前缀
+            (first, last), old_prefix = listing
+            report.revisited_dirs += 1
+            start = len(records)
+            for record in records[first:last]:
+                records.append((prefix + record[0][len(old_prefix):],) + record[1:])
+            count = last - first
+        else:
+            start = len(records)
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        count += 1
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                            if stat.S_ISLNK(st.st_mode):
+                                if link_policy == LINK_SKIP:
+                                    report.skipped_links += 1
+                                    continue
+                                if link_policy == LINK_FOLLOW:
+                                    report.followed_links += 1
+                                    try:
+                                        st = entry.stat(follow_symlinks=True)
+                                    except OSError:
+                                        # 目标不存在的链接仍作为普通条目记录
+                                        pass
+                                else:
+                                    report.leaf_links += 1
+                        except OSError as e:
+                            logging.warning(f"读取文件信息失败 {entry.path}: {str(e)}")
+                            continue
+                        records.append((prefix + entry.name, st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode),
+                                        stat.S_ISDIR(st.st_mode), stat.S_ISREG(st.st_mode), st.st_dev, st.st_ino))
+            except OSError as e:
+                if path == root:
+                    raise
+                logging.error(f"读取目录失败 {path}: {str(e)}")
+            else:
+                # Windows 的目录枚举不提供 inode（为 0），此时无法识别同一物理目录
+                if key[1]:
+                    listings[key] = ((start, len(records)), prefix)
+        if budget is not None:
+            budget.charge(entries=count)
+        if not recursive:
+            continue
+
+        for rel, _, _, _, is_dir, _, device, inode in records[start:]:
+            if not is_dir:
+                continue
+            child_key = (device, inode)
+            if inode and _on_chain(chain, child_key):
+                report.cycle_dirs += 1
+                continue
+            stack.append((os.path.join(path, rel[len(prefix):]), rel + '/', (child_key, chain)))
+
+    partial.complete = True
+    partial.records = []
+    return FolderMetadata(records)
@@ -0,0 +1,349 @@
+"""
+相似度草图模块
+为每个文件夹构建 MinHash（bottom-k）和 HyperLogLog 草图，快速估算文件夹之间的 Jaccard 相似度和不重复名称数
+
+草图只有几 KB，默认保存在缓存目录中，之后无需重新扫描即可复用；
+指定 --beside 时保存在文件夹旁边（<文件夹路径>.fcsketch），便于随文件夹一起复制，但会改变上级目录的修改时间。
+
+用法: python sketch.py 文件夹1 文件夹2 ... [--recursive] [--rebuild] [--key name_size] [--beside]
+"""
+
+import os
+import sys
+import math
+import time
+import heapq
+import struct
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Iterable, Optional
+
+from core import list_folder_names, collect_folder_metadata, is_comparable_path
+from archive import split_archive_path
+from result_cache import CACHE_DIR, folder_signature
+
+# MinHash 保留的最小哈希值个数，Jaccard 估计的标准误差约为 sqrt(J(1-J)/k) <= 0.5/sqrt(k)
+MINHASH_K = 256
+
+# HyperLogLog 的寄存器位数，共 2^p 个寄存器，不重复计数的相对标准误差约为 1.04/sqrt(2^p)
+HLL_P = 12
+
+# 草图文件扩展名和格式
+SKETCH_SUFFIX = '.fcsketch'
+_MAGIC = b'FCSK'
+_VERSION = 1
+_HEADER = struct.Struct('<4sBBBHIqdQ')
+
+# 草图元素: 只用名称，或者名称加文件大小（对内容大小变化也敏感）
+KEY_NAME = 'name'
+KEY_NAME_SIZE = 'name_size'
+_KEY_CODES = {KEY_NAME: 0, KEY_NAME_SIZE: 1}
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hash64(item: str) -> int:
+    """64 位哈希"""
+    return int.from_bytes(hashlib.blake2b(item.encode('utf-8', 'surrogateescape'), digest_size=8).digest(), 'little')
+
+
+class FolderSketch:
+    """一个文件夹的 MinHash + HyperLogLog 草图"""
+
+    def __init__(self, minhash: List[int], registers: bytearray, item_count: int,
+                 recursive: bool, key: str, signature: int = -1, created_at: float = 0.0):
+        """
+        Args:
+            minhash: 升序排列的最小 k 个哈希值
+            registers: HyperLogLog 寄存器
+            item_count: 构建时实际的元素数
+            recursive: 是否包含子目录
+            key: 草图元素类型（name 或 name_size）
+            signature: 构建时文件夹的修改时间签名
+            created_at: 构建时间
+        """
+        self.minhash = minhash
+        self.registers = registers
+        self.item_count = item_count
+        self.recursive = recursive
+        self.key = key
+        self.signature = signature
+        self.created_at = created_at
+
+    @classmethod
+    def build(cls, items: Iterable[str], recursive: bool = False, key: str = KEY_NAME,
+              signature: int = -1) -> 'FolderSketch':
+        """从名称（或名称+大小）构建草图"""
+        registers = bytearray(1 << HLL_P)
+        shift = 64 - HLL_P
+        heap: List[int] = []   # 保存最小 k 个哈希值的大顶堆（取负数）
+        seen_in_heap = set()
+        count = 0
+
+        for item in items:
+            count += 1
+            h = _hash64(item)
+
+            # HyperLogLog: 高 p 位选择寄存器，其余位的前导零个数 + 1 作为观测值
+            index = h >> shift
+            rest = (h << HLL_P) & _MASK64
+            rank = (64 - HLL_P + 1) if rest == 0 else (64 - rest.bit_length() + 1)
+            if rank > registers[index]:
+                registers[index] = rank
+
+            # bottom-k MinHash
+            if len(heap) < MINHASH_K:
+                if h not in seen_in_heap:
+                    heapq.heappush(heap, -h)
+                    seen_in_heap.add(h)
+            elif h < -heap[0] and h not in seen_in_heap:
+                removed = -heapq.heapreplace(heap, -h)
+                seen_in_heap.discard(removed)
+                seen_in_heap.add(h)
+
+        return cls(sorted(-value for value in heap), registers, count, recursive, key, signature, time.time())
+
+    def distinct_estimate(self) -> float:
+        """HyperLogLog 估计的不重复元素数"""
+        return _hll_estimate(self.registers)
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(_MAGIC, _VERSION, int(self.recursive), _KEY_CODES[self.key], HLL_P,
+                              len(self.minhash), self.signature, self.created_at, self.item_count)
+        return header + struct.pack(f'<{len(self.minhash)}Q', *self.minhash) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'FolderSketch':
+        magic, version, recursive, key_code, p, k, signature, created_at, item_count = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION or p != HLL_P:
+            raise ValueError("草图文件格式不兼容")
+        offset = _HEADER.size
+        minhash = list(struct.unpack_from(f'<{k}Q', data, offset))
+        offset += 8 * k
+        registers = bytearray(data[offset:offset + (1 << p)])
+        key = next(name for name, code in _KEY_CODES.items() if code == key_code)
+        return cls(minhash, registers, item_count, bool(recursive), key, signature, created_at)
+
+
+def _hll_estimate(registers: bytearray) -> float:
+    """HyperLogLog 基数估计（含小基数的线性计数修正）"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / sum(2.0 ** -r for r in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * m and zeros:
+        return m * math.log(m / zeros)
+    return estimate
+
+
+def jaccard_estimate(a: FolderSketch, b: FolderSketch) -> float:
+    """
+    用 bottom-k MinHash 估算两个文件夹名称集合的 Jaccard 相似度
+
+    取两个草图并集中最小的 k 个哈希值，统计其中同时出现在两个草图里的比例。
+    """
+    if not a.minhash and not b.minhash:
+        return 1.0
+    set_a, set_b = set(a.minhash), set(b.minhash)
+    union_k = heapq.nsmallest(MINHASH_K, set_a | set_b)
+    if not union_k:
+        return 0.0
+    shared = sum(1 for h in union_k if h in set_a and h in set_b)
+    return shared / len(union_k)
+
+
+def union_estimate(a: FolderSketch, b: FolderSketch) -> float:
+    """合并 HyperLogLog 寄存器估算并集大小"""
+    return _hll_estimate(bytearray(max(x, y) for x, y in zip(a.registers, b.registers)))
+
+
+def error_bounds() -> Dict[str, float]:
+    """当前参数下的估计误差（一个标准差）"""
+    return {
+        'jaccard_abs': 0.5 / math.sqrt(MINHASH_K),
+        'distinct_rel': 1.04 / math.sqrt(1 << HLL_P),
+    }
+
+
+def sketch_path(folder: str, beside: bool = False) -> str:
+    """
+    草图文件路径
+
+    Args:
+        folder: 文件夹或压缩包路径
+        beside: 为 True 时返回文件夹（或压缩包）旁边的路径，否则返回缓存目录中的路径
+    """
+    if not beside:
+        digest = hashlib.sha1(os.path.normcase(os.path.abspath(folder)).encode('utf-8')).hexdigest()
+        return os.path.join(os.path.dirname(CACHE_DIR), 'sketches', digest + SKETCH_SUFFIX)
+    archive_path, inner = split_archive_path(folder)
+    base = archive_path or folder.rstrip('\\/')
+    if inner:
+        base += '!' + inner.replace('/', '_')
+    return base + SKETCH_SUFFIX
+
+
+def save_sketch(folder: str, sketch: FolderSketch, beside: bool = False) -> str:
+    """
+    保存草图，返回保存路径（失败时返回空字符串）
+
+    默认写入缓存目录，不改变文件夹上级目录的修改时间；beside 为 True 时写在文件夹旁边，不可写时（例如磁盘根目录）改用缓存目录
+    """
+    data = sketch.to_bytes()
+    paths = (sketch_path(folder, True), sketch_path(folder)) if beside else (sketch_path(folder),)
+    for path in paths:
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'wb') as fp:
+                fp.write(data)
+            return path
+        except OSError as e:
+            logging.warning(f"保存草图失败 {path}: {str(e)}")
+    return ""
+
+
+def load_sketch(folder: str, recursive: bool, key: str = KEY_NAME) -> Optional[FolderSketch]:
+    """
+    读取已保存、选项一致且文件夹未变化的草图，不存在或已过期时返回 None
+
+    过期判断使用 result_cache.folder_signature，只反映顶层目录（或压缩包文件）的变化；
+    递归草图中深层子目录的变化无法察觉，因此显示结果时会同时给出草图的建立时间。
+    先查找缓存目录，再查找文件夹旁边（以前保存或用 --beside 保存的草图）。
+    """
+    signature = folder_signature(folder)
+    for path in (sketch_path(folder), sketch_path(folder, True)):
+        try:
+            with open(path, 'rb') as fp:
+                sketch = FolderSketch.from_bytes(fp.read())
+        except (OSError, ValueError, struct.error, StopIteration):
+            continue
+        if sketch.recursive == recursive and sketch.key == key:
+            if signature == -1 or sketch.signature != signature:
+                return None
+            return sketch
+    return None
+
+
+def format_age(created_at: float) -> str:
+    """把草图建立时间格式化为 "N 分钟前" 一类的文字"""
+    seconds = max(0.0, time.time() - created_at)
+    for unit, size in (("天", 86400), ("小时", 3600), ("分钟", 60)):
+        if seconds >= size:
+            return f"{seconds / size:.0f} {unit}前"
+    return "刚刚"
+
+
+def build_folder_sketch(folder: str, recursive: bool = False, key: str = KEY_NAME) -> FolderSketch:
+    """扫描文件夹并构建草图"""
+    signature = folder_signature(folder)
+    if key == KEY_NAME_SIZE:
+        metadata = collect_folder_metadata(folder, recursive)
+        items: Iterable[str] = (f"{name}\0{size}" for name, size in zip(metadata.names, metadata.sizes))
+    else:
+        items = list_folder_names(folder, recursive)
+    return FolderSketch.build(items, recursive, key, signature)
+
+
+def _sketch_task(args: Tuple[str, bool, str, bool, bool]) -> Tuple[str, Optional[FolderSketch], bool, Optional[str]]:
+    """工作进程: 读取或构建一个文件夹的草图，返回 (文件夹, 草图, 是否复用, 错误信息)"""
+    folder, recursive, key, rebuild, beside = args
+    try:
+        if not rebuild:
+            sketch = load_sketch(folder, recursive, key)
+            if sketch is not None:
+                return folder, sketch, True, None
+        if not is_comparable_path(folder):
+            raise FileNotFoundError(f"文件夹不存在或不是文件夹/压缩包: {folder}")
+        sketch = build_folder_sketch(folder, recursive, key)
+        save_sketch(folder, sketch, beside)
+        return folder, sketch, False, None
+    except Exception as e:
+        return folder, None, False, str(e)
+
+
+def sketch_folders(folders: List[str], recursive: bool = False, key: str = KEY_NAME,
+                   rebuild: bool = False, workers: Optional[int] = None, beside: bool = False
+                   ) -> Tuple[Dict[str, FolderSketch], Dict[str, bool], Dict[str, str]]:
+    """
+    并发获取多个文件夹的草图，已保存的草图直接复用；新建的草图保存在缓存目录中，beside 为 True 时保存在文件夹旁边
+
+    Returns:
+        Tuple: (文件夹到草图的映射, 文件夹是否复用了已保存草图, 文件夹到错误信息的映射)
+    """
+    sketches: Dict[str, FolderSketch] = {}
+    reused: Dict[str, bool] = {}
+    errors: Dict[str, str] = {}
+    tasks = [(folder, recursive, key, rebuild, beside) for folder in folders]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for folder, sketch, was_reused, error in executor.map(_sketch_task, tasks):
+            if sketch is None:
+                errors[folder] = error or "未知错误"
+            else:
+                sketches[folder] = sketch
+                reused[folder] = was_reused
+    return sketches, reused, errors
+
+
+def similarity_matrix(folders: List[str], sketches: Dict[str, FolderSketch]
+                      ) -> Tuple[List[List[float]], List[float]]:
+    """
+    计算两两之间的 Jaccard 估计值和每个文件夹的不重复名称数估计
+
+    Returns:
+        Tuple[List[List[float]], List[float]]: (N×N Jaccard 矩阵, 不重复数估计)
+    """
+    matrix = [[1.0 if i == j else 0.0 for j in range(len(folders))] for i in range(len(folders))]
+    for i in range(len(folders)):
+        for j in range(i + 1, len(folders)):
+            value = jaccard_estimate(sketches[folders[i]], sketches[folders[j]])
+            matrix[i][j] = matrix[j][i] = value
+    distinct = [sketches[folder].distinct_estimate() for folder in folders]
+    return matrix, distinct
+
+
+def format_matrix(folders: List[str], matrix: List[List[float]], distinct: List[float],
+                  sketches: Optional[Dict[str, FolderSketch]] = None) -> str:
+    """生成文本格式的相似度矩阵，提供草图时同时显示每个草图的建立时间"""
+    bounds = error_bounds()
+    lines = [f"Jaccard 估计误差约 ±{bounds['jaccard_abs']:.3f}，不重复数估计误差约 ±{bounds['distinct_rel']:.1%}（一个标准差）", ""]
+    for i, folder in enumerate(folders):
+        age = f"，草图建于{format_age(sketches[folder].created_at)}" if sketches and folder in sketches else ""
+        lines.append(f"#{i+1} 文件夹{i+1}: {folder}  (约 {distinct[i]:,.0f} 个名称{age})")
+    lines.append("")
+    lines.append("     " + "".join(f"{'#' + str(j + 1):>8}" for j in range(len(folders))))
+    for i, row in enumerate(matrix):
+        lines.append(f"{'#' + str(i + 1):<5}" + "".join(f"{value:>8.3f}" for value in row))
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="快速估算多个文件夹之间的相似度")
+    parser.add_argument('folders', nargs='+', help="要比较的文件夹或压缩包")
+    parser.add_argument('-r', '--recursive', action='store_true', help="包含子目录")
+    parser.add_argument('--rebuild', action='store_true', help="忽略已保存的草图重新扫描")
+    parser.add_argument('--key', choices=list(_KEY_CODES), default=KEY_NAME, help="草图元素: 名称或名称+大小")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="工作进程数")
+    parser.add_argument('--beside', action='store_true',
+                        help="把草图保存在文件夹旁边（默认保存在缓存目录中，不改变上级目录）")
+    args = parser.parse_args(argv)
+
+    sketches, reused, errors = sketch_folders(args.folders, args.recursive, args.key, args.rebuild, args.workers,
+                                              args.beside)
+    for folder, error in errors.items():
+        print(f"无法处理 {folder}: {error}")
+    folders = [folder for folder in args.folders if folder in sketches]
+    if len(folders) < 2:
+        print("至少需要两个可用的文件夹")
+        return 1
+
+    print(f"复用已保存草图 {sum(reused.values())} 个，重新扫描 {len(folders) - sum(reused.values())} 个")
+    matrix, distinct = similarity_matrix(folders, sketches)
+    print(format_matrix(folders, matrix, distinct, sketches))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,11 +4,28 @@
 """
 
 import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import traceback
 from typing import List, Dict, Tuple, Any, Optional
-from core import sanitize_path, compare_multiple_folders
+from core import (sanitize_path, is_comparable_path, find_content_differences,
+                  build_presence_matrix, PresenceModel, describe_pattern, find_metadata_differences,
+                  iter_compare, CancelToken, FolderStarted, FolderFinished, FolderIncomplete, ScanError,
+                  NameObserved, GroupFinalized, GroupPending, CompareFinished)
+from archive import is_archive_path
+from result_cache import (load_cached_comparison, save_comparison, revalidate_comparison, folder_signatures,
+                          presence_to_folder_files, save_last_session, load_last_session)
+from scanner import ScanCache, ScanBudget, LINK_LEAF, LINK_FOLLOW, LINK_SKIP
+from watcher import FolderWatcher
+from history import open_history_store
+from sketch import sketch_folders, similarity_matrix, format_matrix
+from overlap import compute_overlap, iter_cell_names
+from duplicates import find_duplicates, format_report, format_bytes
+from rollup import PresenceRollup
+from index_daemon import daemon_available, compare_with_index, DEFAULT_REQUEST_TIMEOUT
+from delta import compute_delta, format_delta
 from interaction import setup_context_menus
 
 # 定义现代化的颜色主题
@@ -91,8 +108,46 @@ def create_main_window() -> Optional[tk.Tk]:
     current_path = tk.StringVar()
     interaction_manager = None  # 用于存储交互管理器的引用
 
+    # 后台重新验证缓存结果使用的队列和代数（文件夹列表变化后旧的验证结果会被丢弃）
+    revalidation_queue: "queue.Queue" = queue.Queue()
+    revalidation_generation = [0]
+
+    # 递归比较选项，以及在多次刷新之间保留的目录状态缓存
+    recursive_var = tk.BooleanVar(value=False)
+    scan_cache = ScanCache()
+
+    # 递归比较时符号链接的处理方式（显示文字到策略的映射）
+    link_policy_labels = {"不进入": LINK_LEAF, "跟随一次": LINK_FOLLOW, "忽略": LINK_SKIP}
+    link_policy_var = tk.StringVar(value="不进入")
+
+    # 元数据比较选项和修改时间容差（秒）
+    metadata_var = tk.BooleanVar(value=False)
+    mtime_tolerance_var = tk.StringVar(value="2")
+
+    # 扫描预算（秒，留空不限制）以及预算用尽时的续扫状态
+    budget_var = tk.StringVar(value="")
+    budget_state: Dict[str, Any] = {'resume': None, 'pending': []}
+
+    # 后台进行中的比较的取消标记，以及比较期间是否又收到了比较请求
+    compare_state: Dict[str, Any] = {'cancel': None, 'rerun': False}
+
+    # 比较历史选项、数据库连接以及历史列表中显示的记录
+    history_var = tk.BooleanVar(value=False)
+    history_state: Dict[str, Any] = {'store': None, 'runs': []}
+
+    # 当前显示结果的可增量更新模型及其对应的组件，用于只更新受影响的行和分组
+    result_view: Dict[str, Any] = {}
+
+    # 文件夹监视选项、当前监视器以及监视线程发来的变化队列
+    watch_var = tk.BooleanVar(value=False)
+    watch_state: Dict[str, Any] = {'watcher': None, 'generation': 0}
+    watch_queue: "queue.Queue" = queue.Queue()
+
     def exit_program() -> None:
         """退出程序"""
+        stop_watcher()
+        if history_state['store'] is not None:
+            history_state['store'].close()
         try:
             window.quit()
             window.destroy()
@@ -130,6 +185,27 @@ def create_main_window() -> Optional[tk.Tk]:
             print(f"添加文件夹失败: {traceback.format_exc()}")
             messagebox.showerror("错误", error_msg)
 
+    def add_archive_dialog() -> None:
+        """通过文件对话框添加压缩包"""
+        try:
+            new_archive = filedialog.askopenfilename(
+                title="选择要添加的压缩包",
+                filetypes=[("压缩包", "*.zip *.tar *.tar.gz *.tgz *.tar.xz *.txz"), ("所有文件", "*.*")]
+            )
+            if not new_archive or new_archive in folders:
+                return
+            if not is_archive_path(new_archive):
+                messagebox.showerror("错误", f"不支持的压缩包格式: {new_archive}")
+                return
+
+            folders.append(new_archive)
+            update_folder_list()
+            compare_and_update()
+        except Exception as e:
+            error_msg = f"添加压缩包失败: {str(e)}"
+            print(f"添加压缩包失败: {traceback.format_exc()}")
+            messagebox.showerror("错误", error_msg)
+
     def add_folder_text() -> None:
         """通过文本输入添加文件夹"""
         try:
@@ -139,13 +215,14 @@ def create_main_window() -> Optional[tk.Tk]:
 
             path = sanitize_path(path)
 
-            if not os.path.exists(path):
-                messagebox.showwarning("警告", f"路径不存在: {path}")
-                return
+            if not is_archive_path(path):
+                if not os.path.exists(path):
+                    messagebox.showwarning("警告", f"路径不存在: {path}")
+                    return
 
-            if not os.path.isdir(path):
-                messagebox.showwarning("警告", f"路径不是文件夹: {path}")
-                return
+                if not os.path.isdir(path):
+                    messagebox.showwarning("警告", f"路径不是文件夹或受支持的压缩包: {path}")
+                    return
 
             if path in folders:
                 messagebox.showwarning("警告", "文件夹已存在于列表中")
@@ -210,12 +287,20 @@ def create_main_window() -> Optional[tk.Tk]:
             print(f"更新文件夹列表失败: {traceback.format_exc()}")
             # 不向用户显示此错误，因为这可能会影响用户体验
 
-    def compare_and_update():
-        """执行比较并更新结果显示"""
+    def compare_and_update(resume=None):
+        """
+        执行比较并更新结果显示，resume 为上次预算用尽时的续扫状态（可选）
+        扫描在后台线程中进行（见 start_compare）；上一次比较尚未结束时先取消它，结束后按最新的文件夹列表和选项重新比较
+        """
         try:
+            if compare_state['cancel'] is not None:
+                compare_state['cancel'].cancel()
+                compare_state['rerun'] = True
+                return
+
             valid_folders = []
             for folder in folders:
-                if folder and os.path.exists(folder) and os.path.isdir(folder):
+                if is_comparable_path(folder):
                     valid_folders.append(folder)
                 else:
                     print(f"Invalid folder removed: {folder}")
@@ -225,22 +310,44 @@ def create_main_window() -> Optional[tk.Tk]:
                 folders.extend(valid_folders)
                 update_folder_list()
 
+            save_last_session(valid_folders)
+            revalidation_generation[0] += 1
+
+            recursive = recursive_var.get()
+            metadata_mode = metadata_var.get()
+            if resume is not None and not resume.matches(valid_folders, recursive, metadata_mode, get_link_policy()):
+                resume = None
+            budget_state['resume'] = None
+            budget_state['pending'] = []
+            resume_btn.config(state='disabled')
+
             if len(valid_folders) >= 2:
+                # 有缓存时立即显示缓存结果并在后台重新验证（递归结果通过缓存的目录状态验证）；元数据模式总是重新扫描
+                cached = None
+                if not (metadata_mode or resume is not None):
+                    cached = load_cached_comparison(valid_folders, recursive, get_link_policy())
+                if cached is not None:
+                    common_files, pattern_files = build_presence_matrix(cached.folder_files, valid_folders)
+                    show_comparison(common_files, pattern_files, valid_folders, stale=True)
+                    start_revalidation(cached, revalidation_generation[0])
+                    restart_watcher(valid_folders)
+                    return
+
                 clear_results()
                 loading_label = tk.Label(results_frame, text="正在比较文件夹，请稍候...", 
                                        font=('Arial', 12, 'bold'), fg=COLORS['primary'], bg=COLORS['background'])
                 loading_label.pack(pady=50)
 
-                try:
-                    window.update_idletasks()
-                    window.update()
-                except:
-                    pass
-
-                common_files, pattern_files, folder_list = compare_multiple_folders(valid_folders)
-                update_results(common_files, pattern_files, folder_list)
+                # 比较期间不再按监视事件更新旧的结果，完成后重新开始监视
+                stop_watcher()
+                if recursive or metadata_mode:
+                    scan_cache.reset_report()
+                start_compare(valid_folders, loading_label, recursive, metadata_mode, resume)
             else:
+                stop_watcher()
                 clear_results()
+                result_view.clear()
+                results_frame.config(text="比较结果", fg=COLORS['primary'])
                 if len(valid_folders) == 0:
                     hint_text = "请添加有效的文件夹进行比较"
                 elif len(valid_folders) == 1:
@@ -252,13 +359,1029 @@ def create_main_window() -> Optional[tk.Tk]:
                                     font=('Arial', 12), fg=COLORS['secondary'], bg=COLORS['background'])
                 hint_label.pack(pady=50)
         except Exception as e:
-            clear_results()
-            error_msg = f"比较失败: {str(e)}"
-            error_label = tk.Label(results_frame, text=error_msg, 
-                                 font=('Arial', 12), fg=COLORS['danger'], bg=COLORS['background'])
-            error_label.pack(pady=50)
-            print(f"Error in compare_and_update: {traceback.format_exc()}")
-            messagebox.showerror("错误", error_msg)
+            show_compare_error(e)
+
+    def show_compare_error(error):
+        """在结果区域和对话框中显示比较失败"""
+        clear_results()
+        error_msg = f"比较失败: {str(error)}"
+        error_label = tk.Label(results_frame, text=error_msg, 
+                             font=('Arial', 12), fg=COLORS['danger'], bg=COLORS['background'])
+        error_label.pack(pady=50)
+        details = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+        print(f"Error in compare_and_update: {details}")
+        messagebox.showerror("错误", error_msg)
+
+    def compare_via_index(valid_folders, recursive, link_policy, budget=None):
+        """
+        索引服务正在运行时通过服务比较（在后台比较线程中调用）
+        服务不可用、出错或超时（设置了扫描预算时不超过预算时间）时返回 None，由调用方在本进程中扫描
+        """
+        if not daemon_available():
+            return None
+        timeout = DEFAULT_REQUEST_TIMEOUT
+        if budget is not None and budget.seconds is not None:
+            timeout = min(timeout, budget.seconds)
+        indexed = compare_with_index(valid_folders, recursive, link_policy, timeout=timeout, fallback=False)
+        if indexed is None:
+            return None
+        common_files, pattern_files, folder_list, _ = indexed
+        return common_files, pattern_files, folder_list
+
+    def start_compare(valid_folders, loading_label, recursive, metadata_mode, resume=None):
+        """
+        在后台线程中通过比较事件流（或索引服务）执行比较，主线程轮询队列更新加载提示，可以取消
+        界面设置在主线程中读取后传给后台线程，后台线程不访问任何组件；完成后由 finish_compare 显示结果
+        """
+        cancel = CancelToken()
+        compare_state['cancel'] = cancel
+        cancel_btn = tk.Button(results_frame, text="取消比较", command=cancel.cancel,
+                               bg=COLORS['secondary'], fg='white', relief='flat', bd=0, padx=10, pady=5,
+                               font=('Arial', 9, 'bold'), cursor='hand2')
+        cancel_btn.pack()
+
+        link_policy = get_link_policy()
+        budget = get_scan_budget()
+        # 元数据模式和续扫需要本进程中的扫描结果，不使用索引服务
+        use_index = not metadata_mode and resume is None
+        compare_queue: "queue.Queue" = queue.Queue()
+
+        def worker():
+            try:
+                # 扫描前获取签名，扫描期间发生的修改会在下次验证时被发现
+                signatures = None if metadata_mode else folder_signatures(valid_folders)
+                indexed = None
+                if use_index:
+                    compare_queue.put(('progress', "正在通过索引服务比较..."))
+                    indexed = compare_via_index(valid_folders, recursive, link_policy, budget)
+                if indexed is not None and cancel.cancelled:
+                    compare_queue.put(('done', ([], {}, None, None, None, [], True, signatures, None)))
+                    return
+                if indexed is not None:
+                    common_files, pattern_files, folder_list = indexed
+                    compare_queue.put(('done', (common_files, pattern_files, folder_list, None, None, [],
+                                                True, signatures, archive_differences(common_files, folder_list))))
+                    return
+
+                common_files, pattern_files, folder_list = [], {}, None
+                metadata = {} if metadata_mode else None
+                partial_resume, pending = None, []
+                names_seen = 0
+                for event in iter_compare(valid_folders, recursive, scan_cache, metadata_mode, cancel,
+                                          link_policy=link_policy, budget=budget, resume=resume):
+                    if isinstance(event, NameObserved):
+                        # 名称事件很多，每 5000 个报告一次进度
+                        names_seen += 1
+                        if names_seen % 5000 == 0:
+                            compare_queue.put(('progress', f"正在分析文件分布: 已处理 {names_seen} 个名称..."))
+                    elif isinstance(event, FolderStarted):
+                        compare_queue.put(('progress',
+                                           f"正在读取 文件夹{event.index + 1}/{len(valid_folders)}: {event.folder}"))
+                    elif isinstance(event, (FolderFinished, FolderIncomplete)):
+                        if metadata is not None:
+                            metadata[event.folder] = event.metadata
+                    elif isinstance(event, ScanError):
+                        print(event.message)
+                    elif isinstance(event, GroupFinalized):
+                        if event.common:
+                            common_files = event.files
+                        else:
+                            pattern_files[event.pattern] = event.files
+                    elif isinstance(event, GroupPending):
+                        pending = event.files
+                    elif isinstance(event, CompareFinished):
+                        if not event.cancelled:
+                            folder_list = event.folders
+                        partial_resume = event.resume
+                content_diff_files = None
+                if folder_list is not None and partial_resume is None:
+                    content_diff_files = archive_differences(common_files, folder_list)
+                compare_queue.put(('done', (common_files, pattern_files, folder_list, metadata, partial_resume,
+                                            pending, False, signatures, content_diff_files)))
+            except Exception as e:
+                compare_queue.put(('error', e))
+
+        def poll():
+            while True:
+                try:
+                    kind, value = compare_queue.get_nowait()
+                except queue.Empty:
+                    window.after(100, poll)
+                    return
+                if kind == 'progress':
+                    if loading_label.winfo_exists():
+                        loading_label.config(text=value)
+                    continue
+
+                compare_state['cancel'] = None
+                if cancel_btn.winfo_exists():
+                    cancel_btn.destroy()
+                if compare_state['rerun']:
+                    # 比较期间文件夹列表或选项发生了变化，丢弃这次的结果重新比较
+                    compare_state['rerun'] = False
+                    compare_and_update()
+                elif kind == 'error':
+                    show_compare_error(value)
+                else:
+                    try:
+                        finish_compare(loading_label, recursive, metadata_mode, *value)
+                    except Exception as e:
+                        show_compare_error(e)
+                return
+
+        threading.Thread(target=worker, daemon=True).start()
+        window.after(100, poll)
+
+    def finish_compare(loading_label, recursive, metadata_mode, common_files, pattern_files, folder_list, metadata,
+                       partial_resume, pending, indexed, signatures, content_diff_files):
+        """在主线程中显示后台比较的结果；预算用尽时显示部分结果，否则记录历史、保存缓存并开始监视"""
+        if folder_list is None:
+            if loading_label.winfo_exists():
+                loading_label.config(text="比较已取消", fg=COLORS['secondary'])
+            return
+
+        budget_state['resume'] = partial_resume
+        budget_state['pending'] = pending
+        if partial_resume is not None:
+            # 不完整的结果不保存到缓存
+            show_partial_comparison(common_files, pattern_files, folder_list, metadata)
+            return
+
+        if recursive or metadata_mode:
+            metadata_diff = None
+            if metadata is not None:
+                metadata_diff = find_metadata_differences(metadata, folder_list, get_mtime_tolerance())
+                report = f"元数据不同的同名文件: {len({n for names in metadata_diff.values() for n in names})} 个"
+            elif indexed:
+                report = "已通过索引服务比较"
+            else:
+                report = scan_cache.report.summary()
+
+            show_comparison(common_files, pattern_files, folder_list, metadata_diff=metadata_diff,
+                            metadata=metadata, content_diff_files=content_diff_files)
+            record_history(common_files, pattern_files, folder_list)
+            if not metadata_mode:
+                # 递归结果连同目录状态一起缓存，下次打开时先显示再按目录状态重新验证
+                save_comparison(folder_list, presence_to_folder_files(common_files, pattern_files, folder_list),
+                                signatures, True, get_link_policy(), scan_cache.dirs)
+            scan_report_label.config(text=report)
+            restart_watcher(folder_list)
+            return
+
+        show_comparison(common_files, pattern_files, folder_list, content_diff_files=content_diff_files)
+        record_history(common_files, pattern_files, folder_list)
+        save_comparison(folder_list, presence_to_folder_files(common_files, pattern_files, folder_list),
+                        signatures)
+        restart_watcher(folder_list)
+
+    def get_scan_budget() -> Optional[ScanBudget]:
+        """读取扫描预算设置，留空或无效时不限制"""
+        try:
+            seconds = float(budget_var.get())
+        except ValueError:
+            return None
+        return ScanBudget(seconds=seconds) if seconds > 0 else None
+
+    def show_partial_comparison(common_files, pattern_files, folder_list, metadata=None):
+        """
+        显示预算用尽时的部分结果，标记未完成的文件夹和子目录，不记录历史也不启动监视
+        所在目录尚未扫描的名称单独列为"尚未确定"，不显示为只在部分文件夹中存在
+        """
+        resume = budget_state['resume']
+        metadata_diff = None
+        if metadata is not None:
+            metadata_diff = find_metadata_differences(metadata, folder_list, get_mtime_tolerance())
+        update_results(common_files, pattern_files, folder_list, None, metadata_diff, metadata,
+                       pending_files=budget_state['pending'])
+        results_frame.config(text="比较结果（扫描预算用尽，结果不完整）", fg=COLORS['warning'])
+
+        parts = []
+        for folder, pending in resume.incomplete().items():
+            label = f"文件夹{folder_list.index(folder) + 1}" if folder in folder_list else folder
+            if pending == ['.']:
+                parts.append(f"{label}（未开始）")
+            else:
+                shown = ", ".join(pending[:3])
+                more = f" 等 {len(pending)} 个子目录" if len(pending) > 3 else ""
+                parts.append(f"{label}（未扫描: {shown}{more}）")
+        scan_report_label.config(text=f"预算用尽（{resume.reason}），未完成: " + "；".join(parts))
+        resume_btn.config(state='normal')
+        stop_watcher()
+        refresh_history_list()
+
+    def continue_scan():
+        """从预算用尽处继续扫描"""
+        if budget_state['resume'] is not None:
+            compare_and_update(budget_state['resume'])
+
+    def get_link_policy() -> str:
+        """读取符号链接处理方式设置"""
+        return link_policy_labels.get(link_policy_var.get(), LINK_LEAF)
+
+    def get_mtime_tolerance() -> float:
+        """读取修改时间容差设置，无效时使用 2 秒"""
+        try:
+            return max(0.0, float(mtime_tolerance_var.get()))
+        except ValueError:
+            return 2.0
+
+    def archive_differences(common_files, folder_list):
+        """包含压缩包时，利用压缩包目录中的大小/CRC 信息检查共有文件的内容差异（会读取压缩包目录，在后台线程中调用）"""
+        if any(is_archive_path(folder) for folder in folder_list):
+            return find_content_differences(common_files, folder_list)
+        return None
+
+    def show_comparison(common_files, pattern_files, folder_list, stale=False, metadata_diff=None, metadata=None,
+                        content_diff_files=None):
+        """
+        显示比较结果，stale 为 True 时标记为缓存结果；metadata 用于在折叠的目录上显示字节数
+        content_diff_files 为后台线程中算好的内容差异；缓存结果不检查内容差异，由重新验证的后台线程计算后再显示
+        监视更新也通过这里重绘，因此不写入历史记录，由完成比较的调用方调用 record_history
+        """
+        if content_diff_files is None and not stale:
+            content_diff_files = archive_differences(common_files, folder_list)
+
+        update_results(common_files, pattern_files, folder_list, content_diff_files, metadata_diff, metadata)
+
+        if stale:
+            results_frame.config(text="比较结果（缓存结果，正在后台重新验证...）", fg=COLORS['warning'])
+        else:
+            results_frame.config(text="比较结果", fg=COLORS['primary'])
+        refresh_history_list()
+
+    def get_history_store():
+        """按需打开历史数据库，未启用历史记录时返回 None"""
+        if not history_var.get():
+            return None
+        if history_state['store'] is None:
+            history_state['store'] = open_history_store()
+        return history_state['store']
+
+    def record_history(common_files, pattern_files, folder_list):
+        """把最新的比较结果写入历史数据库并刷新历史列表（只在明确的比较、刷新或重新验证完成后调用）"""
+        store = get_history_store()
+        if store is None or len(folder_list) < 2:
+            return
+        try:
+            store.record_run(folder_list, common_files, pattern_files, recursive_var.get())
+        except Exception as e:
+            print(f"记录比较历史失败: {str(e)}")
+        refresh_history_list()
+
+    def refresh_history_list():
+        """刷新当前文件夹组的历史记录列表"""
+        history_listbox.delete(0, tk.END)
+        history_state['runs'] = []
+        store = get_history_store()
+        model = result_view.get('model')
+        if store is None or model is None:
+            return
+        try:
+            history_state['runs'] = store.list_runs(model.folders, recursive_var.get())
+        except Exception as e:
+            print(f"读取比较历史失败: {str(e)}")
+            return
+        for run in history_state['runs']:
+            history_listbox.insert(tk.END, run.label())
+
+    def delete_history_runs():
+        """删除所选的历史记录"""
+        store = get_history_store()
+        runs = history_state['runs']
+        selected = history_listbox.curselection()
+        if store is None or not selected:
+            messagebox.showwarning("警告", "请在比较历史中选择要删除的记录")
+            return
+        if not messagebox.askyesno("确认", f"确定要删除选中的 {len(selected)} 条比较历史吗？"):
+            return
+        try:
+            for index in selected:
+                store.delete_run(runs[index].id)
+        except Exception as e:
+            print(f"删除比较历史失败: {str(e)}")
+            messagebox.showerror("错误", f"删除比较历史失败: {str(e)}")
+        refresh_history_list()
+
+    def show_history_delta():
+        """显示所选两条记录（只选一条时与最新记录）之间的变化"""
+        store = get_history_store()
+        runs = history_state['runs']
+        selected = history_listbox.curselection()
+        model = result_view.get('model')
+        if store is None or model is None or not selected:
+            messagebox.showwarning("警告", "请在比较历史中选择一条或两条记录")
+            return
+        if len(selected) > 2:
+            messagebox.showwarning("警告", "最多只能选择两条记录进行对比")
+            return
+
+        # 列表中最新的记录在前
+        if len(selected) == 2:
+            new_run, old_run = runs[selected[0]], runs[selected[1]]
+        else:
+            new_run, old_run = runs[0], runs[selected[0]]
+        if new_run.id == old_run.id:
+            messagebox.showinfo("提示", "所选记录就是最新记录，请再选择一条较早的记录")
+            return
+
+        try:
+            counts = store.delta_counts(old_run.id, new_run.id)
+            delta_window = tk.Toplevel(window)
+            delta_window.title(f"比较历史变化: {old_run.label()} → {new_run.label()}")
+            delta_window.geometry("800x600")
+            delta_window.configure(bg=COLORS['background'])
+
+            summary = "，".join(f"{kind} {count} 个" for kind, count in counts.items())
+            tk.Label(delta_window, text=summary, font=('Arial', 10, 'bold'),
+                     bg=COLORS['background'], fg=COLORS['dark']).pack(anchor='w', padx=10, pady=5)
+
+            delta_text = tk.Text(delta_window, wrap=tk.NONE, font=('Consolas', 9), bg='white',
+                                 fg=COLORS['dark'], relief='flat', bd=0)
+            delta_scrollbar = tk.Scrollbar(delta_window, orient="vertical", command=delta_text.yview)
+            delta_text.config(yscrollcommand=delta_scrollbar.set)
+            delta_scrollbar.pack(side='right', fill='y')
+            delta_text.pack(fill='both', expand=True, padx=(10, 0), pady=(0, 10))
+
+            # 每种变化最多显示 5000 条，其余只计数
+            shown: Dict[str, int] = {}
+            for kind, name, old_pattern, new_pattern in store.iter_delta(old_run.id, new_run.id, model.folders):
+                if shown.get(kind, 0) == 0:
+                    delta_text.insert(tk.END, f"\n[{kind}] ({counts[kind]} 个)\n")
+                shown[kind] = shown.get(kind, 0) + 1
+                if shown[kind] > 5000:
+                    continue
+                old_desc = describe_pattern(old_pattern) if old_pattern else "所有文件夹共有或不存在"
+                new_desc = describe_pattern(new_pattern) if new_pattern else "所有文件夹共有或不存在"
+                delta_text.insert(tk.END, f"{name}    {old_desc} → {new_desc}\n")
+            if not shown:
+                delta_text.insert(tk.END, "两次比较之间没有变化")
+            delta_text.config(state='disabled')
+        except Exception as e:
+            print(f"计算比较历史变化失败: {traceback.format_exc()}")
+            messagebox.showerror("错误", f"计算比较历史变化失败: {str(e)}")
+
+    def estimate_similarity(rebuild=False):
+        """在后台读取或构建各文件夹的草图，并显示相似度估计矩阵；rebuild 为 True 时忽略已保存的草图"""
+        valid_folders = [folder for folder in folders if is_comparable_path(folder)]
+        if len(valid_folders) < 2:
+            messagebox.showwarning("警告", "请至少添加两个文件夹")
+            return
+
+        sketch_btn.config(state='disabled', text="正在估算相似度...")
+        sketch_queue: "queue.Queue" = queue.Queue()
+        recursive = recursive_var.get()
+
+        def worker():
+            try:
+                sketch_queue.put((sketch_folders(valid_folders, recursive, rebuild=rebuild), None))
+            except Exception as e:
+                sketch_queue.put((None, e))
+
+        def poll():
+            try:
+                result, error = sketch_queue.get_nowait()
+            except queue.Empty:
+                window.after(100, poll)
+                return
+
+            sketch_btn.config(state='normal', text="相似度预估")
+            if error is not None:
+                messagebox.showerror("错误", f"相似度预估失败: {str(error)}")
+                return
+
+            sketches, reused, errors = result
+            sketched = [folder for folder in valid_folders if folder in sketches]
+            if len(sketched) < 2:
+                messagebox.showerror("错误", "可用的文件夹不足两个:\n" + "\n".join(errors.values()))
+                return
+
+            matrix, distinct = similarity_matrix(sketched, sketches)
+            text = f"复用已保存草图 {sum(reused.values())} 个，重新扫描 {len(sketched) - sum(reused.values())} 个\n"
+            text += "\n".join(f"无法处理 {folder}: {error}" for folder, error in errors.items())
+            text += "\n" + format_matrix(sketched, matrix, distinct, sketches)
+
+            sketch_window = tk.Toplevel(window)
+            sketch_window.title("文件夹相似度预估")
+            sketch_window.geometry("800x500")
+
+            def rebuild_sketches():
+                sketch_window.destroy()
+                estimate_similarity(rebuild=True)
+
+            tk.Button(sketch_window, text="重新扫描", command=rebuild_sketches, bg=COLORS['primary'], fg='white',
+                      relief='flat', bd=0, padx=10, pady=5, font=('Arial', 9, 'bold'),
+                      cursor='hand2').pack(anchor='e', padx=10, pady=(10, 0))
+            sketch_text = tk.Text(sketch_window, wrap=tk.NONE, font=('Consolas', 10), bg='white',
+                                  fg=COLORS['dark'], relief='flat', bd=0)
+            sketch_text.pack(fill='both', expand=True, padx=10, pady=10)
+            sketch_text.insert(tk.END, text)
+            sketch_text.config(state='disabled')
+
+        threading.Thread(target=worker, daemon=True).start()
+        window.after(100, poll)
+
+    def find_duplicate_files():
+        """在后台查找各文件夹内部和之间的重复文件，并显示重复组和可回收空间"""
+        valid_folders = [folder for folder in folders if is_comparable_path(folder)]
+        if not valid_folders:
+            messagebox.showwarning("警告", "请至少添加一个文件夹")
+            return
+
+        duplicate_btn.config(state='disabled', text="正在查找重复文件...")
+        duplicate_queue: "queue.Queue" = queue.Queue()
+        recursive = recursive_var.get()
+
+        def progress(stage, done, total):
+            duplicate_queue.put(('progress', f"正在查找重复文件: {stage} {done}/{total}"))
+
+        def worker():
+            try:
+                duplicate_queue.put(('done', find_duplicates(valid_folders, recursive, progress=progress)))
+            except Exception as e:
+                duplicate_queue.put(('error', e))
+
+        def poll():
+            while True:
+                try:
+                    kind, value = duplicate_queue.get_nowait()
+                except queue.Empty:
+                    window.after(100, poll)
+                    return
+                if kind == 'progress':
+                    duplicate_btn.config(text=value)
+                    continue
+                break
+
+            duplicate_btn.config(state='normal', text="查找重复文件")
+            if kind == 'error':
+                messagebox.showerror("错误", f"查找重复文件失败: {str(value)}")
+                return
+
+            duplicate_window = tk.Toplevel(window)
+            duplicate_window.title("重复文件")
+            duplicate_window.geometry("900x600")
+            duplicate_text = tk.Text(duplicate_window, wrap=tk.NONE, font=('Consolas', 9), bg='white',
+                                     fg=COLORS['dark'], relief='flat', bd=0)
+            duplicate_scrollbar = tk.Scrollbar(duplicate_window, orient="vertical", command=duplicate_text.yview)
+            duplicate_text.config(yscrollcommand=duplicate_scrollbar.set)
+            duplicate_scrollbar.pack(side='right', fill='y')
+            duplicate_text.pack(fill='both', expand=True, padx=(10, 0), pady=10)
+            duplicate_text.insert(tk.END, format_report(value))
+            duplicate_text.config(state='disabled')
+
+        threading.Thread(target=worker, daemon=True).start()
+        window.after(100, poll)
+
+    def show_block_delta(name, folder_list):
+        """在后台计算同名文件各副本相对于第一个副本的块级差异，并在新窗口中显示；关闭窗口或点击取消时停止计算"""
+        paths = [os.path.join(folder, name) for folder in folder_list
+                 if not is_archive_path(folder) and os.path.isfile(os.path.join(folder, name))]
+        if len(paths) < 2:
+            messagebox.showinfo("提示", "块级差异需要至少两个文件夹中的普通文件副本（不支持压缩包成员）")
+            return
+
+        delta_window = tk.Toplevel(window)
+        delta_window.title(f"块级差异 - {name}")
+        delta_window.geometry("800x500")
+        cancel = CancelToken()
+
+        def close_delta_window():
+            cancel.cancel()
+            delta_window.destroy()
+
+        delta_window.protocol("WM_DELETE_WINDOW", close_delta_window)
+        cancel_btn = tk.Button(delta_window, text="取消计算", command=cancel.cancel,
+                               bg=COLORS['secondary'], fg='white', relief='flat', bd=0, padx=10, pady=5,
+                               font=('Arial', 9, 'bold'), cursor='hand2')
+        cancel_btn.pack(side='bottom', pady=(0, 10))
+        delta_text = tk.Text(delta_window, wrap=tk.NONE, font=('Consolas', 9), bg='white',
+                             fg=COLORS['dark'], relief='flat', bd=0)
+        delta_text.pack(fill='both', expand=True, padx=10, pady=10)
+        delta_text.insert(tk.END, "正在计算块级差异...\n")
+        delta_text.config(state='disabled')
+        delta_queue: "queue.Queue" = queue.Queue()
+
+        def worker():
+            for target in paths[1:]:
+                try:
+                    report = compute_delta(paths[0], target, cancel=cancel)
+                    if report is None:
+                        delta_queue.put(('report', "计算已取消"))
+                        break
+                    delta_queue.put(('report', format_delta(report)))
+                except Exception as e:
+                    delta_queue.put(('report', f"计算块级差异失败 {target}: {str(e)}"))
+            delta_queue.put(('done', None))
+
+        def poll():
+            if not delta_window.winfo_exists():
+                return
+            while True:
+                try:
+                    kind, value = delta_queue.get_nowait()
+                except queue.Empty:
+                    window.after(100, poll)
+                    return
+                delta_text.config(state='normal')
+                if kind == 'done':
+                    delta_text.delete('1.0', '2.0')
+                else:
+                    delta_text.insert(tk.END, "\n" + value + "\n")
+                delta_text.config(state='disabled')
+                if kind == 'done':
+                    cancel_btn.destroy()
+                    return
+
+        threading.Thread(target=worker, daemon=True).start()
+        window.after(100, poll)
+
+    def on_delta_double_click(event, folder_list):
+        """双击内容或元数据不同的同名文件时显示块级差异"""
+        listbox = event.widget
+        index = listbox.nearest(event.y)
+        if index >= 0:
+            show_block_delta(listbox.get(index), folder_list)
+
+    def toggle_history():
+        """启用或关闭比较历史记录"""
+        if history_var.get():
+            model = result_view.get('model')
+            if model is not None:
+                record_history(model.common_files, model.pattern_files, model.folders)
+        elif history_state['store'] is not None:
+            history_state['store'].close()
+            history_state['store'] = None
+        refresh_history_list()
+
+    def start_revalidation(cached, generation):
+        """在后台线程中重新验证缓存结果并检查压缩包内容差异，递归结果使用单独的目录状态缓存，不与比较线程共享"""
+        def worker():
+            try:
+                revalidation_cache = ScanCache()
+                folder_files, signatures, changed = revalidate_comparison(cached, revalidation_cache)
+                common_files, pattern_files = build_presence_matrix(folder_files, cached.folders)
+                content_diff_files = archive_differences(common_files, cached.folders)
+                result = (folder_files, signatures, changed, common_files, pattern_files, content_diff_files,
+                          revalidation_cache)
+                revalidation_queue.put((generation, cached, result, None))
+            except Exception as e:
+                revalidation_queue.put((generation, cached, None, e))
+
+        threading.Thread(target=worker, daemon=True).start()
+        window.after(100, poll_revalidation)
+
+    def poll_revalidation():
+        """轮询后台验证结果并在主线程中更新显示"""
+        try:
+            generation, cached, result, error = revalidation_queue.get_nowait()
+        except queue.Empty:
+            window.after(100, poll_revalidation)
+            return
+
+        # 文件夹列表已经变化，丢弃过期的验证结果
+        if generation != revalidation_generation[0]:
+            return
+
+        if error is not None:
+            print(f"重新验证缓存结果失败: {error}")
+            results_frame.config(text="比较结果（缓存结果，重新验证失败）", fg=COLORS['danger'])
+            return
+
+        folder_files, signatures, changed, common_files, pattern_files, content_diff_files, revalidation_cache = result
+        if changed or content_diff_files:
+            show_comparison(common_files, pattern_files, cached.folders, content_diff_files=content_diff_files)
+        else:
+            results_frame.config(text="比较结果", fg=COLORS['primary'])
+        if cached.recursive:
+            scan_cache.dirs.update(revalidation_cache.dirs)
+        record_history(common_files, pattern_files, cached.folders)
+        save_comparison(cached.folders, folder_files, signatures, cached.recursive, cached.link_policy,
+                        revalidation_cache.dirs)
+
+    def stop_watcher():
+        """停止当前的文件夹监视"""
+        watcher = watch_state['watcher']
+        if watcher is not None:
+            watcher.stop()
+            watch_state['watcher'] = None
+        # 丢弃旧监视器尚未处理的变化
+        watch_state['generation'] += 1
+
+    def restart_watcher(folder_list):
+        """按当前文件夹列表和选项重新开始监视"""
+        stop_watcher()
+        if not watch_var.get() or len(folder_list) < 2:
+            return
+
+        generation = watch_state['generation']
+        watcher = FolderWatcher(
+            folder_list,
+            lambda folder, names: watch_queue.put((generation, folder, names)),
+            recursive=recursive_var.get(),
+            link_policy=get_link_policy()
+        )
+        try:
+            watcher.start()
+        except Exception as e:
+            print(f"启动文件夹监视失败: {traceback.format_exc()}")
+            messagebox.showerror("错误", f"启动文件夹监视失败: {str(e)}")
+            return
+        watch_state['watcher'] = watcher
+        scan_report_label.config(text=f"正在监视文件夹变化（{watcher.mode}）")
+
+    def poll_watch_changes():
+        """在主线程中合并处理监视线程发来的变化"""
+        latest: Dict[str, Any] = {}
+        try:
+            while True:
+                generation, folder, names = watch_queue.get_nowait()
+                if generation == watch_state['generation']:
+                    latest[folder] = names
+        except queue.Empty:
+            pass
+
+        model = result_view.get('model')
+        if latest and model is not None and metadata_var.get():
+            # 元数据差异需要重新收集文件信息，直接重新比较
+            compare_and_update()
+        elif latest and model is not None:
+            try:
+                events = []
+                for folder, names in latest.items():
+                    events.extend(model.update_folder(folder, names))
+                if events:
+                    apply_row_events(model, events)
+            except Exception:
+                print(f"增量更新结果失败: {traceback.format_exc()}")
+                show_comparison(model.common_files, model.pattern_files, model.folders)
+
+        try:
+            window.after(200, poll_watch_changes)
+        except tk.TclError:
+            pass
+
+    def pattern_group_title(pattern, count):
+        """生成文件分布分组的标题"""
+        return f"{describe_pattern(pattern)} ({count} 个)"
+
+    def apply_row_events(model, events):
+        """
+        把模型的行变化应用到已显示的组件上，只修改受影响的行和分组标题
+        目录折叠视图中的行与名称不再一一对应，更新折叠统计后只重绘受影响的分组
+        无法就地更新时（例如需要新建共有文件区域）退回到重新显示全部结果
+        """
+        groups = result_view.get('groups')
+        rollup = result_view.get('rollup')
+        needs_rebuild = groups is None or any(is_archive_path(folder) for folder in model.folders)
+        if not needs_rebuild and rollup is not None:
+            if result_view.get('scrollable_frame') is None and \
+                    any(pattern != model.all_true_pattern for _, pattern, _, _ in events):
+                needs_rebuild = True
+            else:
+                for pattern in rollup.update(events):
+                    if not redraw_rollup_group(model, pattern):
+                        needs_rebuild = True
+                        break
+                else:
+                    if result_view.get('overlap_canvas') is not None:
+                        draw_overlap_heatmap(model.groups, model.folders)
+                    return
+        if not needs_rebuild:
+            for action, pattern, _, _ in events:
+                if pattern == model.all_true_pattern:
+                    if result_view.get('common_list') is None:
+                        needs_rebuild = True
+                elif result_view.get('scrollable_frame') is None:
+                    needs_rebuild = True
+        if needs_rebuild:
+            show_comparison(model.common_files, model.pattern_files, model.folders)
+            return
+
+        counts = result_view['counts']
+        touched = set()
+        for action, pattern, position, name in events:
+            touched.add(pattern)
+            count = counts.get(pattern, 0)
+
+            if pattern == model.all_true_pattern:
+                common_list = result_view['common_list']
+                if action == "remove":
+                    common_list.delete(position)
+                    counts[pattern] = count - 1
+                else:
+                    common_list.insert(position, name)
+                    counts[pattern] = count + 1
+                continue
+
+            if pattern not in groups:
+                groups[pattern] = create_pattern_group(
+                    result_view['scrollable_frame'], pattern, [], result_view['next_pattern_row'])
+                result_view['next_pattern_row'] += 1
+            files_text = groups[pattern][1]
+
+            # 文本框中每个名称占一行，行之间用换行分隔（最后一行没有换行）
+            if action == "remove":
+                if count == 1:
+                    files_text.delete('1.0', tk.END)
+                elif position < count - 1:
+                    files_text.delete(f"{position + 1}.0", f"{position + 2}.0")
+                else:
+                    files_text.delete(f"{position}.end", f"{position + 1}.end")
+                counts[pattern] = count - 1
+            else:
+                if count == 0:
+                    files_text.insert('1.0', name)
+                elif position < count:
+                    files_text.insert(f"{position + 1}.0", name + '\n')
+                else:
+                    files_text.insert('end-1c', '\n' + name)
+                counts[pattern] = count + 1
+
+        # 更新受影响分组的标题，删除已经为空的分组
+        for pattern in touched:
+            count = counts.get(pattern, 0)
+            if pattern == model.all_true_pattern:
+                if count == 0:
+                    result_view['common_frame'].destroy()
+                    result_view['common_list'] = None
+                else:
+                    result_view['common_frame'].config(text=f"所有文件夹共有的文件 ({count} 个)")
+                continue
+
+            pattern_frame, files_text = groups[pattern]
+            if count == 0:
+                pattern_frame.destroy()
+                del groups[pattern]
+                counts.pop(pattern, None)
+            else:
+                pattern_frame.config(text=pattern_group_title(pattern, count))
+                ensure_text_scrollbar(files_text, count)
+
+        if result_view.get('overlap_canvas') is not None:
+            draw_overlap_heatmap(model.groups, model.folders)
+
+    def draw_overlap_heatmap(groups, folder_list):
+        """计算精确的两两重叠矩阵并绘制热力图，颜色深浅表示 Jaccard 相似度"""
+        canvas = result_view['overlap_canvas']
+        report = compute_overlap(groups, folder_list)
+        result_view['overlap'] = (report, groups)
+
+        count = len(folder_list)
+        cell = max(24, min(64, 480 // max(count, 1)))
+        result_view['overlap_cell'] = cell
+        margin = 30
+        canvas.delete('all')
+        canvas.config(width=margin + cell * count + 2, height=margin + cell * count + 2)
+
+        for i in range(count):
+            canvas.create_text(margin + i * cell + cell // 2, margin // 2, text=f"#{i+1}",
+                               font=('Arial', 8, 'bold'), fill=COLORS['dark'])
+            canvas.create_text(margin // 2, margin + i * cell + cell // 2, text=f"#{i+1}",
+                               font=('Arial', 8, 'bold'), fill=COLORS['dark'])
+            for j in range(count):
+                similarity = report.jaccard(i, j)
+                # 从白色渐变到主色调
+                red = int(255 + (0x4a - 255) * similarity)
+                green = int(255 + (0x90 - 255) * similarity)
+                blue = int(255 + (0xe2 - 255) * similarity)
+                x0, y0 = margin + j * cell, margin + i * cell
+                canvas.create_rectangle(x0, y0, x0 + cell, y0 + cell, fill=f"#{red:02x}{green:02x}{blue:02x}",
+                                        outline=COLORS['border'])
+                if cell >= 40:
+                    label = str(report.counts[i]) if i == j else f"{similarity:.2f}"
+                    canvas.create_text(x0 + cell // 2, y0 + cell // 2, text=label, font=('Arial', 8),
+                                       fill='white' if similarity > 0.6 else COLORS['dark'])
+
+    def on_overlap_click(event):
+        """点击热力图单元格时显示对应的文件列表"""
+        overlap = result_view.get('overlap')
+        if overlap is None:
+            return
+        report, groups = overlap
+        cell = result_view['overlap_cell']
+        canvas = result_view['overlap_canvas']
+        i = int((canvas.canvasy(event.y) - 30) // cell)
+        j = int((canvas.canvasx(event.x) - 30) // cell)
+        if not (0 <= i < len(report.folders) and 0 <= j < len(report.folders)):
+            return
+        show_overlap_cell(report, groups, i, j)
+
+    def show_overlap_cell(report, groups, i, j):
+        """显示两个文件夹之间的共有文件和各自独有的文件"""
+        cell_window = tk.Toplevel(window)
+        cell_window.title(f"文件夹重叠: #{i+1} 与 #{j+1}")
+        cell_window.geometry("800x600")
+        cell_window.configure(bg=COLORS['background'])
+
+        summary = (f"#{i+1}: {report.folders[i]}\n#{j+1}: {report.folders[j]}\n"
+                   f"共有 {report.shared[i][j]} 个，仅 #{i+1} 有 {report.unique(i, j)} 个，"
+                   f"仅 #{j+1} 有 {report.unique(j, i)} 个，Jaccard 相似度 {report.jaccard(i, j):.4f}")
+        tk.Label(cell_window, text=summary, font=('Arial', 10, 'bold'), justify='left',
+                 bg=COLORS['background'], fg=COLORS['dark']).pack(anchor='w', padx=10, pady=5)
+
+        cell_text = tk.Text(cell_window, wrap=tk.NONE, font=('Consolas', 9), bg='white',
+                            fg=COLORS['dark'], relief='flat', bd=0)
+        cell_scrollbar = tk.Scrollbar(cell_window, orient="vertical", command=cell_text.yview)
+        cell_text.config(yscrollcommand=cell_scrollbar.set)
+        cell_scrollbar.pack(side='right', fill='y')
+        cell_text.pack(fill='both', expand=True, padx=(10, 0), pady=(0, 10))
+
+        sections = [("shared", f"共有 ({report.shared[i][j]} 个)")]
+        if i != j:
+            sections += [("only_i", f"仅 #{i+1} 有 ({report.unique(i, j)} 个)"),
+                         ("only_j", f"仅 #{j+1} 有 ({report.unique(j, i)} 个)")]
+        # 每一类最多显示 5000 条，其余只计数
+        for kind, title in sections:
+            cell_text.insert(tk.END, f"[{title}]\n")
+            for shown, name in enumerate(iter_cell_names(groups, i, j, kind)):
+                if shown >= 5000:
+                    cell_text.insert(tk.END, "...\n")
+                    break
+                cell_text.insert(tk.END, name + '\n')
+            cell_text.insert(tk.END, '\n')
+        cell_text.config(state='disabled')
+
+    def rollup_line(entry, pattern, depth=0):
+        """生成目录折叠视图中一行的文字，返回 (文字, 是否可展开)"""
+        summary = result_view['rollup'].summary(entry, pattern)
+        text = "    " * depth + entry
+        if summary is None:
+            return text, False
+        detail = f"{summary.files} 个文件"
+        if summary.bytes is not None:
+            detail += f"，{format_bytes(summary.bytes)}"
+        return f"{text.rstrip('/')}/  [{detail}，双击展开]", True
+
+    def insert_rollup_lines(files_text, position, pattern, entries, depth, leading_newline):
+        """在文本框中插入折叠视图的行，可展开的行带有独立的标签，标签对应的目录和层级记录在 rollup_tags 中"""
+        rollup_tags = result_view.setdefault('rollup_tags', {})
+        for i, entry in enumerate(entries):
+            text, expandable = rollup_line(entry, pattern, depth)
+            tags = ()
+            if expandable:
+                # 名称中可能含有空格和点，不能直接用作标签名；展开时会删除标签，因此用递增的序号命名
+                result_view['rollup_serial'] = result_view.get('rollup_serial', 0) + 1
+                tag = f"rollup_{result_view['rollup_serial']}"
+                rollup_tags[tag] = (entry, depth)
+                tags = ("rollup", tag)
+            files_text.insert(position, '\n' if leading_newline or i else '', (), text, tags)
+
+    def expand_rollup_text(event, files_text, pattern):
+        """双击折叠的目录时在其下方列出直接子项"""
+        index = files_text.index(f"@{event.x},{event.y}")
+        for tag in files_text.tag_names(index):
+            if tag not in result_view.get('rollup_tags', {}):
+                continue
+            entry, depth = result_view['rollup_tags'].pop(tag)
+            first, last = files_text.tag_ranges(tag)[:2]
+            files_text.tag_remove("rollup", first, last)
+            files_text.tag_delete(tag)
+            position = files_text.index(last)
+            # 逐行插入到同一位置会颠倒顺序，因此倒序插入
+            for child in reversed(result_view['rollup'].children(entry)):
+                insert_rollup_lines(files_text, position, pattern, [child], depth + 1, True)
+            ensure_text_scrollbar(files_text, int(files_text.index('end-1c').split('.')[0]))
+            return "break"
+
+    def fill_common_rollup(common_list, pattern, files):
+        """在共有文件列表中填入折叠后的条目，条目对应的目录和层级记录在 common_entries 中"""
+        result_view['common_entries'] = []
+        for entry in result_view['rollup'].top_entries(pattern, files):
+            text, expandable = rollup_line(entry, pattern)
+            common_list.insert(tk.END, text)
+            result_view['common_entries'].append((entry, 0, expandable))
+            if expandable:
+                common_list.itemconfig(tk.END, fg=COLORS['primary'])
+
+    def rollup_group_title(pattern, files, entries):
+        """生成折叠视图中分组的标题，折叠后行数减少时注明"""
+        title = pattern_group_title(pattern, len(files))
+        return f"{title}，折叠为 {len(entries)} 行" if len(entries) < len(files) else title
+
+    def redraw_rollup_group(model, pattern):
+        """
+        监视更新后重新生成折叠视图中一个分组的条目（只重绘受影响的分组，已展开的目录会重新折叠）
+        需要新建共有文件区域时返回 False，由调用方重新显示全部结果
+        """
+        files = model.groups.get(pattern, [])
+        counts = result_view['counts']
+        if pattern == model.all_true_pattern:
+            common_list = result_view.get('common_list')
+            if common_list is None:
+                return not files
+            if not files:
+                result_view['common_frame'].destroy()
+                result_view['common_list'] = None
+                counts.pop(pattern, None)
+                return True
+            common_list.delete(0, tk.END)
+            fill_common_rollup(common_list, pattern, files)
+            result_view['common_frame'].config(text=f"所有文件夹共有的文件 ({len(files)} 个)")
+            counts[pattern] = len(files)
+            return True
+
+        groups = result_view['groups']
+        if pattern not in groups:
+            if files:
+                groups[pattern] = create_pattern_group(
+                    result_view['scrollable_frame'], pattern, files, result_view['next_pattern_row'])
+                result_view['next_pattern_row'] += 1
+                counts[pattern] = len(files)
+            return True
+        pattern_frame, files_text = groups[pattern]
+        if not files:
+            pattern_frame.destroy()
+            del groups[pattern]
+            counts.pop(pattern, None)
+            return True
+        entries = result_view['rollup'].top_entries(pattern, files)
+        files_text.delete('1.0', tk.END)
+        insert_rollup_lines(files_text, tk.END, pattern, entries, 0, False)
+        pattern_frame.config(text=rollup_group_title(pattern, files, entries))
+        ensure_text_scrollbar(files_text, len(entries))
+        counts[pattern] = len(files)
+        return True
+
+    def expand_rollup_list(event, common_list, pattern):
+        """双击共有文件列表中折叠的目录时在其下方列出直接子项"""
+        entries = result_view['common_entries']
+        position = common_list.nearest(event.y)
+        if position < 0 or position >= len(entries):
+            return
+        entry, depth, expandable = entries[position]
+        if not expandable:
+            return
+        entries[position] = (entry, depth, False)
+        common_list.itemconfig(position, fg=COLORS['dark'])
+        for offset, child in enumerate(result_view['rollup'].children(entry), 1):
+            text, child_expandable = rollup_line(child, pattern, depth + 1)
+            common_list.insert(position + offset, text)
+            entries.insert(position + offset, (child, depth + 1, child_expandable))
+            if child_expandable:
+                common_list.itemconfig(position + offset, fg=COLORS['primary'])
+        return "break"
+
+    def ensure_text_scrollbar(files_text, count):
+        """文件数超过文本框高度时为其添加滚动条"""
+        if count > int(files_text.cget('height')) and not files_text.cget('yscrollcommand'):
+            text_scrollbar = tk.Scrollbar(files_text.master, orient="vertical", command=files_text.yview)
+            text_scrollbar.grid(row=0, column=1, sticky='ns')
+            files_text.config(yscrollcommand=text_scrollbar.set)
+
+    def create_pattern_group(scrollable_frame, pattern, files, row):
+        """创建一个文件分布分组，返回 (分组框架, 文本框)"""
+        # 创建带样式的标签框架
+        pattern_frame = tk.LabelFrame(
+            scrollable_frame,
+            text=pattern_group_title(pattern, len(files)),
+            font=('Arial', 9, 'bold'),
+            fg=COLORS['dark'],
+            bg=COLORS['background'],
+            padx=10,
+            pady=5
+        )
+        pattern_frame.grid(row=row, column=0, sticky='ew', padx=5, pady=5)
+        pattern_frame.grid_columnconfigure(0, weight=1)
+        pattern_frame.grid_rowconfigure(1, weight=1)
+        scrollable_frame.grid_columnconfigure(0, weight=1)
+
+        # 创建文件列表
+        text_frame = tk.Frame(pattern_frame, bg=COLORS['background'])
+        text_frame.grid(row=1, column=0, sticky='ew', padx=5, pady=5)
+        text_frame.grid_rowconfigure(0, weight=1)
+        text_frame.grid_columnconfigure(0, weight=1)
+
+        rollup = result_view.get('rollup')
+        entries = rollup.top_entries(pattern, files) if rollup is not None else files
+        if rollup is not None:
+            pattern_frame.config(text=rollup_group_title(pattern, files, entries))
+
+        text_height = min(8, max(3, len(entries)))
+        # 创建带样式的文本框
+        files_text = tk.Text(
+            text_frame,
+            height=text_height,
+            wrap=tk.WORD,
+            font=('Consolas', 9),
+            bg='white',
+            fg=COLORS['dark'],
+            highlightthickness=1,
+            highlightcolor=COLORS['border'],
+            relief='flat',
+            bd=0
+        )
+        files_text.grid(row=0, column=0, sticky='ew')
+        register_result_widget(files_text, pattern)
+
+        ensure_text_scrollbar(files_text, len(entries))
+
+        if rollup is not None:
+            files_text.tag_configure("rollup", foreground=COLORS['primary'])
+            insert_rollup_lines(files_text, tk.END, pattern, entries, 0, False)
+            files_text.bind('<Double-Button-1>', lambda event: expand_rollup_text(event, files_text, pattern))
+        else:
+            files_text.insert(tk.END, '\n'.join(files))
+        return pattern_frame, files_text
 
     def clear_results():
         """清空结果显示"""
@@ -268,10 +1391,14 @@ def create_main_window() -> Optional[tk.Tk]:
         except Exception as e:
             print(f"Error clearing results: {str(e)}")
 
-    def update_results(common_files, pattern_files, folder_list):
-        """更新比较结果显示"""
+    def update_results(common_files, pattern_files, folder_list, content_diff_files=None, metadata_diff=None,
+                       metadata=None, pending_files=None):
+        """更新比较结果显示，递归比较时内容一致的子目录折叠显示；pending_files 为扫描未完成时无法确定分布的名称"""
         try:
             clear_results()
+            result_view.clear()
+            result_view['groups'] = {}
+            result_view['counts'] = {}
 
             if not isinstance(common_files, list):
                 common_files = []
@@ -280,6 +1407,13 @@ def create_main_window() -> Optional[tk.Tk]:
             if not isinstance(folder_list, list):
                 folder_list = []
 
+            # 结果模型是显示、复制、历史和监视更新共用的分组；递归比较时在其上计算可折叠的目录
+            all_true_pattern = tuple([True] * len(folder_list))
+            model = PresenceModel(folder_list, common_files, pattern_files)
+            result_view['model'] = model
+            if recursive_var.get():
+                result_view['rollup'] = PresenceRollup(model, metadata)
+
             # 创建主结果容器
             main_results_frame = tk.Frame(results_frame, bg=COLORS['background'])
             main_results_frame.grid(row=0, column=0, sticky='nsew', padx=5, pady=5)
@@ -322,6 +1456,7 @@ def create_main_window() -> Optional[tk.Tk]:
                     bd=0
                 )
                 common_list.grid(row=0, column=0, sticky='nsew', padx=5, pady=5)
+                register_result_widget(common_list, tuple([True] * len(folder_list)))
 
 
                 # 滚动条
@@ -329,8 +1464,179 @@ def create_main_window() -> Optional[tk.Tk]:
                 common_scrollbar.grid(row=0, column=1, sticky='ns', padx=(0, 5), pady=5)
                 common_list.config(yscrollcommand=common_scrollbar.set)
 
-                for item in common_files:
-                    common_list.insert(tk.END, item)
+                if result_view.get('rollup') is not None:
+                    fill_common_rollup(common_list, all_true_pattern, common_files)
+                    common_list.bind('<Double-Button-1>',
+                                     lambda event: expand_rollup_list(event, common_list, all_true_pattern))
+                else:
+                    for item in common_files:
+                        common_list.insert(tk.END, item)
+
+                result_view['common_frame'] = common_frame
+                result_view['common_list'] = common_list
+                result_view['counts'][tuple([True] * len(folder_list))] = len(common_files)
+
+                current_row += 1
+
+            # 扫描预算用尽时，所在目录在某个文件夹中尚未扫描的名称
+            if pending_files:
+                pending_frame = tk.LabelFrame(
+                    main_results_frame,
+                    text=f"尚未确定分布的文件 ({len(pending_files)} 个，所在目录尚未在所有文件夹中扫描)",
+                    font=('Arial', 10, 'bold'),
+                    fg=COLORS['warning'],
+                    bg=COLORS['background'],
+                    padx=10,
+                    pady=5
+                )
+                pending_frame.grid(row=current_row, column=0, sticky='ew', pady=(0, 10))
+                pending_frame.grid_columnconfigure(0, weight=1)
+
+                pending_list = tk.Listbox(
+                    pending_frame,
+                    selectmode=tk.EXTENDED,
+                    height=min(8, max(3, len(pending_files))),
+                    font=('Consolas', 10),
+                    bg='white',
+                    fg=COLORS['secondary'],
+                    selectbackground=COLORS['primary'],
+                    selectforeground='white',
+                    highlightthickness=1,
+                    highlightcolor=COLORS['border'],
+                    relief='flat',
+                    bd=0
+                )
+                pending_list.grid(row=0, column=0, sticky='nsew', padx=5, pady=5)
+                register_result_widget(pending_list)
+
+                pending_scrollbar = tk.Scrollbar(pending_frame, orient="vertical", command=pending_list.yview)
+                pending_scrollbar.grid(row=0, column=1, sticky='ns', padx=(0, 5), pady=5)
+                pending_list.config(yscrollcommand=pending_scrollbar.set)
+
+                for item in pending_files:
+                    pending_list.insert(tk.END, item)
+
+                current_row += 1
+
+            # 显示同名但内容不同的文件（基于大小/CRC）
+            if content_diff_files:
+                diff_frame = tk.LabelFrame(
+                    main_results_frame,
+                    text=f"同名但内容不同的文件 ({len(content_diff_files)} 个，按大小/CRC 判断)",
+                    font=('Arial', 10, 'bold'),
+                    fg=COLORS['danger'],
+                    bg=COLORS['background'],
+                    padx=10,
+                    pady=5
+                )
+                diff_frame.grid(row=current_row, column=0, sticky='ew', pady=(0, 10))
+                diff_frame.grid_columnconfigure(0, weight=1)
+
+                diff_list = tk.Listbox(
+                    diff_frame,
+                    selectmode=tk.EXTENDED,
+                    height=min(8, max(3, len(content_diff_files))),
+                    font=('Consolas', 10),
+                    bg='white',
+                    fg=COLORS['dark'],
+                    selectbackground=COLORS['primary'],
+                    selectforeground='white',
+                    highlightthickness=1,
+                    highlightcolor=COLORS['border'],
+                    relief='flat',
+                    bd=0
+                )
+                diff_list.grid(row=0, column=0, sticky='nsew', padx=5, pady=5)
+                register_result_widget(diff_list)
+
+                diff_scrollbar = tk.Scrollbar(diff_frame, orient="vertical", command=diff_list.yview)
+                diff_scrollbar.grid(row=0, column=1, sticky='ns', padx=(0, 5), pady=5)
+                diff_list.config(yscrollcommand=diff_scrollbar.set)
+
+                for item in content_diff_files:
+                    diff_list.insert(tk.END, item)
+                diff_list.bind('<Double-Button-1>', lambda event: on_delta_double_click(event, folder_list))
+
+                current_row += 1
+
+            # 显示元数据（大小/修改时间/权限）不同的同名文件
+            if metadata_diff:
+                metadata_frame = tk.LabelFrame(
+                    main_results_frame,
+                    text="元数据不同的同名文件",
+                    font=('Arial', 10, 'bold'),
+                    fg=COLORS['warning'],
+                    bg=COLORS['background'],
+                    padx=10,
+                    pady=5
+                )
+                metadata_frame.grid(row=current_row, column=0, sticky='ew', pady=(0, 10))
+                metadata_frame.grid_columnconfigure(0, weight=1)
+
+                for kind_row, (kind, names) in enumerate(metadata_diff.items()):
+                    kind_frame = tk.LabelFrame(
+                        metadata_frame,
+                        text=f"{kind} ({len(names)} 个)",
+                        font=('Arial', 9, 'bold'),
+                        fg=COLORS['dark'],
+                        bg=COLORS['background'],
+                        padx=5,
+                        pady=2
+                    )
+                    kind_frame.grid(row=kind_row, column=0, sticky='ew', pady=2)
+                    kind_frame.grid_columnconfigure(0, weight=1)
+
+                    kind_list = tk.Listbox(
+                        kind_frame,
+                        selectmode=tk.EXTENDED,
+                        height=min(6, max(2, len(names))),
+                        font=('Consolas', 10),
+                        bg='white',
+                        fg=COLORS['dark'],
+                        selectbackground=COLORS['primary'],
+                        selectforeground='white',
+                        highlightthickness=1,
+                        highlightcolor=COLORS['border'],
+                        relief='flat',
+                        bd=0
+                    )
+                    kind_list.grid(row=0, column=0, sticky='nsew', padx=5, pady=2)
+                    register_result_widget(kind_list)
+
+                    kind_scrollbar = tk.Scrollbar(kind_frame, orient="vertical", command=kind_list.yview)
+                    kind_scrollbar.grid(row=0, column=1, sticky='ns', pady=2)
+                    kind_list.config(yscrollcommand=kind_scrollbar.set)
+
+                    for item in names:
+                        kind_list.insert(tk.END, item)
+                    kind_list.bind('<Double-Button-1>', lambda event: on_delta_double_click(event, folder_list))
+
+                current_row += 1
+
+            # 三个及以上文件夹时显示两两重叠热力图
+            if len(folder_list) >= 3:
+                overlap_frame = tk.LabelFrame(
+                    main_results_frame,
+                    text="文件夹重叠矩阵（颜色表示 Jaccard 相似度，点击单元格查看文件）",
+                    font=('Arial', 10, 'bold'),
+                    fg=COLORS['primary'],
+                    bg=COLORS['background'],
+                    padx=10,
+                    pady=5
+                )
+                overlap_frame.grid(row=current_row, column=0, sticky='ew', pady=(0, 10))
+                overlap_frame.grid_columnconfigure(1, weight=1)
+
+                overlap_canvas = tk.Canvas(overlap_frame, bg=COLORS['background'], highlightthickness=0)
+                overlap_canvas.grid(row=0, column=0, sticky='nw', padx=5, pady=5)
+                overlap_canvas.bind('<Button-1>', on_overlap_click)
+
+                legend = '\n'.join(f"#{i+1}: {folder}" for i, folder in enumerate(folder_list))
+                tk.Label(overlap_frame, text=legend, font=('Consolas', 9), justify='left', anchor='nw',
+                         bg=COLORS['background'], fg=COLORS['dark']).grid(row=0, column=1, sticky='nw', padx=5, pady=5)
+
+                result_view['overlap_canvas'] = overlap_canvas
+                draw_overlap_heatmap(model.groups, folder_list)
 
                 current_row += 1
 
@@ -381,66 +1687,13 @@ def create_main_window() -> Optional[tk.Tk]:
                     if not files:
                         continue
 
-                    pattern_desc = []
-                    for i, exists in enumerate(pattern):
-                        if exists:
-                            pattern_desc.append(f"文件夹{i+1}")
-
-                    if len(pattern_desc) == 1:
-                        title = f"仅在 {pattern_desc[0]} 中存在 ({len(files)} 个)"
-                    else:
-                        title = f"存在于 {' 和 '.join(pattern_desc)} 中 ({len(files)} 个)"
-
-                    # 创建带样式的标签框架
-                    pattern_frame = tk.LabelFrame(
-                        scrollable_frame,
-                        text=title,
-                        font=('Arial', 9, 'bold'),
-                        fg=COLORS['dark'],
-                        bg=COLORS['background'],
-                        padx=10,
-                        pady=5
-                    )
-                    pattern_frame.grid(row=pattern_row, column=0, sticky='ew', padx=5, pady=5)
-                    pattern_frame.grid_columnconfigure(0, weight=1)
-                    pattern_frame.grid_rowconfigure(1, weight=1)
-                    scrollable_frame.grid_columnconfigure(0, weight=1)
-
-                    # 创建文件列表
-                    text_frame = tk.Frame(pattern_frame, bg=COLORS['background'])
-                    text_frame.grid(row=1, column=0, sticky='ew', padx=5, pady=5)
-                    text_frame.grid_rowconfigure(0, weight=1)
-                    text_frame.grid_columnconfigure(0, weight=1)
-
-                    text_height = min(8, max(3, len(files)))
-                    # 创建带样式的文本框
-                    files_text = tk.Text(
-                        text_frame,
-                        height=text_height,
-                        wrap=tk.WORD,
-                        font=('Consolas', 9),
-                        bg='white',
-                        fg=COLORS['dark'],
-                        highlightthickness=1,
-                        highlightcolor=COLORS['border'],
-                        relief='flat',
-                        bd=0
-                    )
-                    files_text.grid(row=0, column=0, sticky='ew')
-
-
-                    if len(files) > text_height:
-                        text_scrollbar = tk.Scrollbar(text_frame, orient="vertical", command=files_text.yview)
-                        text_scrollbar.grid(row=0, column=1, sticky='ns')
-                        files_text.config(yscrollcommand=text_scrollbar.set)
-
-                    for i, file in enumerate(files):
-                        if i > 0:
-                            files_text.insert(tk.END, '\n')
-                        files_text.insert(tk.END, file)
-
+                    result_view['groups'][pattern] = create_pattern_group(scrollable_frame, pattern, files, pattern_row)
+                    result_view['counts'][pattern] = len(files)
                     pattern_row += 1
 
+                result_view['scrollable_frame'] = scrollable_frame
+                result_view['next_pattern_row'] = pattern_row
+
         except Exception as e:
             clear_results()
             error_msg = f"更新结果显示失败: {str(e)}"
@@ -448,16 +1701,11 @@ def create_main_window() -> Optional[tk.Tk]:
                                  font=('Arial', 12), fg=COLORS['danger'], bg=COLORS['background'])
             error_label.pack(pady=50)
             print(f"Error in update_results: {traceback.format_exc()}")
-        
-        # 通知交互管理器重新绑定事件
-        if interaction_manager and hasattr(interaction_manager, '_bind_child_events'):
-            # 创建一个假的事件来触发重新绑定
-            class FakeEvent:
-                def __init__(self, widget):
-                    self.widget = widget
-            
-            fake_event = FakeEvent(results_frame)
-            interaction_manager._bind_child_events(fake_event)
+
+    def register_result_widget(widget, pattern=None):
+        """让结果组件使用交互管理器的共用右键菜单"""
+        if interaction_manager is not None:
+            interaction_manager.register_result_widget(widget, pattern)
 
     # 创建主界面布局
     main_frame = tk.Frame(window, bg=COLORS['background'])
@@ -466,6 +1714,7 @@ def create_main_window() -> Optional[tk.Tk]:
     main_frame.grid_rowconfigure(0, weight=1)
     main_frame.grid_columnconfigure(0, weight=0, minsize=int(window_width * 0.3))
     main_frame.grid_columnconfigure(1, weight=1)
+    main_frame.grid_columnconfigure(2, weight=0)
 
     # 左侧：文件夹管理区域
     left_frame = tk.LabelFrame(
@@ -556,10 +1805,12 @@ def create_main_window() -> Optional[tk.Tk]:
     button_frame.grid_columnconfigure(0, weight=1)
     button_frame.grid_columnconfigure(1, weight=1)
     button_frame.grid_columnconfigure(2, weight=1)
+    button_frame.grid_columnconfigure(3, weight=1)
 
     create_styled_button(button_frame, "添加路径 (Enter)", add_folder_text, 0, padx=(0, 2))
     create_styled_button(button_frame, "浏览文件夹", add_folder_dialog, 1, padx=2)
-    remove_btn = create_styled_button(button_frame, "移除选中", remove_folder, 2, padx=(2, 0))
+    create_styled_button(button_frame, "浏览压缩包", add_archive_dialog, 2, padx=2)
+    remove_btn = create_styled_button(button_frame, "移除选中", remove_folder, 3, padx=(2, 0))
     remove_btn.config(state='disabled', bg=COLORS['secondary'])
 
     # 文件夹列表
@@ -612,6 +1863,129 @@ def create_main_window() -> Optional[tk.Tk]:
     )
     status_label.grid(row=0, column=0, sticky='w', pady=(0, 5))
 
+    # 递归比较选项和增量扫描统计
+    option_frame = tk.Frame(control_frame, bg=COLORS['background'])
+    option_frame.grid(row=1, column=0, sticky='ew', pady=(0, 5))
+    option_frame.grid_columnconfigure(1, weight=1)
+
+    recursive_check = tk.Checkbutton(
+        option_frame,
+        text="递归比较子文件夹",
+        variable=recursive_var,
+        command=lambda: compare_and_update(),
+        font=('Arial', 9),
+        bg=COLORS['background'],
+        fg=COLORS['dark'],
+        activebackground=COLORS['background']
+    )
+    recursive_check.grid(row=0, column=0, sticky='w')
+
+    watch_check = tk.Checkbutton(
+        option_frame,
+        text="监视文件夹变化并自动更新",
+        variable=watch_var,
+        command=lambda: restart_watcher(list(result_view['model'].folders)) if result_view.get('model') else None,
+        font=('Arial', 9),
+        bg=COLORS['background'],
+        fg=COLORS['dark'],
+        activebackground=COLORS['background']
+    )
+    watch_check.grid(row=1, column=0, sticky='w')
+
+    metadata_option_frame = tk.Frame(option_frame, bg=COLORS['background'])
+    metadata_option_frame.grid(row=2, column=0, sticky='w')
+
+    metadata_check = tk.Checkbutton(
+        metadata_option_frame,
+        text="比较元数据（大小/修改时间/权限）  时间容差(秒):",
+        variable=metadata_var,
+        command=lambda: compare_and_update(),
+        font=('Arial', 9),
+        bg=COLORS['background'],
+        fg=COLORS['dark'],
+        activebackground=COLORS['background']
+    )
+    metadata_check.grid(row=0, column=0, sticky='w')
+
+    tolerance_spinbox = tk.Spinbox(
+        metadata_option_frame,
+        from_=0,
+        to=86400,
+        increment=1,
+        width=6,
+        textvariable=mtime_tolerance_var,
+        command=lambda: compare_and_update() if metadata_var.get() else None,
+        font=('Arial', 9)
+    )
+    tolerance_spinbox.grid(row=0, column=1, sticky='w')
+
+    link_option_frame = tk.Frame(option_frame, bg=COLORS['background'])
+    link_option_frame.grid(row=3, column=0, sticky='w')
+
+    tk.Label(
+        link_option_frame,
+        text="递归时的符号链接:",
+        font=('Arial', 9),
+        bg=COLORS['background'],
+        fg=COLORS['dark']
+    ).grid(row=0, column=0, sticky='w')
+
+    link_policy_menu = tk.OptionMenu(
+        link_option_frame,
+        link_policy_var,
+        *link_policy_labels,
+        command=lambda _: compare_and_update() if recursive_var.get() else None
+    )
+    link_policy_menu.config(font=('Arial', 9), bg=COLORS['background'], relief='flat', highlightthickness=0)
+    link_policy_menu.grid(row=0, column=1, sticky='w')
+
+    budget_option_frame = tk.Frame(option_frame, bg=COLORS['background'])
+    budget_option_frame.grid(row=4, column=0, sticky='w')
+
+    tk.Label(
+        budget_option_frame,
+        text="扫描预算(秒，留空不限):",
+        font=('Arial', 9),
+        bg=COLORS['background'],
+        fg=COLORS['dark']
+    ).grid(row=0, column=0, sticky='w')
+
+    budget_entry = tk.Entry(
+        budget_option_frame,
+        width=6,
+        textvariable=budget_var,
+        font=('Arial', 9)
+    )
+    budget_entry.grid(row=0, column=1, sticky='w')
+
+    # 预算用尽后从停止处继续扫描（每次继续重新计时）
+    resume_btn = tk.Button(
+        budget_option_frame,
+        text="继续扫描",
+        command=continue_scan,
+        state='disabled',
+        bg=COLORS['primary'],
+        fg='white',
+        activebackground=COLORS['primary'],
+        activeforeground='white',
+        relief='flat',
+        bd=0,
+        padx=8,
+        pady=2,
+        font=('Arial', 9, 'bold'),
+        cursor='hand2'
+    )
+    resume_btn.grid(row=0, column=2, sticky='w', padx=(5, 0))
+
+    scan_report_label = tk.Label(
+        option_frame,
+        text="",
+        font=('Arial', 9),
+        bg=COLORS['background'],
+        fg=COLORS['secondary']
+    )
+    scan_report_label.grid(row=0, column=1, sticky='e')
+
     # 创建退出按钮
     exit_btn = tk.Button(
         control_frame,
@@ -627,7 +2001,43 @@ def create_main_window() -> Optional[tk.Tk]:
         pady=5,
         font=('Arial', 9, 'bold')
     )
-    exit_btn.grid(row=2, column=0, sticky='ew', pady=2)
+    exit_btn.grid(row=4, column=0, sticky='ew', pady=2)
+
+    # 相似度预估按钮（基于可复用的草图，不做完整比较）
+    sketch_btn = tk.Button(
+        control_frame,
+        text="相似度预估",
+        command=lambda: estimate_similarity(),
+        bg=COLORS['primary'],
+        fg='white',
+        activebackground=COLORS['primary'],
+        activeforeground='white',
+        relief='flat',
+        bd=0,
+        padx=10,
+        pady=5,
+        font=('Arial', 9, 'bold'),
+        cursor='hand2'
+    )
+    sketch_btn.grid(row=2, column=0, sticky='ew', pady=2)
+
+    # 重复文件查找按钮（文件夹内部和文件夹之间）
+    duplicate_btn = tk.Button(
+        control_frame,
+        text="查找重复文件",
+        command=find_duplicate_files,
+        bg=COLORS['primary'],
+        fg='white',
+        activebackground=COLORS['primary'],
+        activeforeground='white',
+        relief='flat',
+        bd=0,
+        padx=10,
+        pady=5,
+        font=('Arial', 9, 'bold'),
+        cursor='hand2'
+    )
+    duplicate_btn.grid(row=3, column=0, sticky='ew', pady=2)
 
     # 右侧：结果显示区域
     results_frame = tk.LabelFrame(
@@ -643,12 +2053,103 @@ def create_main_window() -> Optional[tk.Tk]:
     results_frame.grid_rowconfigure(0, weight=1)
     results_frame.grid_columnconfigure(0, weight=1)
 
+    # 结果区域右侧：比较历史
+    history_frame = tk.LabelFrame(
+        main_frame,
+        text="比较历史",
+        font=('Arial', 11, 'bold'),
+        fg=COLORS['primary'],
+        bg=COLORS['background'],
+        padx=10,
+        pady=10
+    )
+    history_frame.grid(row=0, column=2, sticky='nsew', padx=(5, 0))
+    history_frame.grid_rowconfigure(1, weight=1)
+    history_frame.grid_columnconfigure(0, weight=1)
+
+    history_check = tk.Checkbutton(
+        history_frame,
+        text="记录比较历史",
+        variable=history_var,
+        command=toggle_history,
+        font=('Arial', 9),
+        bg=COLORS['background'],
+        fg=COLORS['dark'],
+        activebackground=COLORS['background']
+    )
+    history_check.grid(row=0, column=0, sticky='w')
+
+    history_listbox = tk.Listbox(
+        history_frame,
+        selectmode=tk.EXTENDED,
+        width=30,
+        font=('Consolas', 9),
+        bg='white',
+        fg=COLORS['dark'],
+        selectbackground=COLORS['primary'],
+        selectforeground='white',
+        highlightthickness=1,
+        highlightcolor=COLORS['border'],
+        relief='flat',
+        bd=0
+    )
+    history_listbox.grid(row=1, column=0, sticky='nsew', pady=5)
+
+    history_btn = tk.Button(
+        history_frame,
+        text="对比所选记录",
+        command=show_history_delta,
+        bg=COLORS['primary'],
+        fg='white',
+        activebackground=COLORS['primary'],
+        activeforeground='white',
+        relief='flat',
+        bd=0,
+        padx=10,
+        pady=5,
+        font=('Arial', 9, 'bold'),
+        cursor='hand2'
+    )
+    history_btn.grid(row=2, column=0, sticky='ew')
+
+    history_delete_btn = tk.Button(
+        history_frame,
+        text="删除所选记录",
+        command=delete_history_runs,
+        bg=COLORS['secondary'],
+        fg='white',
+        activebackground=COLORS['secondary'],
+        activeforeground='white',
+        relief='flat',
+        bd=0,
+        padx=10,
+        pady=5,
+        font=('Arial', 9, 'bold'),
+        cursor='hand2'
+    )
+    history_delete_btn.grid(row=3, column=0, sticky='ew', pady=(5, 0))
+
     # 结果显示区域
 
     # 初始化上下文菜单
-    interaction_manager = setup_context_menus(window, path_entry, results_frame, compare_and_update)
+    def get_scan_report() -> str:
+        """返回上次递归扫描的目录复用统计，非递归模式返回空字符串"""
+        return scan_cache.report.summary() if recursive_var.get() else ""
+
+    interaction_manager = setup_context_menus(window, path_entry, results_frame, compare_and_update,
+                                              get_scan_report, lambda: result_view.get('model'))
 
     # 初始化
     path_entry.focus()
 
+    # 开始处理文件夹监视发来的变化
+    window.after(200, poll_watch_changes)
+
+    # 恢复上次会话的文件夹列表，缓存结果会立即显示并在后台重新验证
+    restored_folders = load_last_session()
+    if restored_folders:
+        folders.extend(restored_folders)
+        update_folder_list()
+        compare_and_update()
+
     return window
@@ -0,0 +1,282 @@
+"""
+文件夹监视模块
+监视参与比较的文件夹，变化经过合并和防抖后再通知界面增量更新
+Linux 下使用 inotify，其他系统退回到基于修改时间的轮询
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+from typing import List, Dict, Set, Tuple, Callable, Optional
+
+from core import list_folder_names
+from scanner import ScanCache, LINK_LEAF
+from archive import is_archive_path
+from result_cache import folder_signature
+
+# inotify 事件掩码（只关心名称变化）
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _InotifyBackend:
+    """基于 inotify 的变化检测（仅 Linux）"""
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self._ctypes = ctypes
+        self._watches: Dict[int, Tuple] = {}
+        # 自管道: 停止时从其他线程写入一个字节唤醒 select，描述符只由监视线程关闭
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+    def add_watch(self, path: str, root: str) -> None:
+        """监视目录 path，其变化归属于比较根目录 root"""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(self._ctypes.get_errno(), f"inotify_add_watch 失败: {path}")
+        self._watches[wd] = (path, root)
+
+    def read_events(self, timeout: float, recursive: bool) -> Set[str]:
+        """等待最多 timeout 秒（被 wake 唤醒时立即返回），返回发生变化的比较根目录"""
+        ready, _, _ = select.select([self._fd, self._wake_r], [], [], timeout)
+        if self._fd not in ready:
+            return set()
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        dirty: Set[str] = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + name_len].rstrip(b'\0')
+            offset += _EVENT_HEADER.size + name_len
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，所有根目录都需要重新扫描
+                dirty.update(root for _, root in self._watches.values())
+                continue
+
+            watch = self._watches.get(wd)
+            if watch is None:
+                continue
+            path, root = watch
+            dirty.add(root)
+
+            # 递归模式下为新建的子目录补充监视
+            if recursive and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self._add_tree(os.path.join(path, os.fsdecode(name)), root)
+                except OSError as e:
+                    logging.warning(f"无法监视新目录: {str(e)}")
+
+        return dirty
+
+    def _add_tree(self, path: str, root: str) -> None:
+        self.add_watch(path, root)
+        for dirpath, dirnames, _ in os.walk(path):
+            for dirname in dirnames:
+                self.add_watch(os.path.join(dirpath, dirname), root)
+
+    def watch_folder(self, folder: str, recursive: bool) -> None:
+        if recursive:
+            self._add_tree(folder, folder)
+        else:
+            self.add_watch(folder, folder)
+
+    def wake(self) -> None:
+        """唤醒正在 read_events 中等待的线程（可以从任意线程调用）"""
+        try:
+            os.write(self._wake_w, b'\0')
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        """关闭所有描述符，只能在没有线程等待 read_events 时调用"""
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class FolderWatcher:
+    """在后台线程中监视文件夹，并把防抖后的最新名称集合交给回调函数"""
+
+    def __init__(self, folders: List[str], on_change: Callable[[str, Set[str]], None],
+                 recursive: bool = False, debounce: float = 0.5, max_delay: float = 3.0,
+                 poll_interval: float = 1.0, link_policy: str = LINK_LEAF):
+        """
+        Args:
+            folders: 要监视的文件夹或压缩包列表
+            on_change: 回调函数 (文件夹, 最新名称集合)，在监视线程中调用
+            recursive: 是否递归监视子目录
+            debounce: 最后一次变化后等待的秒数，期间的变化会被合并
+            max_delay: 持续变化时最长的通知间隔（秒），保证复制过程中也能看到进度
+            poll_interval: 轮询模式下检查修改时间的间隔（秒）
+            link_policy: 递归扫描时符号链接的处理方式（见 scanner 模块）
+        """
+        self.folders = list(folders)
+        self.on_change = on_change
+        self.recursive = recursive
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.link_policy = link_policy
+
+        # 监视线程独立使用的目录状态缓存，递归扫描时只重新读取修改过的目录
+        self.scan_cache = ScanCache()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._backend: Optional[_InotifyBackend] = None
+        self._poll_folders: List[str] = []
+        self._signatures: Dict[str, int] = {}
+        self._tree_names: Dict[str, Set[str]] = {}
+
+    @property
+    def mode(self) -> str:
+        """当前使用的检测方式"""
+        return "inotify" if self._backend is not None else "轮询"
+
+    def start(self) -> None:
+        """开始监视"""
+        try:
+            self._setup_backend()
+        except Exception:
+            if self._backend is not None:
+                self._backend.close()
+                self._backend = None
+            raise
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止监视，不等待监视线程结束；inotify 描述符由监视线程退出时关闭，避免关闭后编号被其他文件复用"""
+        self._stop_event.set()
+        if self._backend is not None:
+            self._backend.wake()
+
+    def _setup_backend(self) -> None:
+        """优先使用 inotify，不可用或监视数量超限时退回轮询"""
+        directories = [folder for folder in self.folders if not is_archive_path(folder)]
+        # 压缩包没有目录事件，始终通过修改时间轮询
+        self._poll_folders = [folder for folder in self.folders if is_archive_path(folder)]
+
+        if sys.platform.startswith('linux') and directories:
+            try:
+                backend = _InotifyBackend()
+                try:
+                    for folder in directories:
+                        backend.watch_folder(folder, self.recursive)
+                except OSError as e:
+                    backend.close()
+                    if e.errno != errno.ENOSPC:
+                        raise
+                    logging.warning("inotify 监视数量超出系统限制，改用轮询")
+                else:
+                    self._backend = backend
+                    directories = []
+            except OSError as e:
+                logging.warning(f"inotify 不可用，改用轮询: {str(e)}")
+
+        self._poll_folders.extend(directories)
+        for folder in self._poll_folders:
+            self._signatures[folder] = folder_signature(folder)
+            if self.recursive and not is_archive_path(folder):
+                self._tree_names[folder] = list_folder_names(folder, True, self.scan_cache, self.link_policy)
+
+    def _poll_changes(self) -> Set[str]:
+        """通过修改时间检查轮询的文件夹"""
+        dirty: Set[str] = set()
+        for folder in self._poll_folders:
+            if self.recursive and not is_archive_path(folder):
+                # 递归轮询只会重新读取修改时间变化的目录，其余目录只做 stat
+                names = list_folder_names(folder, True, self.scan_cache, self.link_policy)
+                if names != self._tree_names.get(folder):
+                    self._tree_names[folder] = names
+                    dirty.add(folder)
+                continue
+
+            signature = folder_signature(folder)
+            if signature != self._signatures.get(folder):
+                self._signatures[folder] = signature
+                dirty.add(folder)
+        return dirty
+
+    def _run(self) -> None:
+        try:
+            self._watch_loop()
+        finally:
+            if self._backend is not None:
+                self._backend.close()
+
+    def _watch_loop(self) -> None:
+        dirty: Set[str] = set()
+        first_change = last_change = 0.0
+        next_poll = time.monotonic() + self.poll_interval
+
+        while not self._stop_event.is_set():
+            try:
+                changes: Set[str] = set()
+                now = time.monotonic()
+                if self._backend is not None:
+                    timeout = min(self.debounce, max(0.0, next_poll - now)) if self._poll_folders else self.debounce
+                    changes |= self._backend.read_events(timeout, self.recursive)
+                else:
+                    self._stop_event.wait(min(self.debounce, max(0.0, next_poll - now)))
+
+                now = time.monotonic()
+                if self._poll_folders and now >= next_poll:
+                    changes |= self._poll_changes()
+                    next_poll = now + self.poll_interval
+
+                if changes:
+                    if not dirty:
+                        first_change = now
+                    dirty |= changes
+                    last_change = now
+
+                # 防抖: 安静 debounce 秒后或持续变化超过 max_delay 秒后统一通知
+                if dirty and (now - last_change >= self.debounce or now - first_change >= self.max_delay):
+                    for folder in sorted(dirty):
+                        self._notify(folder)
+                    dirty.clear()
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                logging.error(f"监视文件夹失败: {str(e)}")
+                self._stop_event.wait(self.poll_interval)
+
+    def _notify(self, folder: str) -> None:
+        try:
+            names = list_folder_names(folder, self.recursive, self.scan_cache, self.link_policy)
+        except OSError as e:
+            logging.warning(f"读取变化的文件夹失败 {folder}: {str(e)}")
+            names = set()
+        self.on_change(folder, names)